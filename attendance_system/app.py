@@ -5,6 +5,12 @@ from firebase_admin import credentials, firestore
 # Add after other imports
 from backend.routes.admin_routes import init_admin_routes
 from backend.routes.admin_system_routes import init_admin_system_routes
+from backend.routes.teacher_routes import init_teacher_routes
+from backend.services.face_recognition_service import init_face_recognition_service, start_face_gallery_watch
+from backend.services.face_workers import start_face_workers
+from backend.services.stats_service import start_stats_reconciler
+from backend.utils.database import DATABASE_BACKEND, init_repository
+from backend.utils.watch import start_collection_watches
 import os
 import logging
 
@@ -23,6 +29,10 @@ FRONTEND_DIR = os.path.join(BASE_DIR, 'frontend')
 logger.info(f"Base directory: {BASE_DIR}")
 logger.info(f"Frontend directory: {FRONTEND_DIR}")
 
+# Start the face worker processes before any Firestore connection is opened,
+# so the forked workers do not inherit gRPC channels
+start_face_workers()
+
 # Initialize Firebase Admin SDK
 def initialize_firebase():
     try:
@@ -45,23 +55,54 @@ firebase_initialized = initialize_firebase()
 db = None
 if firebase_initialized:
     db = firestore.client()
+else:
+    logger.error("Firebase not initialized - database operations will fail")
+
+# Users, timetable and reference data go through the configured backend;
+# with DATABASE_BACKEND=sqlite they work even without Firebase
+database_initialized = False
+try:
+    init_repository(db)
+    database_initialized = firebase_initialized or DATABASE_BACKEND == 'sqlite'
+except Exception as e:
+    logger.error(f"Error initializing {DATABASE_BACKEND} database: {e}")
+
+if database_initialized:
     try:
         from backend.routes.login_route import init_db
         init_db(db)
         logger.info("Database initialized for login routes")
     except ImportError as e:
         logger.error(f"Error importing login_route: {e}")
-else:
-    logger.error("Firebase not initialized - database operations will fail")
 
-if firebase_initialized:
     try:
         init_admin_routes(app, db)
         init_admin_system_routes(app, db)
+        init_teacher_routes(app, db)
+        init_face_recognition_service(db)
         logger.info("Admin routes registered successfully")
     except Exception as e:
         logger.error(f"Error registering admin routes: {e}")
 
+if database_initialized:
+    try:
+        start_stats_reconciler()
+    except Exception as e:
+        logger.error(f"Error starting stats reconciler: {e}")
+
+if firebase_initialized:
+    try:
+        start_face_gallery_watch()
+    except Exception as e:
+        logger.error(f"Error starting face gallery watch: {e}")
+
+if firebase_initialized and DATABASE_BACKEND == 'firestore':
+    try:
+        # One listener per collection, shared by the in-process indexes
+        start_collection_watches(db)
+    except Exception as e:
+        logger.error(f"Error starting collection watches: {e}")
+
 
 # --- Route Registration ---
 # Register API blueprints FIRST to give them priority
@@ -94,6 +135,8 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "firebase_initialized": firebase_initialized,
+        "database_backend": DATABASE_BACKEND,
+        "database_initialized": database_initialized,
         "frontend_dir": FRONTEND_DIR,
         "frontend_exists": os.path.exists(FRONTEND_DIR)
     })
@@ -1,12 +1,36 @@
 from flask import Blueprint, request, jsonify
 from firebase_admin import firestore
+import base64
+import binascii
+import json
 import logging
+import tempfile
+import zipfile
 from datetime import datetime
-import face_recognition
-import numpy as np
-import base64
-import io
-from PIL import Image
+from backend.services.face_workers import (
+    FaceDetectionError,
+    PoolBusyError,
+    encode_single_face,
+    get_face_worker_pool,
+    image_cache_key,
+)
+from backend.utils.cache import reference_cache
+from backend.utils.database import DuplicateUserKeyError, get_repository
+from backend.utils.file_handler import read_image_upload
+from backend.services.face_enrollment import enroll_faces_from_zip
+from backend.services.attendance_service import get_attendance_writer
+from backend.services.user_search import get_user_search_index
+from backend.services.stats_service import get_stats as read_stats, reconcile_stats
+from backend.services.timetable_grid import describe_clashes, find_clashes, get_timetable_grid
+from backend.services.timetable_views import get_timetable_view, rebuild_timetable_views, refresh_timetable_views
+from backend.services.timetable_generator import GENERATOR_TIME_LIMIT_SECONDS, generate_timetable
+from backend.services.timetable_import import import_timetable, read_timetable_upload
+from backend.services.face_recognition_service import (
+    delete_face_encoding,
+    face_encoding_doc,
+    update_face_matcher,
+    rebuild_face_index,
+)
 
 
 # Create blueprint
@@ -18,43 +42,70 @@ logger = logging.getLogger(__name__)
 # Global app and db reference
 app = None
 db = None
+repository = None
+
+# Longest a synchronous request waits for a face job
+FACE_JOB_TIMEOUT_SECONDS = 60
 
 def init_admin_routes(flask_app, firestore_db):
     """Initialize admin routes with app and database"""
-    global app, db
+    global app, db, repository
     app = flask_app
     db = firestore_db
+    repository = get_repository()
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
+def cached_reference_response(key, loader):
+    """JSON response for cached reference data; 304 when the client's copy is current"""
+    data, etag = reference_cache.get(key, loader)
+    response = jsonify(data)
+    response.set_etag(etag)
+    # Browsers revalidate with If-None-Match on every load instead of refetching
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def timetable_view_response(kind, key):
+    """Weekly timetable view with its ETag; 304 when the client's copy is current"""
+    view = get_timetable_view(kind, key)
+    response = jsonify(view['timetable'])
+    response.set_etag(view['etag'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def encode_cursor(position):
+    """Opaque page cursor for a (name, id) position"""
+    return base64.urlsafe_b64encode(json.dumps(list(position)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """(name, id) position of a cursor made by encode_cursor; raises ValueError if malformed"""
+    try:
+        name, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return name, user_id
+
 # --- User Management Routes ---
 @admin_bp.route('/users', methods=['GET'])
 def get_users():
-    """Get all users with pagination"""
+    """Get users a page at a time; pass the returned nextCursor to get the next page"""
     try:
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 10, type=int)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
         search = request.args.get('search', '')
+        cursor = request.args.get('cursor')
         
-        users_ref = db.collection('users')
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Apply search filter if provided
-        if search:
-            # Fixed query syntax for Firestore
-            query = users_ref.where('name', '>=', search).where('name', '<=', search + '\uf8ff')
-        else:
-            query = users_ref
-            
-        # Get total count for pagination - FIXED
-        total_users_query = query
-        total_users = sum(1 for _ in total_users_query.stream())
+        # Aggregation count instead of streaming every matching user
+        total_users = repository.count_users(name_prefix=search)
         
-        # Apply pagination - FIXED
-        users = query.order_by('name').limit(limit).offset((page - 1) * limit).stream()
+        # Keyset pagination on (name, id) so deep pages cost the same as the first
+        users, next_after = repository.list_users_page(name_prefix=search, limit=limit, after=after)
         
         users_list = []
-        for user in users:
-            user_data = user.to_dict()
-            user_data['id'] = user.id
+        for user_data in users:
             # Convert Firestore timestamps to strings
             for key, value in user_data.items():
                 if hasattr(value, 'isoformat'):
@@ -64,8 +115,8 @@ def get_users():
         return jsonify({
             'users': users_list,
             'total': total_users,
-            'page': page,
-            'limit': limit
+            'limit': limit,
+            'nextCursor': encode_cursor(next_after) if next_after else None
         }), 200
         
     except Exception as e:
@@ -74,18 +125,29 @@ def get_users():
     
 
 
+@admin_bp.route('/users/search', methods=['GET'])
+def search_users():
+    """Ranked matches on name, email, studentId and teacherId from the in-memory index"""
+    try:
+        query = request.args.get('q', '').strip()
+        role = request.args.get('role')
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        
+        users = get_user_search_index().search(query, role=role, limit=limit)
+        return jsonify({'users': users}), 200
+        
+    except Exception as e:
+        logger.error(f"Error searching users: {str(e)}")
+        return jsonify({"error": "Failed to search users"}), 500
+
 @admin_bp.route('/users/<user_id>', methods=['GET'])
 def get_user(user_id):
     """Get a specific user by ID"""
     try:
-        user_ref = db.collection('users').document(user_id)
-        user = user_ref.get()
+        user_data = repository.get_user(user_id)
         
-        if not user.exists:
+        if user_data is None:
             return jsonify({"error": "User not found"}), 404
-            
-        user_data = user.to_dict()
-        user_data['id'] = user.id
         
         return jsonify(user_data), 200
         
@@ -129,22 +191,6 @@ def create_user():
             if 'adminId' not in data or not data['adminId']:
                 return jsonify({"error": "Missing required field for admin: adminId"}), 400
         
-        # Check if user already exists (email)
-        users_ref = db.collection('users')
-        existing_email = users_ref.where('email', '==', data['email']).limit(1).get()
-        if len(existing_email) > 0:
-            return jsonify({"error": "Email already exists"}), 400
-        
-        # Check for duplicate IDs
-        if data['role'] == 'Student':
-            existing_student = users_ref.where('studentId', '==', data['studentId']).limit(1).get()
-            if len(existing_student) > 0:
-                return jsonify({"error": "Student ID already exists"}), 400
-        elif data['role'] == 'Teacher':
-            existing_teacher = users_ref.where('teacherId', '==', data['teacherId']).limit(1).get()
-            if len(existing_teacher) > 0:
-                return jsonify({"error": "Teacher ID already exists"}), 400
-        
         # Create user document
         user_data = {
             'name': data['name'].strip(),
@@ -177,15 +223,19 @@ def create_user():
         if 'phone' in data and data['phone']:
             user_data['phone'] = data['phone'].strip()
         
-        # Save to Firestore
-        new_user_ref = users_ref.document()
-        new_user_ref.set(user_data)
+        # Save to the configured database; email and ID uniqueness is
+        # enforced by the repository in the same write
+        new_user_id = repository.create_user(user_data)
+        if data['role'] == 'Teacher':
+            reference_cache.invalidate('teachers')
         
         return jsonify({
             "message": "User created successfully",
-            "userId": new_user_ref.id,
+            "userId": new_user_id,
         }), 201
         
+    except DuplicateUserKeyError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
         return jsonify({"error": "Failed to create user"}), 500
@@ -196,10 +246,9 @@ def update_user(user_id):
     try:
         data = request.get_json()
         
-        user_ref = db.collection('users').document(user_id)
-        user = user_ref.get()
+        user_data = repository.get_user(user_id)
         
-        if not user.exists:
+        if user_data is None:
             return jsonify({"error": "User not found"}), 404
         
         update_data = {'updatedAt': firestore.SERVER_TIMESTAMP}
@@ -213,17 +262,20 @@ def update_user(user_id):
             update_data['phone'] = data['phone'].strip()
         
         # Update role-specific fields
-        user_data = user.to_dict()
         if user_data.get('role') == 'Student':
             student_fields = ['branchId', 'year', 'division', 'studentId']
             for field in student_fields:
                 if field in data:
                     update_data[field] = data[field]
         
-        user_ref.update(update_data)
+        repository.update_user(user_id, update_data)
+        if user_data.get('role') == 'Teacher':
+            reference_cache.invalidate('teachers')
         
         return jsonify({"message": "User updated successfully"}), 200
         
+    except DuplicateUserKeyError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
         return jsonify({"error": "Failed to update user"}), 500
@@ -232,13 +284,14 @@ def update_user(user_id):
 def delete_user(user_id):
     """Delete a user"""
     try:
-        user_ref = db.collection('users').document(user_id)
-        user = user_ref.get()
-        
-        if not user.exists:
+        user_data = repository.get_user(user_id)
+        if user_data is None:
             return jsonify({"error": "User not found"}), 404
         
-        user_ref.delete()
+        repository.delete_user(user_id)
+        if user_data.get('role') == 'Teacher':
+            reference_cache.invalidate('teachers')
+        delete_face_encoding(db, user_id)
         
         return jsonify({"message": "User deleted successfully"}), 200
         
@@ -300,13 +353,13 @@ def create_timetable_entry():
             'updatedAt': firestore.SERVER_TIMESTAMP
         }
         
-        # Save to Firestore
-        timetable_ref = db.collection('timetable').document()
-        timetable_ref.set(timetable_data)
+        # Save to the configured database
+        timetable_id = repository.create_timetable_entry(timetable_data)
+        refresh_timetable_views([timetable_data])
         
         return jsonify({
             "message": "Timetable entry created successfully",
-            "timetableId": timetable_ref.id
+            "timetableId": timetable_id
         }), 201
         
     except Exception as e:
@@ -320,26 +373,8 @@ def get_timetable(branch_id, year, division):
         # Construct the full branch ID format that matches how it's stored
         full_branch_id = f"{branch_id}_Y{year}_{division}"
         
-        # Query the timetable collection with the correctly formatted ID
-        timetable_ref = db.collection('timetable')
-        query = timetable_ref.where('branchId', '==', full_branch_id)
-        timetable_entries = query.stream()
-        
-        timetable = {
-            'Monday': {}, 'Tuesday': {}, 'Wednesday': {}, 
-            'Thursday': {}, 'Friday': {}, 'Saturday': {}
-        }
-        
-        for entry in timetable_entries:
-            entry_data = entry.to_dict()
-            day = entry_data['day']
-            lecture_num = entry_data['lectureNumber']
-            entry_data['id'] = entry.id
-            
-            if day in timetable:
-                timetable[day][lecture_num] = entry_data
-        
-        return jsonify(timetable), 200
+        # One read of the class's precomputed week
+        return timetable_view_response('branch', full_branch_id)
         
     except Exception as e:
         logger.error(f"Error fetching timetable: {str(e)}")
@@ -350,7 +385,10 @@ def get_timetable(branch_id, year, division):
 def delete_timetable_entry(timetable_id):
     """Delete a timetable entry"""
     try:
-        db.collection('timetable').document(timetable_id).delete()
+        # The entry's class and teacher views are rebuilt after it is gone
+        entry = repository.get_timetable_entry(timetable_id)
+        if repository.delete_timetable_entry(timetable_id) and entry:
+            refresh_timetable_views([entry])
         return jsonify({"message": "Timetable entry deleted successfully"}), 200
         
     except Exception as e:
@@ -359,61 +397,18 @@ def delete_timetable_entry(timetable_id):
 
 @admin_bp.route('/timetable/bulk', methods=['POST'])
 def create_bulk_timetable():
-    """Create multiple timetable entries at once"""
+    """Import timetable entries from a CSV upload or a JSON list"""
     try:
-        data = request.get_json()
+        rows, atomic = read_timetable_upload(request)
         
-        if not data or 'entries' not in data:
+        if not rows:
             return jsonify({"error": "No entries provided"}), 400
         
-        results = {
-            'successful': 0,
-            'failed': 0,
-            'errors': []
-        }
+        # Rows are checked against the schedule and each other before any write
+        results = import_timetable(rows, atomic=atomic)
         
-        for entry in data['entries']:
-            try:
-                # Validate required fields
-                required_fields = ['branchId', 'year', 'division', 'day', 'lectureNumber', 
-                                  'courseCode', 'teacherId', 'roomNumber']
-                for field in required_fields:
-                    if field not in entry or not entry[field]:
-                        raise ValueError(f"Missing required field: {field}")
-                
-                # Check for clashes
-                clash_check = check_timetable_clash(
-                    entry['branchId'], entry['year'], entry['division'],
-                    entry['day'], entry['lectureNumber'], entry['roomNumber'],
-                    entry['teacherId'], entry['courseCode']
-                )
-                
-                if clash_check['hasClash']:
-                    raise ValueError(f"Timetable clash: {', '.join(clash_check['details'])}")
-                
-                # Create timetable entry
-                timetable_data = {
-                    'branchId': entry['branchId'],
-                    'year': int(entry['year']),
-                    'division': entry['division'],
-                    'day': entry['day'],
-                    'lectureNumber': int(entry['lectureNumber']),
-                    'courseCode': entry['courseCode'],
-                    'teacherId': entry['teacherId'],
-                    'roomNumber': entry['roomNumber'],
-                    'createdAt': firestore.SERVER_TIMESTAMP,
-                    'updatedAt': firestore.SERVER_TIMESTAMP
-                }
-                
-                db.collection('timetable').document().set(timetable_data)
-                results['successful'] += 1
-                
-            except Exception as e:
-                results['failed'] += 1
-                results['errors'].append({
-                    'entry': entry,
-                    'error': str(e)
-                })
+        if not results['committed']:
+            return jsonify(dict(results, error="Import rejected; no entries were created")), 400
         
         return jsonify(results), 201
         
@@ -421,58 +416,76 @@ def create_bulk_timetable():
         logger.error(f"Error creating bulk timetable: {str(e)}")
         return jsonify({"error": "Failed to create bulk timetable"}), 500
 
-# --- Utility Functions ---
-def check_timetable_clash(branch_id, year, division, day, lecture_number, room_number, teacher_id, course_code):
-    """Check for timetable clashes"""
+@admin_bp.route('/timetable/views/rebuild', methods=['POST'])
+def rebuild_timetable_view_documents():
+    """Rebuild every class and teacher timetable view"""
     try:
-        timetable_ref = db.collection('timetable')
-        
-        # Check room clash
-        room_clash = (
-            timetable_ref
-            .where('roomNumber', '==', room_number)
-            .where('day', '==', day)
-            .where('lectureNumber', '==', int(lecture_number))
-            .get()
-        )
+        rebuilt = rebuild_timetable_views()
+        return jsonify({"message": "Timetable views rebuilt", "views": rebuilt}), 200
         
-        # Check teacher clash
-        teacher_clash = (
-            timetable_ref
-            .where('teacherId', '==', teacher_id)
-            .where('day', '==', day)
-            .where('lectureNumber', '==', int(lecture_number))
-            .get()
+    except Exception as e:
+        logger.error(f"Error rebuilding timetable views: {str(e)}")
+        return jsonify({"error": "Failed to rebuild timetable views"}), 500
+
+@admin_bp.route('/timetable/generate', methods=['POST'])
+def generate_timetable_entries():
+    """Generate a clash-free week from per-class course loads"""
+    try:
+        data = request.get_json() or {}
+        
+        if not data.get('classes'):
+            return jsonify({"error": "No classes provided"}), 400
+        
+        rooms = data.get('rooms')
+        if not rooms:
+            room_docs, _ = reference_cache.get('rooms', lambda: repository.list_documents('rooms'))
+            rooms = sorted(room['roomNumber'] for room in room_docs if room.get('roomNumber'))
+        if not rooms:
+            return jsonify({"error": "No rooms available"}), 400
+        
+        # Existing entries stay where they are unless the caller opts out
+        fixed_masks = None
+        if data.get('keepExisting', True):
+            grid = get_timetable_grid()
+            fixed_masks = {kind: grid.masks(kind) for kind in ('room', 'teacher', 'class')}
+        
+        time_limit = min(float(data.get('timeLimit', GENERATOR_TIME_LIMIT_SECONDS)), 30)
+        entries, unscheduled = generate_timetable(
+            data['classes'], rooms, fixed_masks=fixed_masks,
+            break_lectures=data.get('breakLectures', []), time_limit=time_limit
         )
         
-        # Check course clash for same branch/year/division
-        course_clash = (
-            timetable_ref
-            .where('branchId', '==', branch_id)
-            .where('year', '==', int(year))
-            .where('division', '==', division)
-            .where('day', '==', day)
-            .where('lectureNumber', '==', int(lecture_number))
-            .get()
-        )
+        results = {
+            "entries": entries,
+            "unscheduled": unscheduled,
+            "scheduled": len(entries)
+        }
         
-        clash_details = []
-        has_clash = False
+        # Saving goes through the bulk import so every entry is re-checked
+        if data.get('commit'):
+            results['import'] = import_timetable(entries, atomic=True)
         
-        if len(room_clash) > 0:
-            has_clash = True
-            clash_details.append("Room already occupied at this time")
+        return jsonify(results), 200
         
-        if len(teacher_clash) > 0:
-            has_clash = True
-            clash_details.append("Teacher already assigned at this time")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error generating timetable: {str(e)}")
+        return jsonify({"error": "Failed to generate timetable"}), 500
+
+# --- Utility Functions ---
+def check_timetable_clash(branch_id, year, division, day, lecture_number, room_number, teacher_id, course_code):
+    """Check for timetable clashes"""
+    try:
+        # Room, teacher and same branch/year/division bit tests on the occupancy grid
+        clashes = find_clashes(
+            day, lecture_number, room_number, teacher_id, branch_id, year, division
+        )
         
-        if len(course_clash) > 0:
-            has_clash = True
-            clash_details.append("Course already scheduled for this class at this time")
+        clash_details = describe_clashes(clashes)
         
         return {
-            "hasClash": has_clash,
+            "hasClash": bool(clash_details),
             "details": clash_details
         }
         
@@ -485,16 +498,7 @@ def check_timetable_clash(branch_id, year, division, day, lecture_number, room_n
 def get_branches():
     """Get all branches"""
     try:
-        branches_ref = db.collection('branches')
-        branches = branches_ref.stream()
-        
-        branches_list = []
-        for branch in branches:
-            branch_data = branch.to_dict()
-            branch_data['id'] = branch.id
-            branches_list.append(branch_data)
-            
-        return jsonify(branches_list), 200
+        return cached_reference_response('branches', lambda: repository.list_documents('branches'))
         
     except Exception as e:
         logger.error(f"Error fetching branches: {str(e)}")
@@ -504,18 +508,8 @@ def get_branches():
 def get_teachers():
     """Get all users with the role of Teacher"""
     try:
-        # Query the 'users' collection for documents where role is 'Teacher'
-        users_ref = db.collection('users')
-        query = users_ref.where('role', '==', 'Teacher')
-        teachers = query.stream()
-        
-        teachers_list = []
-        for teacher in teachers:
-            teacher_data = teacher.to_dict()
-            teacher_data['id'] = teacher.id
-            teachers_list.append(teacher_data)
-            
-        return jsonify(teachers_list), 200
+        # Users where role is 'Teacher'
+        return cached_reference_response('teachers', lambda: repository.list_users(role='Teacher'))
         
     except Exception as e:
         logger.error(f"Error fetching teachers: {str(e)}")
@@ -526,16 +520,7 @@ def get_teachers():
 def get_courses():
     """Get all courses"""
     try:
-        courses_ref = db.collection('courses')
-        courses = courses_ref.stream()
-        
-        courses_list = []
-        for course in courses:
-            course_data = course.to_dict()
-            course_data['id'] = course.id
-            courses_list.append(course_data)
-            
-        return jsonify(courses_list), 200
+        return cached_reference_response('courses', lambda: repository.list_documents('courses'))
         
     except Exception as e:
         logger.error(f"Error fetching courses: {str(e)}")
@@ -545,96 +530,154 @@ def get_courses():
 def get_rooms():
     """Get all rooms"""
     try:
-        rooms_ref = db.collection('rooms')
-        rooms = rooms_ref.stream()
-        
-        rooms_list = []
-        for room in rooms:
-            room_data = room.to_dict()
-            room_data['id'] = room.id
-            rooms_list.append(room_data)
-            
-        return jsonify(rooms_list), 200
+        return cached_reference_response('rooms', lambda: repository.list_documents('rooms'))
         
     except Exception as e:
         logger.error(f"Error fetching rooms: {str(e)}")
         return jsonify({"error": "Failed to fetch rooms"}), 500
 
+@admin_bp.route('/reference-cache/invalidate', methods=['POST'])
+def invalidate_reference_cache():
+    """Drop cached branches, courses, rooms and teachers after out-of-band edits"""
+    reference_cache.invalidate('branches', 'courses', 'rooms', 'teachers')
+    return jsonify({"message": "Reference cache cleared", "stats": reference_cache.stats()}), 200
+
 # --- Statistics Routes ---
 @admin_bp.route('/stats', methods=['GET'])
 def get_stats():
     """Get dashboard statistics"""
     try:
-        # Get user counts - FIXED query execution
-        users_ref = db.collection('users')
-        total_users = sum(1 for _ in users_ref.stream())
-        students_count = sum(1 for _ in users_ref.where('role', '==', 'Student').stream())
-        teachers_count = sum(1 for _ in users_ref.where('role', '==', 'Teacher').stream())
-        
-        # Get other counts - FIXED query execution
-        courses_count = sum(1 for _ in db.collection('courses').stream())
-        timetable_count = sum(1 for _ in db.collection('timetable').stream())
-        
-        return jsonify({
-            'totalUsers': total_users,
-            'studentsCount': students_count,
-            'teachersCount': teachers_count,
-            'coursesCount': courses_count,
-            'timetableEntries': timetable_count
-        }), 200
+        # Maintained counters instead of counting every collection
+        return jsonify(read_stats()), 200
         
     except Exception as e:
         logger.error(f"Error fetching stats: {str(e)}")
         return jsonify({"error": "Failed to fetch statistics", "details": str(e)}), 500
 
+@admin_bp.route('/stats/reconcile', methods=['POST'])
+def reconcile_stats_route():
+    """Recount the dashboard statistics and repair the counters"""
+    try:
+        return jsonify(reconcile_stats()), 200
+        
+    except Exception as e:
+        logger.error(f"Error reconciling stats: {str(e)}")
+        return jsonify({"error": "Failed to reconcile statistics"}), 500
+
 
 @admin_bp.route('/users/<user_id>/register-face', methods=['POST'])
 def register_face(user_id):
-    """Receives an image, generates a face encoding, and saves it to Firestore."""
+    """Receives an image, generates a face encoding, and saves it to Firestore.
+
+    The image can be a multipart 'image' field, a raw image body or the
+    legacy JSON {"image": "<data URL>"}. The encoding runs on the face worker pool. Pass ?async=1 to get a job id
+    back immediately and poll /face-jobs/<job_id> for the result.
+    """
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
+        # Multipart, raw binary or base64 JSON upload from the frontend
+        image_bytes = read_image_upload(request)
+        if not image_bytes:
             return jsonify({"error": "No image data provided"}), 400
 
-        # Verify the user exists in the 'users' collection
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        if not user_doc.exists:
+        # Verify the user exists
+        user_data = repository.get_user(user_id)
+        if user_data is None:
             return jsonify({"error": "User not found"}), 404
 
-        # Decode the Base64 image sent from the frontend
-        image_data_url = data['image']
-        header, encoded = image_data_url.split(",", 1)
-        image_bytes = base64.b64decode(encoded)
-
-        # Load the image into a format that face_recognition can read
-        image = Image.open(io.BytesIO(image_bytes))
-        image_np = np.array(image)
-
-        # Find all faces in the image. We expect only one.
-        face_locations = face_recognition.face_locations(image_np)
-
-        if len(face_locations) == 0:
-            return jsonify({"error": "No face was detected in the image. Please try again."}), 400
-        if len(face_locations) > 1:
-            return jsonify({"error": "Multiple faces were detected. Please ensure only one person is in the frame."}), 400
-
-        # Generate the 128-point facial embedding vector
-        face_encodings = face_recognition.face_encodings(image_np, face_locations)
-        face_encoding = face_encodings[0].tolist() # Convert NumPy array to a Python list for Firestore
-
-        # Save the encoding in a new 'face_encodings' collection
-        # We use the user_id as the document ID for a direct 1-to-1 link
-        encoding_ref = db.collection('face_encodings').document(user_id)
-        encoding_ref.set({
-            'userId': user_id,
-            'encoding': face_encoding,
-            'createdAt': firestore.SERVER_TIMESTAMP,
-            'studentId': user_doc.to_dict().get('studentId') # Link to studentId for easier queries
-        })
+        student_id = user_data.get('studentId')
 
-        return jsonify({"message": "Face registered successfully"}), 201
+        pool = get_face_worker_pool()
+        job_id = pool.submit(
+            encode_single_face, image_bytes,
+            on_result=lambda face_encoding: save_face_encoding(user_id, student_id, face_encoding),
+            kind='register-face',
+            cache_key=image_cache_key(encode_single_face, image_bytes)
+        )
+
+        if request.args.get('async'):
+            return jsonify({"message": "Face registration queued", "jobId": job_id}), 202
 
+        result = pool.wait(job_id, timeout=FACE_JOB_TIMEOUT_SECONDS)
+        return jsonify(result), 201
+
+    except FaceDetectionError as e:
+        return jsonify({"error": str(e)}), 400
+    except PoolBusyError as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         logger.error(f"Error registering face for user {user_id}: {str(e)}")
-        return jsonify({"error": "An internal error occurred while processing the image"}), 500
\ No newline at end of file
+        return jsonify({"error": "An internal error occurred while processing the image"}), 500
+
+def save_face_encoding(user_id, student_id, face_encoding):
+    """Store a computed encoding and add it to the loaded face index"""
+    # Save the encoding in a new 'face_encodings' collection
+    # We use the user_id as the document ID for a direct 1-to-1 link
+    encoding_ref = db.collection('face_encodings').document(user_id)
+    encoding_ref.set(face_encoding_doc(user_id, student_id, face_encoding))
+    update_face_matcher(user_id, face_encoding)
+
+    return {"message": "Face registered successfully", "userId": user_id}
+
+def enroll_spooled_archive(spooled, pool):
+    """Enroll a saved upload and close it"""
+    with spooled:
+        spooled.seek(0)
+        return enroll_faces_from_zip(db, spooled, pool)
+
+# --- Face Job Routes ---
+@admin_bp.route('/face-jobs/<job_id>', methods=['GET'])
+def get_face_job(job_id):
+    """Poll a face processing job; ?wait=<seconds> blocks until it finishes"""
+    wait = request.args.get('wait', 0, type=float)
+    status = get_face_worker_pool().status(job_id, wait=min(wait, FACE_JOB_TIMEOUT_SECONDS))
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status), 200
+
+@admin_bp.route('/face-jobs/stats', methods=['GET'])
+def get_face_job_stats():
+    """Queue depth and utilisation of the face worker pool"""
+    return jsonify(get_face_worker_pool().stats()), 200
+
+@admin_bp.route('/attendance-writer/stats', methods=['GET'])
+def get_attendance_writer_stats():
+    """Backlog, batch sizes and commit latency of the attendance writer"""
+    return jsonify(get_attendance_writer(db).stats()), 200
+
+@admin_bp.route('/face-index/rebuild', methods=['POST'])
+def rebuild_face_index_route():
+    """Rebuild the face matching index from the face_encodings collection"""
+    try:
+        index = rebuild_face_index()
+        return jsonify({"message": "Face index rebuilt successfully", "encodings": len(index)}), 200
+
+    except Exception as e:
+        logger.error(f"Error rebuilding face index: {str(e)}")
+        return jsonify({"error": "Failed to rebuild face index"}), 500
+
+@admin_bp.route('/face-enrollment/bulk', methods=['POST'])
+def bulk_enroll_faces():
+    """Queue enrollment of a ZIP of images named <studentId>.jpg.
+
+    The archive is enrolled as a job on the face worker pool; poll
+    /face-jobs/<job_id> for the per-file report.
+    """
+    try:
+        archive = request.files.get('archive')
+        if archive is None:
+            return jsonify({"error": "No archive uploaded"}), 400
+
+        # The upload is gone once this request ends, so the job reads a copy
+        spooled = tempfile.TemporaryFile()
+        archive.save(spooled)
+        if not zipfile.is_zipfile(spooled):
+            spooled.close()
+            return jsonify({"error": "Uploaded file is not a valid ZIP archive"}), 400
+
+        pool = get_face_worker_pool()
+        job_id = pool.submit_local(enroll_spooled_archive, spooled, pool, kind='bulk-enroll')
+        return jsonify({"message": "Bulk enrollment queued", "jobId": job_id}), 202
+
+    except Exception as e:
+        logger.error(f"Error in bulk face enrollment: {str(e)}")
+        return jsonify({"error": "Failed to process the enrollment archive"}), 500
\ No newline at end of file
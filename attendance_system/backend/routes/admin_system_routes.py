@@ -2,6 +2,11 @@ from flask import Blueprint, request, jsonify
 from firebase_admin import firestore
 import logging
 from datetime import datetime
+from backend.services.attendance_service import attendance_percentage, get_attendance_summaries
+from backend.services.face_recognition_service import delete_face_encoding
+from backend.services.user_search import get_user_search_index
+from backend.utils.cache import reference_cache
+from backend.utils.database import DuplicateUserKeyError, get_repository
 
 # Create blueprint
 admin_system_bp = Blueprint('admin_system', __name__)
@@ -12,14 +17,29 @@ logger = logging.getLogger(__name__)
 # Global app and db reference
 app = None
 db = None
+repository = None
 
 def init_admin_system_routes(flask_app, firestore_db):
     """Initialize admin system routes with app and database"""
-    global app, db
+    global app, db, repository
     app = flask_app
     db = firestore_db
+    repository = get_repository()
     app.register_blueprint(admin_system_bp, url_prefix='/api/admin/system')
 
+def branch_code(branch):
+    """Branch code such as CSE for either the code or its display name"""
+    branches, _ = reference_cache.get('branches', lambda: repository.list_documents('branches'))
+    for branch_doc in branches:
+        if branch_doc.get('branchName', '').lower() == branch.lower():
+            return branch_doc.get('branchId', '').split('_')[0]
+    return branch.upper()
+
+def find_user_by_key(search_term, role):
+    """Full user for an exact email, studentId or teacherId, resolved through the search index"""
+    match = get_user_search_index().find_exact(search_term, role=role)
+    return repository.get_user(match['id']) if match else None
+
 # --- Admin Settings Routes ---
 @admin_system_bp.route('/admin/update', methods=['POST'])
 def update_admin_settings():
@@ -32,14 +52,11 @@ def update_admin_settings():
         
         # Get current admin user (assuming there's a way to identify the current admin)
         # For now, we'll update the first admin found
-        users_ref = db.collection('users')
-        admin_query = users_ref.where('role', '==', 'Admin').limit(1)
-        admin_docs = admin_query.get()
+        admin = repository.find_user('role', 'Admin')
         
-        if not admin_docs:
+        if not admin:
             return jsonify({"error": "Admin user not found"}), 404
         
-        admin_doc = admin_docs[0]
         update_data = {'updatedAt': firestore.SERVER_TIMESTAMP}
         
         # Update fields if provided
@@ -50,10 +67,12 @@ def update_admin_settings():
         if data.get('newPassword'):
             update_data['password'] = data['newPassword']
         
-        admin_doc.reference.update(update_data)
+        repository.update_user(admin['id'], update_data)
         
         return jsonify({"message": "Admin settings updated successfully"}), 200
         
+    except DuplicateUserKeyError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error updating admin settings: {str(e)}")
         return jsonify({"error": "Failed to update admin settings"}), 500
@@ -70,27 +89,19 @@ def remove_teacher():
         
         search_term = data['search'].strip()
         
-        # Search for teacher by name, email, or teacherId
-        users_ref = db.collection('users')
-        teacher_query = users_ref.where('role', '==', 'Teacher')
-        teachers = teacher_query.get()
-        
-        teacher_to_remove = None
-        for teacher in teachers:
-            teacher_data = teacher.to_dict()
-            if (search_term.lower() in teacher_data.get('name', '').lower() or
-                search_term.lower() == teacher_data.get('email', '').lower() or
-                search_term == teacher_data.get('teacherId', '')):
-                teacher_to_remove = teacher
-                break
+        # Search for teacher by email or teacherId, then by best name match
+        teacher_to_remove = find_user_by_key(search_term, 'Teacher')
+        if not teacher_to_remove:
+            matches = get_user_search_index().search(search_term, role='Teacher', limit=1, fields=('name',))
+            teacher_to_remove = repository.get_user(matches[0]['id']) if matches else None
         
         if not teacher_to_remove:
             return jsonify({"error": "Teacher not found"}), 404
         
         # Log the removal action
         removal_log = {
-            'teacherId': teacher_to_remove.id,
-            'teacherData': teacher_to_remove.to_dict(),
+            'teacherId': teacher_to_remove['id'],
+            'teacherData': {key: value for key, value in teacher_to_remove.items() if key != 'id'},
             'reason': data['reason'],
             'reasonText': data.get('reasonText', ''),
             'removedAt': firestore.SERVER_TIMESTAMP,
@@ -98,10 +109,12 @@ def remove_teacher():
         }
         
         # Save removal log
-        db.collection('teacher_removals').document().set(removal_log)
+        repository.add_document('teacher_removals', removal_log)
         
         # Remove the teacher
-        teacher_to_remove.reference.delete()
+        repository.delete_user(teacher_to_remove['id'])
+        delete_face_encoding(db, teacher_to_remove['id'])
+        reference_cache.invalidate('teachers')
         
         return jsonify({"message": "Teacher removed successfully"}), 200
         
@@ -118,16 +131,9 @@ def search_teacher():
         if not query:
             return jsonify({"error": "Search query is required"}), 400
         
-        users_ref = db.collection('users')
-        teacher_query = users_ref.where('role', '==', 'Teacher')
-        teachers = teacher_query.get()
-        
-        for teacher in teachers:
-            teacher_data = teacher.to_dict()
-            if (query.lower() == teacher_data.get('email', '').lower() or
-                query == teacher_data.get('teacherId', '')):
-                teacher_data['id'] = teacher.id
-                return jsonify({"teacher": teacher_data}), 200
+        teacher_data = find_user_by_key(query, 'Teacher')
+        if teacher_data:
+            return jsonify({"teacher": teacher_data}), 200
         
         return jsonify({"error": "Teacher not found"}), 404
         
@@ -147,17 +153,7 @@ def update_teacher():
         search_term = data['search'].strip()
         
         # Find the teacher
-        users_ref = db.collection('users')
-        teacher_query = users_ref.where('role', '==', 'Teacher')
-        teachers = teacher_query.get()
-        
-        teacher_to_update = None
-        for teacher in teachers:
-            teacher_data = teacher.to_dict()
-            if (search_term.lower() == teacher_data.get('email', '').lower() or
-                search_term == teacher_data.get('teacherId', '')):
-                teacher_to_update = teacher
-                break
+        teacher_to_update = find_user_by_key(search_term, 'Teacher')
         
         if not teacher_to_update:
             return jsonify({"error": "Teacher not found"}), 404
@@ -174,10 +170,13 @@ def update_teacher():
         if data.get('bluetoothDeviceId'):
             update_data['bluetoothDeviceId'] = data['bluetoothDeviceId'].strip()
         
-        teacher_to_update.reference.update(update_data)
+        repository.update_user(teacher_to_update['id'], update_data)
+        reference_cache.invalidate('teachers')
         
         return jsonify({"message": "Teacher updated successfully"}), 200
         
+    except DuplicateUserKeyError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error updating teacher: {str(e)}")
         return jsonify({"error": "Failed to update teacher"}), 500
@@ -194,18 +193,16 @@ def change_teacher_password():
         email = data['email'].lower().strip()
         
         # Find the teacher
-        users_ref = db.collection('users')
-        teacher_query = users_ref.where('role', '==', 'Teacher').where('email', '==', email).limit(1)
-        teachers = teacher_query.get()
+        teacher = repository.find_user('email', email, role='Teacher')
         
-        if not teachers:
+        if not teacher:
             return jsonify({"error": "Teacher not found"}), 404
         
-        teacher = teachers[0]
-        teacher.reference.update({
+        repository.update_user(teacher['id'], {
             'password': data['newPassword'],
             'updatedAt': firestore.SERVER_TIMESTAMP
         })
+        reference_cache.invalidate('teachers')
         
         return jsonify({"message": "Teacher password changed successfully"}), 200
         
@@ -217,15 +214,11 @@ def change_teacher_password():
 def get_teachers_without_bluetooth():
     """Get teachers without Bluetooth ID"""
     try:
-        users_ref = db.collection('users')
-        teacher_query = users_ref.where('role', '==', 'Teacher')
-        teachers = teacher_query.get()
+        teachers = repository.list_users(role='Teacher')
         
         teachers_without_bluetooth = []
-        for teacher in teachers:
-            teacher_data = teacher.to_dict()
+        for teacher_data in teachers:
             if not teacher_data.get('bluetoothDeviceId'):
-                teacher_data['id'] = teacher.id
                 teachers_without_bluetooth.append(teacher_data)
         
         return jsonify({"teachers": teachers_without_bluetooth}), 200
@@ -243,16 +236,14 @@ def add_teacher_bluetooth():
         if not data or not data.get('teacherId') or not data.get('bluetoothId'):
             return jsonify({"error": "Teacher ID and Bluetooth ID are required"}), 400
         
-        teacher_ref = db.collection('users').document(data['teacherId'])
-        teacher = teacher_ref.get()
-        
-        if not teacher.exists:
+        if repository.get_user(data['teacherId']) is None:
             return jsonify({"error": "Teacher not found"}), 404
         
-        teacher_ref.update({
+        repository.update_user(data['teacherId'], {
             'bluetoothDeviceId': data['bluetoothId'].strip(),
             'updatedAt': firestore.SERVER_TIMESTAMP
         })
+        reference_cache.invalidate('teachers')
         
         return jsonify({"message": "Bluetooth ID added successfully"}), 200
         
@@ -272,23 +263,17 @@ def fetch_students():
         if not branch or not year or not division:
             return jsonify({"error": "Branch, year, and division are required"}), 400
         
-        users_ref = db.collection('users')
-        student_query = users_ref.where('role', '==', 'Student')
-        students = student_query.get()
-        
-        filtered_students = []
-        for student in students:
-            student_data = student.to_dict()
-            # Check if student matches the criteria
-            if (student_data.get('year') == int(year) and
-                student_data.get('division') == division):
-                # Check branch name from branchId
-                branch_id = student_data.get('branchId', '')
-                if branch.upper() in branch_id.upper():
-                    student_data['id'] = student.id
-                    # TODO: Calculate actual attendance percentage
-                    student_data['totalAttendance'] = 75  # Placeholder
-                    filtered_students.append(student_data)
+        # Equality filter on the composed class id, e.g. CSE_Y2_A
+        branch_id = f"{branch_code(branch)}_Y{int(year)}_{division}"
+        filtered_students = repository.list_students(branch_id=branch_id)
+        
+        # Precomputed attended/held counts, one batched read for the roster
+        summaries = get_attendance_summaries(db, [student['id'] for student in filtered_students]) if db else {}
+        for student_data in filtered_students:
+            summary = summaries.get(student_data['id'], {})
+            student_data['attendedLectures'] = summary.get('attended', 0)
+            student_data['heldLectures'] = summary.get('held', 0)
+            student_data['totalAttendance'] = attendance_percentage(summary)
         
         return jsonify({"students": filtered_students}), 200
         
@@ -308,25 +293,15 @@ def block_student_attendance():
         search_term = data['studentSearch'].strip()
         
         # Find the student
-        users_ref = db.collection('users')
-        student_query = users_ref.where('role', '==', 'Student')
-        students = student_query.get()
-        
-        student_to_block = None
-        for student in students:
-            student_data = student.to_dict()
-            if (search_term.lower() == student_data.get('email', '').lower() or
-                search_term == student_data.get('studentId', '')):
-                student_to_block = student
-                break
+        student_to_block = find_user_by_key(search_term, 'Student')
         
         if not student_to_block:
             return jsonify({"error": "Student not found"}), 404
         
         # Create attendance block record
         block_data = {
-            'studentId': student_to_block.id,
-            'studentData': student_to_block.to_dict(),
+            'studentId': student_to_block['id'],
+            'studentData': {key: value for key, value in student_to_block.items() if key != 'id'},
             'blockUntilDate': data['blockUntilDate'],
             'reason': data['reason'],
             'reasonText': data.get('reasonText', ''),
@@ -334,10 +309,10 @@ def block_student_attendance():
             'blockedBy': 'admin'  # You might want to get the actual admin ID
         }
         
-        db.collection('attendance_blocks').document().set(block_data)
+        repository.add_document('attendance_blocks', block_data)
         
         # Update student record
-        student_to_block.reference.update({
+        repository.update_user(student_to_block['id'], {
             'attendanceBlocked': True,
             'blockUntilDate': data['blockUntilDate'],
             'blockReason': data['reason'],
@@ -359,20 +334,13 @@ def search_student():
         if not query:
             return jsonify({"error": "Search query is required"}), 400
         
-        users_ref = db.collection('users')
-        student_query = users_ref.where('role', '==', 'Student')
-        students = student_query.get()
-        
-        for student in students:
-            student_data = student.to_dict()
-            if (query.lower() == student_data.get('email', '').lower() or
-                query == student_data.get('studentId', '')):
-                student_data['id'] = student.id
-                # Extract branch name from branchId
-                branch_id = student_data.get('branchId', '')
-                if '_' in branch_id:
-                    student_data['branchName'] = branch_id.split('_')[0]
-                return jsonify({"student": student_data}), 200
+        student_data = find_user_by_key(query, 'Student')
+        if student_data:
+            # Extract branch name from branchId
+            branch_id = student_data.get('branchId', '')
+            if '_' in branch_id:
+                student_data['branchName'] = branch_id.split('_')[0]
+            return jsonify({"student": student_data}), 200
         
         return jsonify({"error": "Student not found"}), 404
         
@@ -392,17 +360,7 @@ def update_student():
         search_term = data['search'].strip()
         
         # Find the student
-        users_ref = db.collection('users')
-        student_query = users_ref.where('role', '==', 'Student')
-        students = student_query.get()
-        
-        student_to_update = None
-        for student in students:
-            student_data = student.to_dict()
-            if (search_term.lower() == student_data.get('email', '').lower() or
-                search_term == student_data.get('studentId', '')):
-                student_to_update = student
-                break
+        student_to_update = find_user_by_key(search_term, 'Student')
         
         if not student_to_update:
             return jsonify({"error": "Student not found"}), 404
@@ -424,10 +382,12 @@ def update_student():
         if data.get('newPassword'):
             update_data['password'] = data['newPassword']
         
-        student_to_update.reference.update(update_data)
+        repository.update_user(student_to_update['id'], update_data)
         
         return jsonify({"message": "Student updated successfully"}), 200
         
+    except DuplicateUserKeyError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error updating student: {str(e)}")
         return jsonify({"error": "Failed to update student"}), 500
@@ -444,25 +404,15 @@ def remove_student():
         search_term = data['studentSearch'].strip()
         
         # Find the student
-        users_ref = db.collection('users')
-        student_query = users_ref.where('role', '==', 'Student')
-        students = student_query.get()
-        
-        student_to_remove = None
-        for student in students:
-            student_data = student.to_dict()
-            if (search_term.lower() == student_data.get('email', '').lower() or
-                search_term == student_data.get('studentId', '')):
-                student_to_remove = student
-                break
+        student_to_remove = find_user_by_key(search_term, 'Student')
         
         if not student_to_remove:
             return jsonify({"error": "Student not found"}), 404
         
         # Log the removal action
         removal_log = {
-            'studentId': student_to_remove.id,
-            'studentData': student_to_remove.to_dict(),
+            'studentId': student_to_remove['id'],
+            'studentData': {key: value for key, value in student_to_remove.items() if key != 'id'},
             'reason': data['reason'],
             'reasonText': data.get('reasonText', ''),
             'removedAt': firestore.SERVER_TIMESTAMP,
@@ -470,10 +420,11 @@ def remove_student():
         }
         
         # Save removal log
-        db.collection('student_removals').document().set(removal_log)
+        repository.add_document('student_removals', removal_log)
         
         # Remove the student
-        student_to_remove.reference.delete()
+        repository.delete_user(student_to_remove['id'])
+        delete_face_encoding(db, student_to_remove['id'])
         
         return jsonify({"message": "Student removed successfully"}), 200
         
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS, cross_origin
-from firebase_admin import firestore
 import logging
+from backend.utils.database import get_repository
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -12,10 +12,12 @@ login_bp = Blueprint('login', __name__)
 
 # Store db reference (will be set from app.py)
 db = None
+repository = None
 
 def init_db(db_instance):
-    global db
+    global db, repository
     db = db_instance
+    repository = get_repository()
 
 @login_bp.route('/api/login', methods=['POST', 'OPTIONS'])
 @cross_origin()
@@ -57,28 +59,23 @@ def login():
             }), 400
         
         # Check if database is connected
-        if not db:
+        if not repository:
             return jsonify({
                 "success": False,
                 "message": "Database connection error"
             }), 500
         
-        # Find user by email in Firestore users collection
+        # Find user by email in the users collection
         try:
-            users_ref = db.collection('users')
-            query = users_ref.where('email', '==', email).limit(1)
-            results = query.get()
+            user_data = repository.find_user('email', email)
             
-            if len(results) == 0:
+            if user_data is None:
                 logger.warning(f"User not found with email: {email}")
                 return jsonify({
                     "success": False,
                     "message": "Invalid email or password"
                 }), 401
             
-            # Get the user document
-            user_doc = results[0]
-            user_data = user_doc.to_dict()
             stored_password = user_data.get('password', '')
             
             # Debug logging
@@ -105,7 +102,7 @@ def login():
                 "success": True,
                 "message": "Login successful",
                 "user": {
-                    "uid": user_doc.id,
+                    "uid": user_data['id'],
                     "email": email,
                     "name": name,
                     "role": role
@@ -168,7 +165,7 @@ def update_password():
             }), 400
         
         # Check if database is connected
-        if not db:
+        if not repository:
             return jsonify({
                 "success": False,
                 "message": "Database connection error"
@@ -176,8 +173,7 @@ def update_password():
         
         # Update password in Firestore
         try:
-            user_ref = db.collection('users').document(uid)
-            user_ref.update({
+            repository.update_user(uid, {
                 'password': new_password
             })
             
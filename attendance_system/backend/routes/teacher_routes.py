@@ -1 +1,264 @@
+from flask import Blueprint, request, jsonify
+import logging
+from datetime import datetime
+from backend.services.attendance_service import (
+    ATTENDANCE_COMMIT_TIMEOUT_SECONDS,
+    AttendanceBacklogError,
+    get_attendance_writer,
+    mark_attendance_bulk,
+    record_session_ended,
+    record_session_held,
+)
+from backend.services.face_recognition_service import (
+    load_session_gallery,
+    get_session_gallery,
+    evict_session_gallery,
+)
+from backend.services.face_workers import (
+    DETECT_UPSAMPLE,
+    MAX_DETECT_UPSAMPLE,
+    PoolBusyError,
+    encode_all_faces,
+    get_face_worker_pool,
+    image_cache_key,
+)
+from backend.services.timetable_views import get_timetable_view
+from backend.utils.file_handler import read_image_upload
+from backend.utils.scheduler import get_lecture_resolver
 
+# Create blueprint
+teacher_bp = Blueprint('teacher', __name__)
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Global app and db reference
+app = None
+db = None
+
+# Longest a request waits for a face job
+FACE_JOB_TIMEOUT_SECONDS = 60
+
+def init_teacher_routes(flask_app, firestore_db):
+    """Initialize teacher routes with app and database"""
+    global app, db
+    app = flask_app
+    db = firestore_db
+    app.register_blueprint(teacher_bp, url_prefix='/api/teacher')
+
+# --- Schedule Routes ---
+@teacher_bp.route('/timetable/<teacher_id>', methods=['GET'])
+def get_teacher_timetable(teacher_id):
+    """Get the weekly timetable for a teacher"""
+    try:
+        view = get_timetable_view('teacher', teacher_id)
+        response = jsonify(view['timetable'])
+        response.set_etag(view['etag'])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        logger.error(f"Error fetching teacher timetable: {str(e)}")
+        return jsonify({"error": "Failed to fetch timetable"}), 500
+
+@teacher_bp.route('/current-lecture', methods=['GET'])
+def get_current_lecture():
+    """Get the active or next lecture for a teacher or class"""
+    try:
+        if request.args.get('teacherId'):
+            kind, key = 'teacher', request.args['teacherId']
+        elif request.args.get('branchId'):
+            kind, key = 'branch', request.args['branchId']
+        else:
+            return jsonify({"error": "Missing required parameter: teacherId or branchId"}), 400
+        
+        session = get_lecture_resolver().resolve(kind, key)
+        if session is None:
+            return jsonify({"error": "No lectures scheduled"}), 404
+        
+        return jsonify({
+            "status": session['status'],
+            "timetableId": session['entry']['id'],
+            "lecture": session['entry'],
+            "start": session['start'].isoformat(),
+            "end": session['end'].isoformat()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error resolving current lecture: {str(e)}")
+        return jsonify({"error": "Failed to resolve current lecture"}), 500
+
+# --- Lecture Session Routes ---
+@teacher_bp.route('/sessions', methods=['POST'])
+def start_session():
+    """Start a lecture session and preload its class face gallery"""
+    try:
+        data = request.get_json()
+
+        # A teacher starting "now" gets whichever of their lectures is running
+        if data and not data.get('timetableId') and data.get('teacherId'):
+            current = get_lecture_resolver().resolve('teacher', data['teacherId'])
+            if current is None or current['status'] != 'active':
+                return jsonify({"error": "No lecture is running for this teacher"}), 404
+            data['timetableId'] = current['entry']['id']
+
+        if not data or not data.get('timetableId'):
+            return jsonify({"error": "Missing required field: timetableId"}), 400
+
+        # One session per timetable slot per day
+        date = data.get('date') or datetime.now().strftime('%Y-%m-%d')
+        session_id = f"{data['timetableId']}_{date}"
+
+        session = load_session_gallery(session_id, data['timetableId'])
+        if session is None:
+            return jsonify({"error": "Timetable entry not found"}), 404
+
+        # Counts towards every rostered student's attendance percentage
+        record_session_held(db, session)
+
+        return jsonify({
+            "message": "Session started successfully",
+            "sessionId": session_id,
+            "students": len(session['roster']),
+            "enrolledFaces": len(session['gallery'])
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error starting session: {str(e)}")
+        return jsonify({"error": "Failed to start session"}), 500
+
+@teacher_bp.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """Get a running lecture session"""
+    session = get_session_gallery(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+
+    return jsonify({
+        "sessionId": session_id,
+        "timetableId": session['timetableId'],
+        "branchId": session['timetableEntry'].get('branchId'),
+        "students": len(session['roster']),
+        "enrolledFaces": len(session['gallery'])
+    }), 200
+
+@teacher_bp.route('/sessions/<session_id>', methods=['DELETE'])
+def end_session(session_id):
+    """End a lecture session and evict its face gallery"""
+    try:
+        # Other workers may hold the gallery; the record stops them reloading it
+        evicted = evict_session_gallery(session_id)
+        if not record_session_ended(db, session_id) and not evicted:
+            return jsonify({"error": "Session not found"}), 404
+
+        return jsonify({"message": "Session ended successfully"}), 200
+
+    except Exception as e:
+        logger.error(f"Error ending session {session_id}: {str(e)}")
+        return jsonify({"error": "Failed to end session"}), 500
+
+# --- Attendance Routes ---
+@teacher_bp.route('/sessions/<session_id>/mark', methods=['POST'])
+def mark_student_attendance(session_id):
+    """Mark one student present by hand"""
+    try:
+        data = request.get_json()
+        if not data or not data.get('userId'):
+            return jsonify({"error": "Missing required field: userId"}), 400
+
+        session = get_session_gallery(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+        if data['userId'] not in session['roster']:
+            return jsonify({"error": "Student is not on this session's roster"}), 400
+
+        # Resolves once the writer's next group commit lands
+        future = get_attendance_writer(db).submit(session, {'userId': data['userId']}, 'manual')
+        first_mark = future.result(timeout=ATTENDANCE_COMMIT_TIMEOUT_SECONDS)
+
+        return jsonify({
+            "message": "Student marked present" if first_mark else "Student was already marked present",
+            "userId": data['userId']
+        }), 200
+
+    except AttendanceBacklogError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error marking attendance for session {session_id}: {str(e)}")
+        return jsonify({"error": "Failed to mark attendance"}), 500
+
+@teacher_bp.route('/sessions/<session_id>/group-photo', methods=['POST'])
+def mark_group_photo_attendance(session_id):
+    """Mark attendance for every recognised student in one classroom photo"""
+    try:
+        # Multipart, raw binary or base64 JSON upload
+        image_bytes = read_image_upload(request)
+        if not image_bytes:
+            return jsonify({"error": "No image data provided"}), 400
+
+        session = get_session_gallery(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+
+        # Faces in a classroom photo are small, so allow extra upsampling.
+        # Detection and encoding of every face run as one job on the worker pool.
+        upsample = request.args.get('upsample', DETECT_UPSAMPLE)
+        try:
+            upsample = int(upsample)
+        except (TypeError, ValueError):
+            upsample = -1
+        if not 0 <= upsample <= MAX_DETECT_UPSAMPLE:
+            return jsonify({"error": f"upsample must be a whole number from 0 to {MAX_DETECT_UPSAMPLE}"}), 400
+
+        pool = get_face_worker_pool()
+        job_id = pool.submit(encode_all_faces, image_bytes, upsample, kind='group-photo',
+                             cache_key=image_cache_key(encode_all_faces, image_bytes, upsample))
+        face_locations, face_encodings = pool.wait(job_id, timeout=FACE_JOB_TIMEOUT_SECONDS)
+        if len(face_locations) == 0:
+            return jsonify({"error": "No faces were detected in the image"}), 400
+
+        # Match every detected face in one pass
+        matches = session['gallery'].match(face_encodings, k=1)
+
+        # A student can only be matched once; keep their closest face and
+        # report the others as duplicates
+        best = {}
+        unrecognized = 0
+        duplicates = 0
+        for face_matches in matches:
+            if not face_matches:
+                unrecognized += 1
+                continue
+            match = face_matches[0]
+            current = best.get(match['userId'])
+            if current is not None:
+                duplicates += 1
+            if current is None or match['distance'] < current['distance']:
+                best[match['userId']] = match
+
+        recognized = sorted(best.values(), key=lambda match: match['distance'])
+        marked = mark_attendance_bulk(db, session, recognized, 'group_photo')
+
+        present = []
+        for match in recognized:
+            student = session['roster'].get(match['userId'], {})
+            present.append({
+                'userId': match['userId'],
+                'studentId': student.get('studentId'),
+                'name': student.get('name'),
+                'distance': round(match['distance'], 4)
+            })
+
+        return jsonify({
+            "message": f"Marked {marked} students present",
+            "facesDetected": len(face_locations),
+            "unrecognizedFaces": unrecognized,
+            "duplicateFaces": duplicates,
+            "present": present
+        }), 200
+
+    except (PoolBusyError, AttendanceBacklogError) as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error marking group photo attendance for session {session_id}: {str(e)}")
+        return jsonify({"error": "An internal error occurred while processing the image"}), 500
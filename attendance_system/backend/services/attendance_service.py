@@ -1 +1,346 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait as wait_for_futures
 
+from firebase_admin import firestore
+from google.api_core.exceptions import Conflict, NotFound
+
+from backend.utils.cache import LRUCache
+from backend.utils.database import MAX_BATCH_WRITES
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Per-student attended/held counts, maintained as attendance is marked so
+# rosters never scan attendance records
+SUMMARY_COLLECTION = 'attendance_summaries'
+
+# Each newly marked student costs two writes: the record and the summary
+MARKS_PER_BATCH = MAX_BATCH_WRITES // 2
+
+# Marks are group-committed: the writer waits this long after the oldest
+# queued mark for others to join, or flushes as soon as a batch is full
+ATTENDANCE_FLUSH_INTERVAL_MS = float(os.environ.get('ATTENDANCE_FLUSH_INTERVAL_MS', 5))
+ATTENDANCE_FLUSH_MAX_MARKS = min(int(os.environ.get('ATTENDANCE_FLUSH_MAX_MARKS', MARKS_PER_BATCH)),
+                                 MARKS_PER_BATCH)
+
+# Attendance ids this process has written, so re-marks during a lecture are
+# answered without a write; entries outlive a lecture and then expire
+MARKED_CACHE_MAX_BYTES = 8 * 1024 * 1024
+MARKED_CACHE_TTL_SECONDS = 3 * 60 * 60
+
+# Batches retried after a record turned out to exist already
+COMMIT_ATTEMPTS = 3
+
+# Marks beyond this many waiting to be written are rejected instead of queued
+ATTENDANCE_MAX_BACKLOG = int(os.environ.get('ATTENDANCE_MAX_BACKLOG', 20000))
+
+# Longest a request waits for its marks to commit
+ATTENDANCE_COMMIT_TIMEOUT_SECONDS = 30
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class AttendanceBacklogError(RuntimeError):
+    """Raised when too many marks are already waiting to be written"""
+
+
+def attendance_doc_id(session_id, user_id):
+    """One attendance document per student per session, so re-marking is idempotent"""
+    return f"{session_id}_{user_id}"
+
+
+def attendance_percentage(summary):
+    """Attended share of held lectures, or None before any lecture was held"""
+    held = summary.get('held', 0)
+    return round(summary.get('attended', 0) * 100 / held, 1) if held else None
+
+
+def get_attendance_summaries(db, user_ids):
+    """Summary dict per user id in one batched read; users with none get zero counts"""
+    refs = [db.collection(SUMMARY_COLLECTION).document(user_id) for user_id in user_ids]
+    summaries = {user_id: {'attended': 0, 'held': 0} for user_id in user_ids}
+    for snapshot in (db.get_all(refs) if refs else []):
+        if snapshot.exists:
+            summaries[snapshot.id] = snapshot.to_dict()
+    return summaries
+
+
+def record_session_held(db, session):
+    """Count the lecture as held for everyone on the roster, once per session.
+
+    Returns False if the session had already been recorded.
+    """
+    session_ref = db.collection('attendance_sessions').document(session['sessionId'])
+    user_ids = list(session['roster'])
+    summaries = db.collection(SUMMARY_COLLECTION)
+    first_chunk = user_ids[:MAX_BATCH_WRITES - 1]
+
+    @firestore.transactional
+    def record(transaction):
+        snapshot = session_ref.get(transaction=transaction)
+        if snapshot.exists:
+            # Restarting an ended session lets other workers load it again
+            if (snapshot.to_dict() or {}).get('endedAt'):
+                transaction.update(session_ref, {'endedAt': firestore.DELETE_FIELD})
+            return False
+        transaction.set(session_ref, {
+            'sessionId': session['sessionId'],
+            'timetableId': session['timetableId'],
+            'students': len(user_ids),
+            'startedAt': firestore.SERVER_TIMESTAMP
+        })
+        for user_id in first_chunk:
+            transaction.set(summaries.document(user_id), {'userId': user_id, 'held': firestore.Increment(1)}, merge=True)
+        return True
+
+    if not record(db.transaction()):
+        return False
+
+    rest = user_ids[len(first_chunk):]
+    for start in range(0, len(rest), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for user_id in rest[start:start + MAX_BATCH_WRITES]:
+            batch.set(summaries.document(user_id), {'userId': user_id, 'held': firestore.Increment(1)}, merge=True)
+        batch.commit()
+    return True
+
+
+def record_session_ended(db, session_id):
+    """Mark a session as ended so no worker reloads it; False if it was never started"""
+    try:
+        db.collection('attendance_sessions').document(session_id).update({'endedAt': firestore.SERVER_TIMESTAMP})
+    except NotFound:
+        return False
+    return True
+
+
+def attendance_record(session, match, method):
+    """Attendance document for one matched student"""
+    entry = session['timetableEntry']
+    student = session['roster'].get(match['userId'], {})
+    return {
+        'sessionId': session['sessionId'],
+        'timetableId': session['timetableId'],
+        'userId': match['userId'],
+        'studentId': student.get('studentId'),
+        'branchId': entry.get('branchId'),
+        'courseCode': entry.get('courseCode'),
+        'day': entry.get('day'),
+        'lectureNumber': entry.get('lectureNumber'),
+        'status': 'Present',
+        'method': method,
+        'distance': match.get('distance'),
+        'markedAt': firestore.SERVER_TIMESTAMP
+    }
+
+
+class AttendanceWriter:
+    """Queues attendance marks and commits them in shared batched writes.
+
+    A background thread takes up to max_marks queued marks, from any number
+    of sessions and requests, once the oldest has waited flush_interval_ms
+    or the batch is full. Each submit returns a Future that resolves to True
+    for a first-time mark and False for a re-mark once its batch commits.
+    """
+
+    def __init__(self, db, flush_interval_ms=ATTENDANCE_FLUSH_INTERVAL_MS,
+                 max_marks=ATTENDANCE_FLUSH_MAX_MARKS, max_backlog=ATTENDANCE_MAX_BACKLOG):
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_marks = max_marks
+        self.max_backlog = max_backlog
+        self._queue = deque()
+        # The id is stored as the value so the byte bound covers it
+        self._marked = LRUCache(MARKED_CACHE_MAX_BYTES, MARKED_CACHE_TTL_SECONDS)
+        self._lock = threading.Lock()
+        self._has_marks = threading.Condition(self._lock)
+        self._stopping = False
+
+        self._flushes = 0
+        self._committed = 0
+        self._failed = 0
+        self._max_batch = 0
+        self._max_backlog_seen = 0
+        self._flush_seconds = 0.0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+        self._wait_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, session, match, method):
+        """Queue one mark; returns a Future for its commit"""
+        return self.submit_many(session, [match], method)[0]
+
+    def submit_many(self, session, matches, method):
+        """Queue marks for one session; returns a Future per match"""
+        now = time.monotonic()
+        marks = [{
+            'docId': attendance_doc_id(session['sessionId'], match['userId']),
+            'userId': match['userId'],
+            'record': attendance_record(session, match, method),
+            'future': Future(),
+            'queuedAt': now
+        } for match in matches]
+
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError("Attendance writer is stopped")
+            if len(self._queue) + len(marks) > self.max_backlog:
+                raise AttendanceBacklogError("Too many attendance marks are waiting to be saved; please retry")
+            self._queue.extend(marks)
+            self._max_backlog_seen = max(self._max_backlog_seen, len(self._queue))
+            self._has_marks.notify()
+        return [mark['future'] for mark in marks]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopping:
+                    self._has_marks.wait()
+                if not self._queue:
+                    return
+                # Let concurrent requests join this commit, up to a full batch
+                deadline = self._queue[0]['queuedAt'] + self.flush_interval
+                while len(self._queue) < self.max_marks and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._has_marks.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.max_marks, len(self._queue)))]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        # A student marked twice in one batch, or already marked by this
+        # process, is not written again
+        records = {}
+        for mark in batch:
+            if mark['docId'] not in records and self._marked.get(mark['docId']) is None:
+                records[mark['docId']] = mark
+
+        started = time.monotonic()
+        try:
+            first_marks = _commit_marks(self.db, records) if records else set()
+        except Exception as e:
+            logger.error(f"Error committing {len(batch)} attendance marks: {str(e)}")
+            with self._lock:
+                self._failed += len(batch)
+            for mark in batch:
+                mark['future'].set_exception(e)
+            return
+        finished = time.monotonic()
+        for doc_id in records:
+            self._marked.set(doc_id, doc_id)
+
+        with self._lock:
+            elapsed = finished - started
+            self._flushes += 1
+            self._committed += len(batch)
+            self._max_batch = max(self._max_batch, len(batch))
+            self._flush_seconds += elapsed
+            self._last_flush_seconds = elapsed
+            self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+            self._wait_seconds += sum(finished - mark['queuedAt'] for mark in batch)
+        # Of duplicates in one batch only the first counts as a first-time mark
+        for mark in batch:
+            first_mark = mark['docId'] in first_marks
+            first_marks.discard(mark['docId'])
+            mark['future'].set_result(first_mark)
+
+    def stats(self):
+        """Backlog, batch sizes and commit latency for sizing the flush settings"""
+        with self._lock:
+            flushes = max(self._flushes, 1)
+            committed = max(self._committed, 1)
+            return {
+                'backlog': len(self._queue),
+                'maxBacklog': self._max_backlog_seen,
+                'flushes': self._flushes,
+                'marksCommitted': self._committed,
+                'marksFailed': self._failed,
+                'avgBatchSize': round(self._committed / flushes, 2),
+                'maxBatchSize': self._max_batch,
+                'lastFlushMs': round(self._last_flush_seconds * 1000, 2),
+                'avgFlushMs': round(self._flush_seconds * 1000 / flushes, 2),
+                'maxFlushMs': round(self._max_flush_seconds * 1000, 2),
+                'avgMarkLatencyMs': round(self._wait_seconds * 1000 / committed, 2)
+            }
+
+    def stop(self, timeout=None):
+        """Write every queued mark and stop the background thread"""
+        with self._lock:
+            self._stopping = True
+            self._has_marks.notify()
+        self._thread.join(timeout)
+
+
+def _commit_marks(db, records):
+    """Create {docId: mark} records; returns the doc ids that were not marked before.
+
+    Records are created, never overwritten, so a re-mark keeps the original
+    markedAt. A batch of creates fails as a whole when any record already
+    exists (marked by another process or before a restart); the existing ids
+    are then read once and the rest of the batch retried.
+    """
+    attendance_ref = db.collection('attendance')
+    pending = dict(records)
+    for _ in range(COMMIT_ATTEMPTS):
+        batch = db.batch()
+        # Only first-time marks count, summed per student into one summary write
+        attended = {}
+        for doc_id, mark in pending.items():
+            batch.create(attendance_ref.document(doc_id), mark['record'])
+            attended[mark['userId']] = attended.get(mark['userId'], 0) + 1
+        for user_id, count in attended.items():
+            batch.set(db.collection(SUMMARY_COLLECTION).document(user_id),
+                      {'userId': user_id, 'attended': firestore.Increment(count)}, merge=True)
+        try:
+            batch.commit()
+            return set(pending)
+        except Conflict:
+            refs = [attendance_ref.document(doc_id) for doc_id in pending]
+            for snapshot in db.get_all(refs):
+                if snapshot.exists:
+                    pending.pop(snapshot.id, None)
+            if not pending:
+                return set()
+    raise RuntimeError("Attendance records kept changing while being marked")
+
+
+def get_attendance_writer(db):
+    """Return the process-wide attendance writer, starting it on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AttendanceWriter(db)
+            # Queued marks are written before the process exits
+            atexit.register(_writer.stop, ATTENDANCE_COMMIT_TIMEOUT_SECONDS)
+            logger.info("Started attendance writer")
+        return _writer
+
+
+def mark_attendance_bulk(db, session, matches, method):
+    """Mark every matched student present for a session.
+
+    matches is a list of dicts with userId and distance. The marks are
+    group-committed with those of other requests; re-marking from a
+    resubmitted photo is not counted twice in the summaries. Returns the
+    number of students newly marked present; ones already marked are not
+    counted.
+    """
+    futures = get_attendance_writer(db).submit_many(session, matches, method)
+    done, not_done = wait_for_futures(futures, timeout=ATTENDANCE_COMMIT_TIMEOUT_SECONDS)
+    if not_done:
+        raise TimeoutError(f"{len(not_done)} attendance marks were not saved in time")
+    # Each future resolves to whether its mark was the first for the session
+    marked = sum(1 for future in done if future.result())
+
+    logger.info(f"Marked {marked} of {len(matches)} matched students present for session {session['sessionId']}")
+    return marked
@@ -0,0 +1,126 @@
+import logging
+import os
+import zipfile
+from collections import deque
+
+from backend.services.face_recognition_service import (
+    DuplicateFaceError,
+    FaceMatcher,
+    check_duplicate_face,
+    face_encoding_doc,
+    find_duplicate_face,
+    update_face_matcher,
+)
+from backend.services.face_workers import encode_single_face
+from backend.utils.database import MAX_BATCH_WRITES, get_repository
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+# Longest to wait for any single image in the archive
+ENCODE_TIMEOUT_SECONDS = 120
+
+
+def student_ids_to_user_ids():
+    """Map every student's studentId to their users document id"""
+    students = get_repository().list_users(role='Student', fields=['studentId'])
+    return {student['studentId']: student['id'] for student in students if student.get('studentId')}
+
+
+def enroll_faces_from_zip(db, archive, pool):
+    """Enroll every <studentId>.<ext> image in a ZIP archive.
+
+    Entries are read one at a time and encoded in parallel on the worker
+    pool; successful encodings are written in batched commits. A face that
+    matches another student, already enrolled or earlier in the same
+    archive, is reported as failed. Returns a summary with one result per
+    image file.
+    """
+    user_ids = student_ids_to_user_ids()
+    results = []
+    pending = deque()
+    encoded = []
+    # Faces accepted from this archive, which the global index does not
+    # hold until their batch commits
+    accepted = FaceMatcher()
+    accepted_files = {}
+
+    # Keep every worker busy without tripping the pool's pending-job limit
+    window = max(min(pool.workers * 2, pool.max_pending), 1)
+
+    def collect(job):
+        job_id, result = job
+        try:
+            face_encoding = pool.wait(job_id, timeout=ENCODE_TIMEOUT_SECONDS)
+            check_duplicate_face(result['userId'], face_encoding)
+            match = find_duplicate_face(result['userId'], face_encoding, matcher=accepted)
+            if match is not None:
+                raise DuplicateFaceError(f"Same face as {accepted_files[match['userId']]} in this archive")
+        except Exception as e:
+            result.update({'status': 'failed', 'error': str(e)})
+            return
+        accepted.add(result['userId'], face_encoding)
+        accepted_files[result['userId']] = result['file']
+        encoded.append((result, face_encoding))
+        if len(encoded) >= MAX_BATCH_WRITES:
+            _commit_encodings(db, encoded)
+
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            filename = os.path.basename(info.filename)
+            student_id, ext = os.path.splitext(filename)
+            # Skip folders and macOS resource forks
+            if info.is_dir() or filename.startswith('.') or '__MACOSX' in info.filename:
+                continue
+            if ext.lower() not in IMAGE_EXTENSIONS:
+                continue
+
+            result = {'file': info.filename, 'studentId': student_id}
+            results.append(result)
+            user_id = user_ids.get(student_id)
+            if user_id is None:
+                result.update({'status': 'failed', 'error': 'No student with this studentId'})
+                continue
+            result['userId'] = user_id
+
+            while len(pending) >= window:
+                collect(pending.popleft())
+            job_id = pool.submit(encode_single_face, zf.read(info), kind='bulk-enroll')
+            pending.append((job_id, result))
+
+        while pending:
+            collect(pending.popleft())
+
+    if encoded:
+        _commit_encodings(db, encoded)
+
+    enrolled = sum(1 for result in results if result.get('status') == 'enrolled')
+    logger.info(f"Bulk enrollment finished: {enrolled} of {len(results)} images enrolled")
+    return {
+        'total': len(results),
+        'enrolled': enrolled,
+        'failed': len(results) - enrolled,
+        'results': results
+    }
+
+
+def _commit_encodings(db, encoded):
+    """Write the buffered encodings in one batch and record the outcome"""
+    batch = db.batch()
+    for result, face_encoding in encoded:
+        ref = db.collection('face_encodings').document(result['userId'])
+        batch.set(ref, face_encoding_doc(result['userId'], result['studentId'], face_encoding))
+
+    try:
+        batch.commit()
+    except Exception as e:
+        logger.error(f"Error committing face encodings batch: {str(e)}")
+        for result, _ in encoded:
+            result.update({'status': 'failed', 'error': 'Failed to save encoding'})
+    else:
+        for result, face_encoding in encoded:
+            result['status'] = 'enrolled'
+            update_face_matcher(result['userId'], face_encoding)
+    encoded.clear()
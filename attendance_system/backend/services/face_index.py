@@ -0,0 +1,230 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from backend.services.face_recognition_service import (
+    DEFAULT_TOLERANCE,
+    ENCODING_SIZE,
+    FaceMatcher,
+    encoding_rows,
+    latest_update,
+)
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+
+def kmeans(data, n_clusters, iterations=10, seed=0):
+    """Plain Lloyd k-means on float32 rows; returns the centroid matrix"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    data_sq = np.einsum('ij,ij->i', data, data)
+
+    for _ in range(iterations):
+        assignment = _nearest(data, data_sq, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters with random points so no list stays unused
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+def _nearest(data, data_sq, centroids):
+    """Index of the closest centroid for every row of data"""
+    sq = data @ centroids.T
+    sq *= -2.0
+    sq += np.einsum('ij,ij->i', centroids, centroids)
+    sq += data_sq[:, None]
+    return np.argmin(sq, axis=1)
+
+
+class IVFFaceIndex:
+    """Inverted-file index: encodings are bucketed by their nearest k-means
+    centroid and a probe only scans the nprobe closest buckets.
+
+    Exposes the same add/remove/match/save interface as FaceMatcher so the
+    two can be swapped with FACE_INDEX_TYPE.
+    """
+
+    # Below this many encodings per list the index stays a single exact list
+    MIN_POINTS_PER_LIST = 39
+
+    def __init__(self, n_lists=None, nprobe=8, train_sample=20000):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self.high_water_mark = None
+        self._lock = threading.RLock()
+        self._reset(np.zeros((1, ENCODING_SIZE), dtype=np.float32))
+
+    def __len__(self):
+        return len(self._assignment)
+
+    def __contains__(self, user_id):
+        return user_id in self._assignment
+
+    def _reset(self, centroids):
+        self.centroids = centroids.astype(np.float32)
+        self._centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.lists = [FaceMatcher(capacity=64) for _ in range(len(self.centroids))]
+        self._assignment = {}  # userId -> list number
+        self._trained_size = 0
+
+    def load(self, rows):
+        """Rebuild the index from (userId, encoding) pairs, retraining centroids"""
+        user_ids = []
+        encodings = []
+        for user_id, encoding in rows:
+            user_ids.append(user_id)
+            encodings.append(encoding)
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            self._build(user_ids, matrix)
+
+    def load_from_firestore(self, firestore_db):
+        """Load every document of the face_encodings collection"""
+        docs = list(firestore_db.collection('face_encodings').stream())
+        rows = encoding_rows(docs)
+        self.load(rows)
+        self.high_water_mark = latest_update(docs)
+        logger.info(f"Loaded {len(rows)} face encodings into the IVF index ({len(self.lists)} lists)")
+
+    def _build(self, user_ids, matrix, centroids=None):
+        if centroids is None:
+            centroids = self._train(matrix)
+        self._reset(centroids)
+        if len(matrix):
+            assignment = _nearest(matrix, np.einsum('ij,ij->i', matrix, matrix), self.centroids)
+            for list_no in range(len(self.lists)):
+                members = np.flatnonzero(assignment == list_no)
+                self.lists[list_no].load((user_ids[i], matrix[i]) for i in members)
+            self._assignment = {user_id: int(list_no) for user_id, list_no in zip(user_ids, assignment)}
+        self._trained_size = len(matrix)
+
+    def _train(self, matrix):
+        n_lists = self.n_lists or int(np.sqrt(len(matrix)))
+        n_lists = min(n_lists, len(matrix) // self.MIN_POINTS_PER_LIST)
+        if n_lists <= 1:
+            return np.zeros((1, ENCODING_SIZE), dtype=np.float32)
+        sample = matrix
+        if len(matrix) > self.train_sample:
+            rng = np.random.default_rng(0)
+            sample = matrix[rng.choice(len(matrix), self.train_sample, replace=False)]
+        return kmeans(sample, n_lists)
+
+    def add(self, user_id, encoding):
+        """Insert or replace the encoding for a user"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            list_no = int(np.argmin(self._centroid_sq - 2.0 * (self.centroids @ encoding)))
+            previous = self._assignment.get(user_id)
+            if previous is not None and previous != list_no:
+                self.lists[previous].remove(user_id)
+            self.lists[list_no].add(user_id, encoding)
+            self._assignment[user_id] = list_no
+
+            # Centroids trained on a much smaller gallery give lopsided lists
+            if len(self) >= max(2 * self._trained_size, self.MIN_POINTS_PER_LIST * 4):
+                self.retrain()
+
+    def remove(self, user_id):
+        """Remove a user's encoding; returns False if the user was not enrolled"""
+        with self._lock:
+            list_no = self._assignment.pop(user_id, None)
+            if list_no is None:
+                return False
+            return self.lists[list_no].remove(user_id)
+
+    def rows_for(self, user_ids):
+        """(userId, encoding) pairs for those of user_ids that are enrolled"""
+        rows = []
+        with self._lock:
+            for user_id in user_ids:
+                list_no = self._assignment.get(user_id)
+                if list_no is not None:
+                    rows.extend(self.lists[list_no].rows_for([user_id]))
+        return rows
+
+    def retrain(self):
+        """Recompute centroids from the current contents and reassign every encoding"""
+        with self._lock:
+            user_ids, matrix = self._contents()
+            self._build(user_ids, matrix)
+        logger.info(f"Retrained IVF face index: {len(user_ids)} encodings, {len(self.lists)} lists")
+
+    def _contents(self):
+        user_ids = []
+        blocks = []
+        for face_list in self.lists:
+            user_ids.extend(face_list.user_ids)
+            blocks.append(face_list.encodings)
+        return user_ids, np.concatenate(blocks) if blocks else np.empty((0, ENCODING_SIZE), dtype=np.float32)
+
+    def match(self, probes, k=1, tolerance=DEFAULT_TOLERANCE, nprobe=None):
+        """Approximate top-k matches with the same result shape as FaceMatcher.match"""
+        single = np.ndim(probes) == 1
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+
+        results = []
+        with self._lock:
+            centroid_sq = self._centroid_sq - 2.0 * (probes @ self.centroids.T)
+            if nprobe < len(self.lists):
+                probe_lists = np.argpartition(centroid_sq, nprobe - 1, axis=1)[:, :nprobe]
+            else:
+                probe_lists = np.broadcast_to(np.arange(len(self.lists)), (len(probes), nprobe))
+
+            for probe, list_nos in zip(probes, probe_lists):
+                user_ids = []
+                distances = []
+                for list_no in list_nos:
+                    face_list = self.lists[list_no]
+                    if len(face_list):
+                        user_ids.extend(face_list.user_ids)
+                        distances.append(face_list.distances(probe)[0])
+                if not distances:
+                    results.append([])
+                    continue
+                distances = np.concatenate(distances)
+                top = min(k, len(distances))
+                best = np.argpartition(distances, top - 1)[:top] if top < len(distances) else np.arange(top)
+                best = best[np.argsort(distances[best])]
+                results.append([
+                    {'userId': user_ids[i], 'distance': float(distances[i])}
+                    for i in best
+                    if tolerance is None or distances[i] <= tolerance
+                ])
+
+        return results[0] if single else results
+
+    def save(self, path):
+        """Atomically persist centroids and encodings so a restart skips training"""
+        with self._lock:
+            user_ids, matrix = self._contents()
+            centroids = self.centroids
+            high_water_mark = self.high_water_mark.isoformat() if self.high_water_mark else ''
+        # A crash mid-write leaves the previous index in place, not a truncated one
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, kind='ivf', centroids=centroids, encodings=matrix,
+                     user_ids=np.asarray(user_ids, dtype=str), high_water_mark=high_water_mark)
+        os.replace(tmp_path, path)
+
+    def load_file(self, path):
+        """Reload an index written by save without retraining"""
+        with np.load(path) as saved:
+            centroids = saved['centroids']
+            matrix = saved['encodings'].astype(np.float32)
+            user_ids = saved['user_ids'].tolist()
+            high_water_mark = str(saved['high_water_mark']) if 'high_water_mark' in saved else ''
+        with self._lock:
+            self._build(user_ids, matrix, centroids=centroids)
+            self.high_water_mark = datetime.fromisoformat(high_water_mark) if high_water_mark else None
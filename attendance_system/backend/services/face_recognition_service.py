@@ -1 +1,609 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 
+import numpy as np
+from firebase_admin import firestore
+
+from backend.utils.database import get_repository
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Length of the dlib face embedding produced by face_recognition.face_encodings
+ENCODING_SIZE = 128
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+
+# A new registration this close to another user's face is taken to be the
+# same person enrolled twice
+DUPLICATE_FACE_TOLERANCE = float(os.environ.get('DUPLICATE_FACE_TOLERANCE', 0.4))
+
+# Persisted indexes live next to the local database under data/db/
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_DIR = os.path.join(BASE_DIR, 'data', 'db')
+
+# 'exact' scans the whole matrix, 'ivf' uses the inverted-file index in face_index.py
+FACE_INDEX_TYPE = os.environ.get('FACE_INDEX_TYPE', 'exact')
+
+# Incremental changes are written back to disk at most this often
+INDEX_SAVE_DELAY_SECONDS = 5
+
+# Stored encodings are raw little-endian bytes behind a 4-byte header:
+# b'FE', the format version and a dtype code. float16 halves the size again
+# at a precision cost (~1e-3) far below the 0.6 match tolerance.
+ENCODING_MAGIC = b'FE'
+ENCODING_FORMAT_VERSION = 1
+ENCODING_HEADER_SIZE = 4
+ENCODING_DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+ENCODING_DTYPE_CODES = {'float32': 1, 'float16': 2}
+ENCODING_STORAGE_DTYPE = os.environ.get('FACE_ENCODING_DTYPE', 'float32')
+
+# Global db reference and process-wide matcher
+db = None
+_matcher = None
+_matcher_lock = threading.Lock()
+_save_timer = None
+_watch = None
+
+
+class DuplicateFaceError(ValueError):
+    """The face is already registered to another user"""
+
+
+def init_face_recognition_service(firestore_db):
+    """Initialize the face recognition service with the database"""
+    global db
+    db = firestore_db
+
+
+def pack_encoding(encoding, dtype=None):
+    """Serialise an encoding into the versioned compact byte format"""
+    code = ENCODING_DTYPE_CODES[dtype or ENCODING_STORAGE_DTYPE]
+    header = ENCODING_MAGIC + bytes([ENCODING_FORMAT_VERSION, code])
+    values = np.asarray(encoding, dtype=ENCODING_DTYPES[code]).reshape(ENCODING_SIZE)
+    return header + values.tobytes()
+
+
+def unpack_encoding(value):
+    """Return a float32 encoding from packed bytes or a legacy list of floats"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        if value[:2] != ENCODING_MAGIC:
+            raise ValueError("Not a packed face encoding")
+        version, code = value[2], value[3]
+        if version != ENCODING_FORMAT_VERSION or code not in ENCODING_DTYPES:
+            raise ValueError(f"Unsupported face encoding format v{version} dtype {code}")
+        encoding = np.frombuffer(value, dtype=ENCODING_DTYPES[code], offset=ENCODING_HEADER_SIZE)
+        return encoding.astype(np.float32)
+
+    # Documents written before the compact format store a list of doubles
+    return np.asarray(value, dtype=np.float32)
+
+
+def face_encoding_doc(user_id, student_id, encoding):
+    """Build the face_encodings document stored for a user"""
+    return {
+        'userId': user_id,
+        'encoding': pack_encoding(encoding),
+        'createdAt': firestore.SERVER_TIMESTAMP,
+        'updatedAt': firestore.SERVER_TIMESTAMP,
+        'studentId': student_id # Link to studentId for easier queries
+    }
+
+
+def face_encoding_tombstone(user_id):
+    """Document left in place of a removed encoding so catch-up reads see the delete"""
+    return {
+        'userId': user_id,
+        'encoding': None,
+        'deleted': True,
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }
+
+
+def encoding_from_doc(data):
+    """Return the stored encoding of a face_encodings document, or None"""
+    encoding = data.get('encoding')
+    if encoding is None or len(encoding) == 0:
+        return None
+    return unpack_encoding(encoding)
+
+
+def encoding_rows(docs):
+    """(userId, encoding) pairs for the existing documents in docs"""
+    rows = []
+    for doc in docs:
+        if not doc.exists:
+            continue
+        data = doc.to_dict()
+        encoding = encoding_from_doc(data)
+        if encoding is not None:
+            rows.append((data.get('userId', doc.id), encoding))
+    return rows
+
+
+def latest_update(docs, since=None):
+    """Newest updatedAt among docs, used as the high-water mark for catch-up reads"""
+    latest = since
+    for doc in docs:
+        updated_at = doc.to_dict().get('updatedAt') if doc.exists else None
+        if updated_at is not None and (latest is None or updated_at > latest):
+            latest = updated_at
+    return latest
+
+
+def top_k_matches(dist, user_ids, k, tolerance):
+    """Turn a (probes x gallery) distance matrix into per-probe top-k match lists"""
+    k = min(k, len(user_ids))
+    if k == 0:
+        return [[] for _ in range(dist.shape[0])]
+
+    if k < len(user_ids):
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(len(user_ids)), (dist.shape[0], k))
+    top_dist = np.take_along_axis(dist, top, axis=1)
+    order = np.argsort(top_dist, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_dist = np.take_along_axis(top_dist, order, axis=1)
+
+    results = []
+    for rows, row_dist in zip(top, top_dist):
+        matches = []
+        for row, distance in zip(rows, row_dist):
+            # Removed rows are scored as infinity and never match
+            if not np.isfinite(distance) or (tolerance is not None and distance > tolerance):
+                break
+            matches.append({'userId': user_ids[row], 'distance': float(distance)})
+        results.append(matches)
+    return results
+
+
+class FaceMatcher:
+    """Keeps every registered face encoding in one contiguous float32 matrix.
+
+    Probes are scored against the whole gallery with a single matrix product
+    instead of calling face_recognition.compare_faces once per student.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.RLock()
+        self._matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._size = 0
+        self.user_ids = []
+        self._rows = {}  # userId -> row in the matrix
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    @property
+    def encodings(self):
+        """View of the populated rows of the encoding matrix"""
+        return self._matrix[:self._size]
+
+    def load(self, rows):
+        """Replace the gallery with (userId, encoding) pairs in one allocation"""
+        user_ids = []
+        encodings = []
+        for user_id, encoding in rows:
+            user_ids.append(user_id)
+            encodings.append(encoding)
+
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            capacity = max(len(user_ids), 1)
+            self._matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+            self._matrix[:len(user_ids)] = matrix
+            self._sq_norms = np.empty(capacity, dtype=np.float32)
+            self._sq_norms[:len(user_ids)] = np.einsum('ij,ij->i', matrix, matrix)
+            self._size = len(user_ids)
+            self.user_ids = user_ids
+            self._rows = {user_id: row for row, user_id in enumerate(user_ids)}
+
+    def load_from_firestore(self, firestore_db):
+        """Load every document of the face_encodings collection"""
+        rows = encoding_rows(firestore_db.collection('face_encodings').stream())
+        self.load(rows)
+        logger.info(f"Loaded {len(rows)} face encodings into the matcher")
+
+    def add(self, user_id, encoding):
+        """Insert or replace the encoding for a user"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                if self._size == len(self._matrix):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[user_id] = row
+                self.user_ids.append(user_id)
+            self._matrix[row] = encoding
+            self._sq_norms[row] = encoding @ encoding
+
+    def remove(self, user_id):
+        """Remove a user's encoding; returns False if the user was not enrolled"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                # Move the last row into the hole to keep the matrix contiguous
+                moved_id = self.user_ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self.user_ids[row] = moved_id
+                self._rows[moved_id] = row
+            self.user_ids.pop()
+            self._size = last
+            return True
+
+    def rows_for(self, user_ids):
+        """(userId, encoding) pairs for those of user_ids that are enrolled"""
+        with self._lock:
+            return [(user_id, self._matrix[self._rows[user_id]].copy())
+                    for user_id in user_ids if user_id in self._rows]
+
+    def distances(self, probes):
+        """Euclidean distance from each probe to every enrolled encoding"""
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            encodings = self.encodings
+            # ||p - e||^2 = ||p||^2 + ||e||^2 - 2 p.e, computed as one GEMM
+            sq = probes @ encodings.T
+            sq *= -2.0
+            sq += self._sq_norms[:self._size]
+            sq += np.einsum('ij,ij->i', probes, probes)[:, None]
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def match(self, probes, k=1, tolerance=DEFAULT_TOLERANCE):
+        """Return the top-k matches for a probe or a batch of probes.
+
+        Each match is a dict with userId and distance, closest first. Matches
+        further than tolerance are dropped; pass tolerance=None to keep all.
+        A single 1-D probe returns one list, a 2-D batch returns a list of lists.
+        """
+        single = np.ndim(probes) == 1
+        with self._lock:
+            user_ids = list(self.user_ids)
+            dist = self.distances(probes)
+
+        results = top_k_matches(dist, user_ids, k, tolerance)
+        return results[0] if single else results
+
+    def _grow(self):
+        capacity = len(self._matrix) * 2
+        matrix = np.empty((capacity, ENCODING_SIZE), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._matrix = matrix
+        self._sq_norms = sq_norms
+
+
+def create_face_index(kind=None):
+    """Create an empty face index of the configured type"""
+    kind = kind or FACE_INDEX_TYPE
+    if kind == 'exact':
+        from backend.services.face_snapshot import SnapshotFaceMatcher
+        return SnapshotFaceMatcher()
+    if kind == 'ivf':
+        from backend.services.face_index import IVFFaceIndex
+        return IVFFaceIndex()
+    raise ValueError(f"Unknown face index type: {kind}")
+
+
+def face_index_path(kind=None):
+    """Location of the persisted index under data/db/"""
+    kind = kind or FACE_INDEX_TYPE
+    if kind == 'exact':
+        return os.path.join(DB_DIR, 'face_gallery.snapshot')
+    return os.path.join(DB_DIR, f"face_index_{kind}.npz")
+
+
+def catch_up_face_index(index, firestore_db):
+    """Apply face_encodings documents changed since the index's high-water mark"""
+    # Documents written before updatedAt existed are already in the saved index
+    since = index.high_water_mark or datetime(1970, 1, 1, tzinfo=timezone.utc)
+    docs = list(firestore_db.collection('face_encodings').where('updatedAt', '>', since).stream())
+
+    for doc in docs:
+        data = doc.to_dict()
+        encoding = encoding_from_doc(data)
+        if encoding is None:
+            index.remove(data.get('userId', doc.id))
+        else:
+            index.add(data.get('userId', doc.id), encoding)
+
+    index.high_water_mark = latest_update(docs, since=index.high_water_mark)
+    return len(docs)
+
+
+def get_face_matcher():
+    """Return the process-wide face index, loading it on first use.
+
+    A saved index under data/db/ is opened (memory-mapped for the exact
+    gallery) and only documents changed since it was written are fetched;
+    otherwise the index is built from Firestore and saved for the next start.
+    """
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None:
+            matcher = create_face_index()
+            path = face_index_path()
+            if os.path.exists(path):
+                matcher.load_file(path)
+                changed = catch_up_face_index(matcher, db) if db is not None else 0
+                logger.info(f"Opened {path} with {len(matcher)} face encodings, {changed} changed since")
+            elif db is not None:
+                matcher.load_from_firestore(db)
+                matcher.save(path)
+            _matcher = matcher
+        return _matcher
+
+
+def find_duplicate_face(user_id, encoding, tolerance=DUPLICATE_FACE_TOLERANCE, matcher=None):
+    """The closest other user enrolled with this face, or None.
+
+    Checks the global index unless another matcher is given.
+    """
+    matcher = matcher if matcher is not None else get_face_matcher()
+    for match in matcher.match(encoding, k=2, tolerance=tolerance):
+        if match['userId'] != user_id:
+            return match
+    return None
+
+
+def check_duplicate_face(user_id, encoding):
+    """Raise DuplicateFaceError if another user is enrolled with this face"""
+    match = find_duplicate_face(user_id, encoding)
+    if match is not None:
+        raise DuplicateFaceError(f"Face is already registered to user {match['userId']}")
+
+
+def rebuild_face_index():
+    """Rebuild the index from Firestore and overwrite the saved copy"""
+    global _matcher
+    matcher = create_face_index()
+    if db is not None:
+        matcher.load_from_firestore(db)
+    matcher.save(face_index_path())
+    with _matcher_lock:
+        _matcher = matcher
+    return matcher
+
+
+def update_face_matcher(user_id, encoding):
+    """Keep an already loaded index in sync after a face registration"""
+    if _matcher is not None:
+        _matcher.add(user_id, encoding)
+        _schedule_save()
+
+
+def delete_face_encoding(firestore_db, user_id):
+    """Replace a user's encoding with a tombstone and drop it from the index"""
+    # Face encodings live in Firestore even when users are stored in SQLite
+    if firestore_db is not None:
+        firestore_db.collection('face_encodings').document(user_id).set(face_encoding_tombstone(user_id))
+    remove_from_face_matcher(user_id)
+
+
+def remove_from_face_matcher(user_id):
+    """Drop a user from an already loaded index"""
+    if _matcher is not None and _matcher.remove(user_id):
+        _schedule_save()
+
+
+def _schedule_save():
+    """Write the index back to disk once a burst of changes has settled"""
+    global _save_timer
+    with _matcher_lock:
+        if _save_timer is not None:
+            return
+        _save_timer = threading.Timer(INDEX_SAVE_DELAY_SECONDS, _save_now)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def _save_now():
+    global _save_timer
+    with _matcher_lock:
+        _save_timer = None
+        matcher = _matcher
+    if matcher is not None:
+        try:
+            matcher.save(face_index_path())
+        except Exception as e:
+            logger.error(f"Error saving face index: {str(e)}")
+
+
+# --- Class-scoped session galleries ---
+# A lecture only needs the encodings of the ~60 students timetabled for it, so
+# each running session gets its own small matcher instead of the college-wide one.
+
+# Galleries unused this long are dropped (a lecture nobody ended), and at most
+# this many are kept, least recently used out first
+SESSION_GALLERY_TTL_SECONDS = int(os.environ.get('SESSION_GALLERY_TTL_SECONDS', 3 * 60 * 60))
+MAX_SESSION_GALLERIES = int(os.environ.get('MAX_SESSION_GALLERIES', 200))
+
+_session_galleries = OrderedDict()  # sessionId -> (last used, session)
+_session_lock = threading.Lock()
+
+
+def _cached_session(session_id):
+    """A loaded session, marked as recently used; the caller holds _session_lock"""
+    cached = _session_galleries.get(session_id)
+    if cached is None:
+        return None
+    now = time.monotonic()
+    if now - cached[0] > SESSION_GALLERY_TTL_SECONDS:
+        del _session_galleries[session_id]
+        return None
+    _session_galleries[session_id] = (now, cached[1])
+    _session_galleries.move_to_end(session_id)
+    return cached[1]
+
+
+def _store_session(session_id, session):
+    """Keep a loaded session unless another thread won; the caller holds _session_lock"""
+    existing = _cached_session(session_id)
+    if existing is not None:
+        return existing
+    now = time.monotonic()
+    _session_galleries[session_id] = (now, session)
+    # Oldest first, so expired sessions are all at the front
+    while _session_galleries:
+        oldest_id, (last_used, _) = next(iter(_session_galleries.items()))
+        if len(_session_galleries) <= MAX_SESSION_GALLERIES and now - last_used <= SESSION_GALLERY_TTL_SECONDS:
+            break
+        del _session_galleries[oldest_id]
+        logger.info(f"Evicted idle session gallery {oldest_id}")
+    return session
+
+
+def load_session_gallery(session_id, timetable_id):
+    """Preload the encodings of the students in a timetable entry's class.
+
+    Returns the session dict, or None if the timetable entry does not exist.
+    Loading an already running session returns it unchanged.
+    """
+    with _session_lock:
+        session = _cached_session(session_id)
+    if session is not None:
+        return session
+
+    repository = get_repository()
+    entry = repository.get_timetable_entry(timetable_id)
+    if entry is None:
+        return None
+
+    students = repository.list_students(entry['branchId'], entry['year'], entry['division'])
+    roster = {}
+    for student_data in students:
+        roster[student_data['id']] = {
+            'studentId': student_data.get('studentId'),
+            'name': student_data.get('name')
+        }
+
+    if db is not None:
+        # One batched read for all encodings instead of a get per student
+        refs = [db.collection('face_encodings').document(user_id) for user_id in roster]
+        rows = encoding_rows(db.get_all(refs)) if refs else []
+    else:
+        # Without Firestore the local index holds the only copy of the encodings
+        rows = get_face_matcher().rows_for(roster)
+    gallery = FaceMatcher()
+    gallery.load(rows)
+
+    session = {
+        'sessionId': session_id,
+        'timetableId': timetable_id,
+        'timetableEntry': entry,
+        'roster': roster,
+        'gallery': gallery
+    }
+    with _session_lock:
+        session = _store_session(session_id, session)
+
+    logger.info(f"Loaded session gallery {session_id}: {len(rows)} of {len(roster)} students enrolled")
+    return session
+
+
+def get_session_gallery(session_id):
+    """Return a running session, or None.
+
+    A session started on another worker process, or evicted here while its
+    lecture is still running, is reloaded from its attendance_sessions record.
+    """
+    with _session_lock:
+        session = _cached_session(session_id)
+    if session is not None or db is None:
+        return session
+
+    record = db.collection('attendance_sessions').document(session_id).get()
+    data = record.to_dict() if record.exists else None
+    if not data or data.get('endedAt') or not data.get('timetableId'):
+        return None
+    return load_session_gallery(session_id, data['timetableId'])
+
+
+def evict_session_gallery(session_id):
+    """Free a session's gallery when its lecture ends; returns False if unknown"""
+    with _session_lock:
+        cached = _session_galleries.pop(session_id, None)
+    if cached is None:
+        return False
+    logger.info(f"Evicted session gallery {session_id}")
+    return True
+
+
+# --- Live gallery updates ---
+def start_face_gallery_watch():
+    """Subscribe to face_encodings and apply changes to the loaded galleries in place.
+
+    The listener only covers documents updated after the index's high-water
+    mark, so subscribing does not re-download the whole collection.
+    """
+    global _watch
+    if db is None or _watch is not None:
+        return
+    matcher = get_face_matcher()
+    since = matcher.high_water_mark or datetime(1970, 1, 1, tzinfo=timezone.utc)
+    query = db.collection('face_encodings').where('updatedAt', '>', since)
+    _watch = query.on_snapshot(_on_face_encodings_snapshot)
+    logger.info("Watching face_encodings for changes")
+
+
+def stop_face_gallery_watch():
+    """Unsubscribe the face_encodings listener"""
+    global _watch
+    if _watch is not None:
+        _watch.unsubscribe()
+        _watch = None
+
+
+def _on_face_encodings_snapshot(doc_snapshots, changes, read_time):
+    """Apply adds, re-registrations and deletes from the listener"""
+    try:
+        matcher = _matcher
+        for change in changes:
+            doc = change.document
+            data = doc.to_dict() or {}
+            user_id = data.get('userId', doc.id)
+            # Removed from the query means the document itself was deleted
+            encoding = None if change.type.name == 'REMOVED' else encoding_from_doc(data)
+
+            if encoding is None:
+                remove_from_face_matcher(user_id)
+            else:
+                update_face_matcher(user_id, encoding)
+            _apply_to_sessions(user_id, encoding)
+
+            updated_at = data.get('updatedAt')
+            if matcher is not None and updated_at is not None and (
+                    matcher.high_water_mark is None or updated_at > matcher.high_water_mark):
+                matcher.high_water_mark = updated_at
+    except Exception as e:
+        logger.error(f"Error applying face_encodings changes: {str(e)}")
+
+
+def _apply_to_sessions(user_id, encoding):
+    """Keep running session galleries fresh when one of their students re-registers"""
+    with _session_lock:
+        sessions = [session for _, session in _session_galleries.values() if user_id in session['roster']]
+    for session in sessions:
+        if encoding is None:
+            session['gallery'].remove(user_id)
+        else:
+            session['gallery'].add(user_id, encoding)
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import struct
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from backend.services.face_recognition_service import (
+    DEFAULT_TOLERANCE,
+    ENCODING_SIZE,
+    FaceMatcher,
+    encoding_rows,
+    latest_update,
+    top_k_matches,
+)
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Snapshot layout: magic, uint64 metadata length, JSON metadata (user ids,
+# count, high-water mark), padding to a 64-byte boundary, the float32
+# encoding matrix and then its float32 squared row norms. Everything is in
+# one file so a new snapshot can replace the old one atomically.
+SNAPSHOT_MAGIC = b'FGSNAP01'
+SNAPSHOT_ALIGNMENT = 64
+
+
+def write_snapshot(path, user_ids, matrix, high_water_mark=None):
+    """Atomically write the gallery snapshot file"""
+    matrix = np.ascontiguousarray(matrix, dtype='<f4').reshape(-1, ENCODING_SIZE)
+    sq_norms = np.einsum('ij,ij->i', matrix, matrix).astype('<f4')
+    meta = json.dumps({
+        'count': len(user_ids),
+        'userIds': list(user_ids),
+        'highWaterMark': high_water_mark.isoformat() if high_water_mark else None
+    }).encode('utf-8')
+
+    header = SNAPSHOT_MAGIC + struct.pack('<Q', len(meta)) + meta
+    header += b'\0' * (-len(header) % SNAPSHOT_ALIGNMENT)
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(matrix.tobytes())
+        f.write(sq_norms.tobytes())
+    # Processes that already mapped the old file keep their pages
+    os.replace(tmp_path, path)
+
+
+def open_snapshot(path):
+    """Map a snapshot read-only; returns (user_ids, matrix, sq_norms, high_water_mark)"""
+    with open(path, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a face gallery snapshot")
+        meta_len, = struct.unpack('<Q', f.read(8))
+        meta = json.loads(f.read(meta_len).decode('utf-8'))
+
+    count = meta['count']
+    offset = len(SNAPSHOT_MAGIC) + 8 + meta_len
+    offset += -offset % SNAPSHOT_ALIGNMENT
+    if count == 0:
+        matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        sq_norms = np.empty(0, dtype=np.float32)
+    else:
+        matrix = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(count, ENCODING_SIZE))
+        sq_norms = np.memmap(path, dtype='<f4', mode='r', offset=offset + matrix.nbytes, shape=(count,))
+
+    high_water_mark = meta.get('highWaterMark')
+    high_water_mark = datetime.fromisoformat(high_water_mark) if high_water_mark else None
+    return meta['userIds'], matrix, sq_norms, high_water_mark
+
+
+class SnapshotFaceMatcher:
+    """Exact face matcher over a memory-mapped snapshot plus a small overlay.
+
+    The snapshot matrix is mapped read-only so every worker process shares
+    the same pages. Encodings added or replaced after the snapshot live in a
+    private FaceMatcher overlay, and replaced or removed snapshot rows are
+    masked out instead of copying the mapped matrix.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.overlay = FaceMatcher(capacity=64)
+        self.high_water_mark = None
+        self._set_base([], np.empty((0, ENCODING_SIZE), dtype=np.float32), np.empty(0, dtype=np.float32))
+
+    def _set_base(self, user_ids, matrix, sq_norms):
+        self._base_ids = user_ids
+        self._base_rows = {user_id: row for row, user_id in enumerate(user_ids)}
+        self._base = matrix
+        self._base_sq_norms = sq_norms
+        self._dead = np.zeros(len(user_ids), dtype=bool)
+        self._dead_count = 0
+        self.overlay = FaceMatcher(capacity=64)
+
+    def __len__(self):
+        return len(self._base_ids) - self._dead_count + len(self.overlay)
+
+    def __contains__(self, user_id):
+        if user_id in self.overlay:
+            return True
+        row = self._base_rows.get(user_id)
+        return row is not None and not self._dead[row]
+
+    def load(self, rows):
+        """Replace the gallery with in-memory (userId, encoding) pairs"""
+        matcher = FaceMatcher()
+        matcher.load(rows)
+        matrix = matcher.encodings
+        with self._lock:
+            self._set_base(list(matcher.user_ids), matrix, np.einsum('ij,ij->i', matrix, matrix))
+
+    def load_from_firestore(self, firestore_db):
+        """Load every document of the face_encodings collection"""
+        docs = list(firestore_db.collection('face_encodings').stream())
+        rows = encoding_rows(docs)
+        self.load(rows)
+        self.high_water_mark = latest_update(docs)
+        logger.info(f"Loaded {len(rows)} face encodings into the matcher")
+
+    def load_file(self, path):
+        """Memory-map a snapshot written by save"""
+        user_ids, matrix, sq_norms, high_water_mark = open_snapshot(path)
+        with self._lock:
+            self._set_base(user_ids, matrix, sq_norms)
+            self.high_water_mark = high_water_mark
+
+    def save(self, path):
+        """Write the live encodings, overlay included, as a new snapshot"""
+        with self._lock:
+            live = ~self._dead
+            user_ids = [user_id for user_id, alive in zip(self._base_ids, live) if alive]
+            user_ids.extend(self.overlay.user_ids)
+            matrix = np.concatenate([np.asarray(self._base)[live], self.overlay.encodings])
+            high_water_mark = self.high_water_mark
+        write_snapshot(path, user_ids, matrix, high_water_mark)
+
+    def add(self, user_id, encoding):
+        """Insert or replace the encoding for a user"""
+        with self._lock:
+            self._kill_base_row(user_id)
+            self.overlay.add(user_id, encoding)
+
+    def remove(self, user_id):
+        """Remove a user's encoding; returns False if the user was not enrolled"""
+        with self._lock:
+            removed = self._kill_base_row(user_id)
+            return self.overlay.remove(user_id) or removed
+
+    def rows_for(self, user_ids):
+        """(userId, encoding) pairs for those of user_ids that are enrolled"""
+        rows = []
+        with self._lock:
+            for user_id in user_ids:
+                if user_id in self.overlay:
+                    rows.extend(self.overlay.rows_for([user_id]))
+                    continue
+                row = self._base_rows.get(user_id)
+                if row is not None and not self._dead[row]:
+                    rows.append((user_id, np.array(self._base[row])))
+        return rows
+
+    def _kill_base_row(self, user_id):
+        row = self._base_rows.get(user_id)
+        if row is None or self._dead[row]:
+            return False
+        self._dead[row] = True
+        self._dead_count += 1
+        return True
+
+    def match(self, probes, k=1, tolerance=DEFAULT_TOLERANCE):
+        """Top-k matches across the snapshot and the overlay, same shape as FaceMatcher.match"""
+        single = np.ndim(probes) == 1
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+        with self._lock:
+            # ||p - e||^2 = ||p||^2 + ||e||^2 - 2 p.e over the mapped matrix
+            sq = probes @ self._base.T
+            sq *= -2.0
+            sq += self._base_sq_norms
+            sq += np.einsum('ij,ij->i', probes, probes)[:, None]
+            np.maximum(sq, 0.0, out=sq)
+            dist = np.sqrt(sq, out=sq)
+            if self._dead_count:
+                dist[:, self._dead] = np.inf
+
+            user_ids = self._base_ids
+            if len(self.overlay):
+                user_ids = user_ids + self.overlay.user_ids
+                dist = np.concatenate([dist, self.overlay.distances(probes)], axis=1)
+
+        results = top_k_matches(dist, user_ids, k, tolerance)
+        return results[0] if single else results
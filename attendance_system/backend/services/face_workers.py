@@ -0,0 +1,351 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from backend.utils.cache import LRUCache
+from backend.utils.file_handler import MAX_IMAGE_SIDE, decode_image_bytes, downscale_image
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# One worker per core by default; dlib encoding is CPU bound
+FACE_WORKERS = int(os.environ.get('FACE_WORKERS', os.cpu_count() or 1))
+
+# Submissions beyond this many unfinished jobs are rejected instead of queued
+MAX_PENDING_JOBS = int(os.environ.get('FACE_MAX_PENDING_JOBS', FACE_WORKERS * 16))
+
+# Finished jobs are kept this long so clients can poll for the result
+JOB_RESULT_TTL_SECONDS = 600
+
+# on_result callbacks (such as saving an encoding to Firestore) run on these
+# threads, never on the executor's result-collection thread
+RESULT_CALLBACK_THREADS = int(os.environ.get('FACE_RESULT_CALLBACK_THREADS', 4))
+
+# HOG detection cost grows with pixel count, so faces are located on a copy
+# no larger than this and the boxes mapped back for full-resolution encoding.
+# Group photos keep more resolution because their faces are much smaller.
+DETECT_SIDE = int(os.environ.get('FACE_DETECT_SIDE', 640))
+GROUP_DETECT_SIDE = int(os.environ.get('FACE_GROUP_DETECT_SIDE', 1600))
+DETECT_UPSAMPLE = int(os.environ.get('FACE_DETECT_UPSAMPLE', 1))
+
+# Each upsampling level roughly quadruples detection time, so requests may
+# not ask for more than this
+MAX_DETECT_UPSAMPLE = int(os.environ.get('FACE_MAX_DETECT_UPSAMPLE', 3))
+
+# Students on bad connections resend the same capture; results for identical
+# image bytes are reused for a short time instead of re-running detection
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('FACE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('FACE_CACHE_TTL_SECONDS', 120))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class FaceDetectionError(ValueError):
+    """Raised by a worker when the image does not contain a usable face"""
+
+
+class PoolBusyError(RuntimeError):
+    """Raised when the job queue is full"""
+
+
+# --- Worker-side functions (run inside the pool processes) ---
+def _init_worker():
+    """Load the dlib models once per worker process"""
+    import face_recognition  # noqa: F401 - importing loads the models
+
+
+def _timed(fn, args):
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def locate_faces(image_np, detect_side=DETECT_SIDE, upsample=DETECT_UPSAMPLE):
+    """Detect faces on a downscaled copy; boxes are returned in full-resolution coordinates"""
+    import face_recognition
+    small, scale = downscale_image(image_np, detect_side)
+    face_locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample)
+    if scale == 1.0:
+        return face_locations
+
+    height, width = image_np.shape[:2]
+    return [
+        (max(int(top / scale), 0), min(int(right / scale), width),
+         min(int(bottom / scale), height), max(int(left / scale), 0))
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def encode_single_face(image_bytes):
+    """Decode an image and return the encoding of its only face"""
+    import face_recognition
+    image_np = decode_image_bytes(image_bytes)
+
+    face_locations = locate_faces(image_np)
+    if len(face_locations) == 0:
+        raise FaceDetectionError("No face was detected in the image. Please try again.")
+    if len(face_locations) > 1:
+        raise FaceDetectionError("Multiple faces were detected. Please ensure only one person is in the frame.")
+
+    return face_recognition.face_encodings(image_np, face_locations)[0]
+
+
+def encode_all_faces(image_bytes, upsample=DETECT_UPSAMPLE, detect_side=GROUP_DETECT_SIDE):
+    """Decode an image and return (locations, encodings) for every face in it"""
+    import face_recognition
+    image_np = decode_image_bytes(image_bytes, max_side=max(detect_side, MAX_IMAGE_SIDE))
+    face_locations = locate_faces(image_np, detect_side=detect_side, upsample=upsample)
+    if len(face_locations) == 0:
+        return [], []
+    # One call encodes every face in the image
+    return face_locations, face_recognition.face_encodings(image_np, face_locations)
+
+
+def image_cache_key(fn, image_bytes, *args):
+    """Cache key for running fn on these exact image bytes with these arguments"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{fn.__name__}:{digest}:{args}"
+
+
+# --- Pool ---
+class FaceWorkerPool:
+    """Bounded process pool for face detection and encoding with job tracking"""
+
+    def __init__(self, workers=FACE_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        self._callbacks = ThreadPoolExecutor(max_workers=RESULT_CALLBACK_THREADS,
+                                             thread_name_prefix='face-results')
+        # Jobs that drive other jobs run here one at a time, so two of them
+        # cannot fill the queue between them
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='face-background')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._inflight = {}   # cache_key -> job whose worker is computing it
+        self._started_at = time.time()
+        self._busy_seconds = 0.0
+        self._completed = 0
+        self._failed = 0
+        self.result_cache = LRUCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS)
+
+    def submit(self, fn, *args, on_result=None, kind=None, cache_key=None):
+        """Queue fn(*args) on a worker and return the job id.
+
+        on_result runs on a callback thread in this process with the worker's
+        return value; its return value becomes the job result. With a cache_key, a recent
+        result for the same key completes the job without using a worker, and
+        a submit while the same key is still running joins that job's worker
+        instead of queueing the work again.
+        """
+        cached = self.result_cache.get(cache_key) if cache_key else None
+        with self._lock:
+            self._expire_jobs()
+            running = self._inflight.get(cache_key) if cache_key and cached is None else None
+            if running is not None and on_result is None:
+                # A retry or double submit of work that is still running
+                return running['jobId']
+            if running is None and self._pending_count() >= self.max_pending:
+                raise PoolBusyError("Face processing queue is full, please retry shortly")
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'jobId': job_id,
+                'kind': kind or fn.__name__,
+                'submittedAt': time.time(),
+                'worker_future': None,
+                'future': Future(),
+                'finishedAt': None
+            }
+            self._jobs[job_id] = job
+            if cached is not None:
+                job['cached'] = True
+                job['worker_future'] = _cached_future(cached)
+            elif running is not None:
+                # Same work, but this caller's on_result must still run
+                job['shared'] = True
+                job['worker_future'] = running['worker_future']
+            else:
+                job['worker_future'] = self._executor.submit(_timed, fn, args)
+                if cache_key:
+                    self._inflight[cache_key] = job
+
+        store_key = cache_key if cached is None and running is None else None
+        job['worker_future'].add_done_callback(lambda f: self._dispatch(job, f, on_result, store_key))
+        return job_id
+
+    def submit_local(self, fn, *args, kind=None):
+        """Run fn(*args) on a thread in this process and return the job id.
+
+        For work such as a bulk enrollment that submits its own jobs to the
+        workers, so cannot run inside one. The job is polled like any other
+        but does not count towards max_pending; the jobs it submits do.
+        """
+        with self._lock:
+            self._expire_jobs()
+            job_id = uuid.uuid4().hex
+            job = {
+                'jobId': job_id,
+                'kind': kind or fn.__name__,
+                'submittedAt': time.time(),
+                'worker_future': self._background.submit(_timed, fn, args),
+                'future': Future(),
+                'finishedAt': None,
+                'local': True
+            }
+            self._jobs[job_id] = job
+        job['worker_future'].add_done_callback(lambda f: self._dispatch(job, f, None, None))
+        return job_id
+
+    def _dispatch(self, job, worker_future, on_result, cache_key):
+        if cache_key:
+            # Cache before leaving the in-flight map so a retry always finds one
+            self._cache_result(cache_key, worker_future)
+            with self._lock:
+                if self._inflight.get(cache_key) is job:
+                    del self._inflight[cache_key]
+        # Done callbacks run on the executor's management thread; anything
+        # slow there stalls result collection and dispatch for every job
+        if on_result is None:
+            self._finish(job, worker_future, None)
+            return
+        try:
+            self._callbacks.submit(self._finish, job, worker_future, on_result)
+        except RuntimeError:
+            # The callback pool is shut down; finish here rather than hang the job
+            self._finish(job, worker_future, on_result)
+
+    def _finish(self, job, worker_future, on_result):
+        future = job['future']
+        try:
+            result, started, finished = worker_future.result()
+            if not job.get('shared') and not job.get('local'):
+                with self._lock:
+                    self._busy_seconds += finished - started
+            if on_result is not None:
+                result = on_result(result)
+            future.set_result(result)
+            with self._lock:
+                self._completed += 1
+        except Exception as e:
+            future.set_exception(e)
+            with self._lock:
+                self._failed += 1
+        finally:
+            job['finishedAt'] = time.time()
+
+    def _cache_result(self, cache_key, worker_future):
+        """Remember a worker result, or a no-usable-face error, for retries"""
+        error = worker_future.exception()
+        if error is None:
+            result = worker_future.result()[0]
+            self.result_cache.set(cache_key, ('ok', result))
+        elif isinstance(error, FaceDetectionError):
+            self.result_cache.set(cache_key, ('error', error))
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job finishes and return its result or raise its error"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job['future'].result(timeout=timeout)
+
+    def status(self, job_id, wait=None):
+        """Job status dict, optionally waiting up to wait seconds; None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        future = job['future']
+        if wait and not future.done():
+            try:
+                future.exception(timeout=wait)
+            except Exception:
+                pass
+
+        status = {'jobId': job_id, 'kind': job['kind'], 'cached': job.get('cached', False)}
+        if future.done():
+            error = future.exception()
+            if error is None:
+                status['status'] = 'done'
+                status['result'] = future.result()
+            else:
+                status['status'] = 'failed'
+                status['error'] = str(error)
+        elif job['worker_future'].running():
+            status['status'] = 'running'
+        else:
+            status['status'] = 'queued'
+        return status
+
+    def stats(self):
+        """Queue depth and worker utilisation for sizing the pool"""
+        with self._lock:
+            # Jobs that joined an in-flight capture share one worker future
+            waiting = {id(job['worker_future']): job['worker_future'] for job in self._jobs.values()
+                       if not job['future'].done() and not job['worker_future'].done() and not job.get('local')}
+            # The executor marks the one call it has queued ahead of the
+            # workers as running too, so cap at the number of workers
+            running = min(sum(1 for future in waiting.values() if future.running()), self.workers)
+            uptime = max(time.time() - self._started_at, 1e-9)
+            return {
+                'workers': self.workers,
+                'maxPending': self.max_pending,
+                'running': running,
+                'queued': len(waiting) - running,
+                'completed': self._completed,
+                'failed': self._failed,
+                'utilisation': round(self._busy_seconds / (uptime * self.workers), 4),
+                'resultCache': self.result_cache.stats()
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._callbacks.shutdown(wait=False)
+        self._background.shutdown(wait=False, cancel_futures=True)
+
+    def _pending_count(self):
+        return sum(1 for job in self._jobs.values() if not job['future'].done() and not job.get('local'))
+
+    def _expire_jobs(self):
+        cutoff = time.time() - JOB_RESULT_TTL_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finishedAt'] is not None and job['finishedAt'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def _cached_future(cached):
+    """Already completed worker future carrying a cached outcome"""
+    future = Future()
+    outcome, value = cached
+    if outcome == 'ok':
+        future.set_result((value, 0.0, 0.0))
+    else:
+        future.set_exception(value)
+    return future
+
+
+def get_face_worker_pool():
+    """Return the process-wide worker pool, starting it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = FaceWorkerPool()
+            logger.info(f"Started face worker pool with {_pool.workers} workers")
+        return _pool
+
+
+def start_face_workers():
+    """Start the pool and warm every worker before the app opens any connections"""
+    pool = get_face_worker_pool()
+    for _ in range(pool.workers):
+        pool._executor.submit(time.sleep, 0)
+    return pool
@@ -0,0 +1,53 @@
+import logging
+import os
+import threading
+
+from backend.utils.database import get_repository
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# The counters are recounted from scratch this often to repair drift from
+# writes that bypass the repository, such as the seed script
+STATS_RECONCILE_INTERVAL_SECONDS = int(os.environ.get('STATS_RECONCILE_INTERVAL_SECONDS', 6 * 3600))
+
+_reconciler = None
+_stop_reconciler = threading.Event()
+
+
+def get_stats():
+    """Dashboard totals from the maintained counters"""
+    return get_repository().read_counters()
+
+
+def reconcile_stats():
+    """Recount every total and add any drift to the counters as a correction"""
+    totals = get_repository().reconcile_counters()
+    logger.info(f"Reconciled stats counters: {totals}")
+    return totals
+
+
+def _reconcile_loop():
+    # Reconcile once at startup so counters exist for data seeded directly
+    while True:
+        try:
+            reconcile_stats()
+        except Exception as e:
+            logger.error(f"Error reconciling stats counters: {str(e)}")
+        if _stop_reconciler.wait(STATS_RECONCILE_INTERVAL_SECONDS):
+            return
+
+
+def start_stats_reconciler():
+    """Run reconcile_stats in a daemon thread now and then periodically"""
+    global _reconciler
+    if _reconciler is not None and _reconciler.is_alive():
+        return _reconciler
+    _stop_reconciler.clear()
+    _reconciler = threading.Thread(target=_reconcile_loop, name='stats-reconciler', daemon=True)
+    _reconciler.start()
+    return _reconciler
+
+
+def stop_stats_reconciler():
+    _stop_reconciler.set()
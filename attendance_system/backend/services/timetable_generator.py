@@ -0,0 +1,266 @@
+import logging
+import random
+import re
+import time
+
+from backend.services.timetable_grid import DAYS, LECTURES_PER_DAY
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+SLOTS = len(DAYS) * LECTURES_PER_DAY
+ALL_SLOTS = (1 << SLOTS) - 1
+DAY_MASK = (1 << LECTURES_PER_DAY) - 1
+
+# Wall-clock budget for improving on the first schedule with restarts
+GENERATOR_TIME_LIMIT_SECONDS = 5
+
+# Branch ids are stored as CSE_Y2_A
+BRANCH_ID_PATTERN = re.compile(r'_Y(\d+)_([^_]+)$')
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def class_from_branch_id(branch_id):
+    """(year, division) encoded in a branch id such as CSE_Y2_A"""
+    match = BRANCH_ID_PATTERN.search(branch_id)
+    if not match:
+        raise ValueError(f"Cannot read year and division from branch id: {branch_id}")
+    return int(match.group(1)), match.group(2)
+
+
+class TimetableSolver:
+    """Clash-free weekly schedule built on 48-bit slot masks.
+
+    Each class, teacher and room has a mask of booked slots and each slot a
+    mask of free rooms, so the slots open to a lecture are one AND of three
+    masks. Lectures are placed most-constrained first; when none is open,
+    the lecture blocking the class or teacher is moved elsewhere (a one-step
+    ejection chain). Restarts with a shuffled order keep the best result.
+    """
+
+    def __init__(self, rooms, fixed_masks=None, blocked_slots=0):
+        self.rooms = list(rooms)
+        fixed_masks = fixed_masks or {}
+        self.fixed_class = dict(fixed_masks.get('class', {}))
+        self.fixed_teacher = dict(fixed_masks.get('teacher', {}))
+        fixed_rooms = fixed_masks.get('room', {})
+        all_rooms = (1 << len(self.rooms)) - 1
+        self.fixed_slot_rooms = [all_rooms] * SLOTS
+        for index, room in enumerate(self.rooms):
+            for slot in _bits(fixed_rooms.get(room, 0)):
+                self.fixed_slot_rooms[slot] &= ~(1 << index)
+        self.open_slots = ALL_SLOTS & ~blocked_slots
+
+    def solve(self, lectures, time_limit=GENERATOR_TIME_LIMIT_SECONDS, seed=0):
+        """Place (classKey, courseCode, teacherId) lectures.
+
+        Returns (placements, unscheduled) where placements are
+        (lecture, slot, room) tuples and unscheduled are lecture tuples.
+        """
+        rng = random.Random(seed)
+        deadline = time.monotonic() + time_limit
+
+        teacher_load = {}
+        class_load = {}
+        for class_key, _, teacher_id in lectures:
+            teacher_load[teacher_id] = teacher_load.get(teacher_id, 0) + 1
+            class_load[class_key] = class_load.get(class_key, 0) + 1
+        order = sorted(lectures, key=lambda lecture: (-teacher_load[lecture[2]], -class_load[lecture[0]]))
+
+        # Lectures beyond a teacher's or class's open slots can never be placed
+        open_count = bin(self.open_slots).count('1')
+        floor = max(
+            sum(max(0, load - open_count + bin(self.fixed_teacher.get(teacher_id, 0) & self.open_slots).count('1'))
+                for teacher_id, load in teacher_load.items()),
+            sum(max(0, load - open_count + bin(self.fixed_class.get(class_key, 0) & self.open_slots).count('1'))
+                for class_key, load in class_load.items())
+        )
+
+        best = None
+        attempt = 0
+        while True:
+            placements, unscheduled = self._attempt(order)
+            if best is None or len(unscheduled) < len(best[1]):
+                best = (placements, unscheduled)
+            attempt += 1
+            if len(best[1]) <= floor or time.monotonic() >= deadline:
+                break
+            # Keep the heavy lectures early but vary ties and near-ties
+            order = sorted(order, key=lambda lecture: (-teacher_load[lecture[2]] - rng.random() * 2,
+                                                       -class_load[lecture[0]]))
+        logger.info(f"Timetable solver placed {len(best[0])} lectures, "
+                    f"{len(best[1])} unscheduled after {attempt} attempts")
+        return best
+
+    def _attempt(self, order):
+        self.class_busy = dict(self.fixed_class)
+        self.teacher_busy = dict(self.fixed_teacher)
+        self.slot_rooms = list(self.fixed_slot_rooms)
+        self.rooms_open = 0       # slots with at least one free room
+        for slot in _bits(self.open_slots):
+            if self.slot_rooms[slot]:
+                self.rooms_open |= 1 << slot
+        self.course_days = {}     # (classKey, courseCode) -> mask of days used
+        self.course_day_count = {}  # (classKey, courseCode, day) -> lectures that day
+        self.home_room = {}       # classKey -> preferred room index
+        self.by_class_slot = {}   # (classKey, slot) -> placement id
+        self.by_teacher_slot = {} # (teacherId, slot) -> placement id
+        self.placed = {}          # placement id -> [lecture, slot, room index]
+
+        unscheduled = []
+        for placement_id, lecture in enumerate(order):
+            if not self._place(placement_id, lecture) and not self._repair(placement_id, lecture):
+                unscheduled.append(lecture)
+        placements = [(lecture, slot, self.rooms[room]) for lecture, slot, room in self.placed.values()]
+        return placements, unscheduled
+
+    def _candidates(self, lecture, exclude=0):
+        class_key, _, teacher_id = lecture
+        busy = self.class_busy.get(class_key, 0) | self.teacher_busy.get(teacher_id, 0) | exclude
+        return self.open_slots & ~busy & self.rooms_open
+
+    def _best_slot(self, lecture, candidates):
+        """Spread a course over different days and a class's day evenly"""
+        class_key, course_code, _ = lecture
+        used_days = self.course_days.get((class_key, course_code), 0)
+        class_busy = self.class_busy.get(class_key, 0)
+        best_slot = None
+        best_score = None
+        for slot in _bits(candidates):
+            day = slot // LECTURES_PER_DAY
+            score = (
+                bool(used_days >> day & 1),
+                bin(class_busy >> (day * LECTURES_PER_DAY) & DAY_MASK).count('1'),
+                slot % LECTURES_PER_DAY
+            )
+            if best_score is None or score < best_score:
+                best_slot, best_score = slot, score
+        return best_slot
+
+    def _book(self, placement_id, lecture, slot):
+        class_key, course_code, teacher_id = lecture
+        free_rooms = self.slot_rooms[slot]
+        room = self.home_room.get(class_key)
+        if room is None or not free_rooms >> room & 1:
+            room = (free_rooms & -free_rooms).bit_length() - 1
+            self.home_room.setdefault(class_key, room)
+        bit = 1 << slot
+        self.class_busy[class_key] = self.class_busy.get(class_key, 0) | bit
+        self.teacher_busy[teacher_id] = self.teacher_busy.get(teacher_id, 0) | bit
+        self.slot_rooms[slot] &= ~(1 << room)
+        if not self.slot_rooms[slot]:
+            self.rooms_open &= ~bit
+        day = slot // LECTURES_PER_DAY
+        key = (class_key, course_code)
+        self.course_days[key] = self.course_days.get(key, 0) | 1 << day
+        self.course_day_count[key + (day,)] = self.course_day_count.get(key + (day,), 0) + 1
+        self.by_class_slot[(class_key, slot)] = placement_id
+        self.by_teacher_slot[(teacher_id, slot)] = placement_id
+        self.placed[placement_id] = [lecture, slot, room]
+
+    def _unbook(self, placement_id):
+        lecture, slot, room = self.placed.pop(placement_id)
+        class_key, course_code, teacher_id = lecture
+        bit = 1 << slot
+        self.class_busy[class_key] &= ~bit
+        self.teacher_busy[teacher_id] &= ~bit
+        self.slot_rooms[slot] |= 1 << room
+        self.rooms_open |= bit
+        del self.by_class_slot[(class_key, slot)]
+        del self.by_teacher_slot[(teacher_id, slot)]
+        day = slot // LECTURES_PER_DAY
+        count_key = (class_key, course_code, day)
+        self.course_day_count[count_key] -= 1
+        if not self.course_day_count[count_key]:
+            self.course_days[(class_key, course_code)] &= ~(1 << day)
+        return lecture
+
+    def _place(self, placement_id, lecture):
+        candidates = self._candidates(lecture)
+        if not candidates:
+            return False
+        self._book(placement_id, lecture, self._best_slot(lecture, candidates))
+        return True
+
+    def _repair(self, placement_id, lecture):
+        """Free a slot for lecture by moving the one placement blocking it"""
+        class_key, _, teacher_id = lecture
+        class_busy = self.class_busy.get(class_key, 0)
+        teacher_busy = self.teacher_busy.get(teacher_id, 0)
+        # Slots blocked only by a movable placement of the teacher or the class
+        for slot in _bits(self.open_slots & self.rooms_open & (class_busy ^ teacher_busy)):
+            blocker = self.by_teacher_slot.get((teacher_id, slot)) if teacher_busy >> slot & 1 \
+                else self.by_class_slot.get((class_key, slot))
+            if blocker is None:
+                continue
+            blocked = self._unbook(blocker)
+            bit = 1 << slot
+            moved_to = self._candidates(blocked, exclude=bit)
+            if moved_to and self._candidates(lecture) & bit:
+                self._book(blocker, blocked, self._best_slot(blocked, moved_to))
+                if self._candidates(lecture) & bit:
+                    self._book(placement_id, lecture, slot)
+                    return True
+                self._unbook(blocker)
+            self._book(blocker, blocked, slot)
+        return False
+
+
+def lectures_from_request(classes):
+    """Expand [{branchId, courses: [{courseCode, teacherId, lecturesPerWeek}]}] into lecture tuples"""
+    lectures = []
+    for class_spec in classes:
+        branch_id = class_spec.get('branchId')
+        if not branch_id:
+            raise ValueError("Each class needs a branchId")
+        year, division = class_from_branch_id(branch_id)
+        class_key = (branch_id, int(class_spec.get('year', year)), class_spec.get('division', division))
+        for course in class_spec.get('courses') or []:
+            if not course.get('courseCode') or not course.get('teacherId'):
+                raise ValueError(f"Courses for {branch_id} need a courseCode and teacherId")
+            count = int(course.get('lecturesPerWeek', 1))
+            if count < 0:
+                raise ValueError("lecturesPerWeek cannot be negative")
+            lectures.extend([(class_key, course['courseCode'], course['teacherId'])] * count)
+    return lectures
+
+
+def generate_timetable(classes, rooms, fixed_masks=None, break_lectures=(), time_limit=GENERATOR_TIME_LIMIT_SECONDS):
+    """Build timetable entry dicts for every class; returns (entries, unscheduled)"""
+    lectures = lectures_from_request(classes)
+    blocked = 0
+    for lecture_number in break_lectures:
+        lecture_number = int(lecture_number)
+        if not 1 <= lecture_number <= LECTURES_PER_DAY:
+            raise ValueError(f"Break lecture must be between 1 and {LECTURES_PER_DAY}")
+        for day in range(len(DAYS)):
+            blocked |= 1 << (day * LECTURES_PER_DAY + lecture_number - 1)
+
+    solver = TimetableSolver(rooms, fixed_masks=fixed_masks, blocked_slots=blocked)
+    placements, unscheduled = solver.solve(lectures, time_limit=time_limit)
+
+    entries = []
+    for (class_key, course_code, teacher_id), slot, room in placements:
+        branch_id, year, division = class_key
+        entries.append({
+            'branchId': branch_id,
+            'year': year,
+            'division': division,
+            'day': DAYS[slot // LECTURES_PER_DAY],
+            'lectureNumber': slot % LECTURES_PER_DAY + 1,
+            'courseCode': course_code,
+            'teacherId': teacher_id,
+            'roomNumber': room
+        })
+    entries.sort(key=lambda entry: (entry['branchId'], DAYS.index(entry['day']), entry['lectureNumber']))
+    missing = [
+        {'branchId': class_key[0], 'courseCode': course_code, 'teacherId': teacher_id}
+        for class_key, course_code, teacher_id in unscheduled
+    ]
+    return entries, missing
@@ -0,0 +1,188 @@
+import logging
+import threading
+
+from backend.utils.database import add_timetable_listener, get_repository
+from backend.utils.watch import add_watch_handler
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')
+LECTURES_PER_DAY = 8
+
+# Breaks are stored with 'N/A' for the teacher and room; they never book either
+UNASSIGNED = 'N/A'
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def slot_bit(day, lecture_number):
+    """Bit for a day and 1-based lecture, or None when outside the week grid"""
+    if day not in DAYS:
+        return None
+    lecture_number = int(lecture_number)
+    if not 1 <= lecture_number <= LECTURES_PER_DAY:
+        return None
+    return 1 << (DAYS.index(day) * LECTURES_PER_DAY + lecture_number - 1)
+
+
+def _class_key(branch_id, year, division):
+    return (branch_id, int(year), division)
+
+
+class OccupancyGrid:
+    """One 48-bit occupancy mask per room, teacher and class.
+
+    Bit day * 8 + (lecture - 1) is set while any timetable entry books that
+    slot, so a clash check is three dict lookups and bit tests. A per-slot
+    count is kept alongside so deleting one of two overlapping entries (for
+    example data seeded before clash checks existed) leaves the bit set.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._entries = {}   # entryId -> (bit, room, teacher, class key)
+        self._masks = {'room': {}, 'teacher': {}, 'class': {}}
+        self._counts = {}    # (kind, key, bit) -> entries booking it
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries):
+        """Replace the grid with the given timetable dicts (with 'id')"""
+        with self._lock:
+            self._clear()
+            for entry in entries:
+                self._add(entry['id'], entry)
+
+    def add(self, entry_id, data):
+        with self._lock:
+            self._remove(entry_id)
+            self._add(entry_id, data)
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    def _bookings(self, room_number, teacher_id, class_key):
+        bookings = [('class', class_key)]
+        if room_number and room_number != UNASSIGNED:
+            bookings.append(('room', room_number))
+        if teacher_id and teacher_id != UNASSIGNED:
+            bookings.append(('teacher', teacher_id))
+        return bookings
+
+    def _add(self, entry_id, data):
+        try:
+            bit = slot_bit(data.get('day'), data.get('lectureNumber'))
+            class_key = _class_key(data.get('branchId'), data.get('year'), data.get('division'))
+        except (TypeError, ValueError):
+            bit = None
+        if bit is None:
+            logger.warning(f"Timetable entry {entry_id} is outside the week grid")
+            return
+        room_number, teacher_id = data.get('roomNumber'), data.get('teacherId')
+        self._entries[entry_id] = (bit, room_number, teacher_id, class_key)
+        for kind, key in self._bookings(room_number, teacher_id, class_key):
+            count_key = (kind, key, bit)
+            self._counts[count_key] = self._counts.get(count_key, 0) + 1
+            self._masks[kind][key] = self._masks[kind].get(key, 0) | bit
+
+    def _remove(self, entry_id):
+        booked = self._entries.pop(entry_id, None)
+        if booked is None:
+            return
+        bit, room_number, teacher_id, class_key = booked
+        for kind, key in self._bookings(room_number, teacher_id, class_key):
+            count_key = (kind, key, bit)
+            self._counts[count_key] -= 1
+            if self._counts[count_key]:
+                continue
+            del self._counts[count_key]
+            mask = self._masks[kind][key] & ~bit
+            if mask:
+                self._masks[kind][key] = mask
+            else:
+                del self._masks[kind][key]
+
+    def masks(self, kind):
+        """Copy of the occupancy masks for 'room', 'teacher' or 'class' keys"""
+        with self._lock:
+            return dict(self._masks[kind])
+
+    def clashes(self, day, lecture_number, room_number, teacher_id, branch_id, year, division):
+        """Same result as repository.find_timetable_clashes, or None if the slot is off the grid"""
+        bit = slot_bit(day, lecture_number)
+        if bit is None:
+            return None
+        with self._lock:
+            return {
+                'room': bool(self._masks['room'].get(room_number, 0) & bit),
+                'teacher': bool(self._masks['teacher'].get(teacher_id, 0) & bit),
+                'class': bool(self._masks['class'].get(_class_key(branch_id, year, division), 0) & bit)
+            }
+
+
+def get_timetable_grid():
+    """Return the process-wide grid, loading the whole timetable on first use"""
+    global _grid
+    with _grid_lock:
+        if _grid is None:
+            grid = OccupancyGrid()
+            grid.load(get_repository().list_timetable())
+            _grid = grid
+            logger.info(f"Loaded {len(grid)} timetable entries into the occupancy grid")
+        return _grid
+
+
+def find_clashes(day, lecture_number, room_number, teacher_id, branch_id, year, division):
+    """Room, teacher and class clashes for a slot, answered from the grid"""
+    clashes = get_timetable_grid().clashes(day, lecture_number, room_number, teacher_id, branch_id, year, division)
+    if clashes is None:
+        # Unknown day names are not in the grid; ask the database directly
+        return get_repository().find_timetable_clashes(
+            day, lecture_number, room_number, teacher_id, branch_id, year, division
+        )
+    return clashes
+
+
+def describe_clashes(clashes):
+    """Messages for each clash reported by find_clashes"""
+    details = []
+    if clashes['room']:
+        details.append("Room already occupied at this time")
+    if clashes['teacher']:
+        details.append("Teacher already assigned at this time")
+    if clashes['class']:
+        details.append("Course already scheduled for this class at this time")
+    return details
+
+
+def _on_timetable_write(entry_id, data):
+    """Repository write hook; data is None when the entry was deleted"""
+    if _grid is None:
+        return
+    if data is None:
+        _grid.remove(entry_id)
+    else:
+        _grid.add(entry_id, data)
+
+
+add_timetable_listener(_on_timetable_write)
+
+
+# --- Live updates from other processes ---
+def _load_from_watch(entries):
+    global _grid
+    with _grid_lock:
+        if _grid is None:
+            _grid = OccupancyGrid()
+        _grid.load(entries)
+    logger.info(f"Loaded {len(entries)} timetable entries into the occupancy grid")
+
+
+add_watch_handler('timetable', _load_from_watch, _on_timetable_write)
@@ -0,0 +1,150 @@
+import csv
+import io
+import logging
+import threading
+
+from firebase_admin import firestore
+
+from backend.services.timetable_grid import (
+    DAYS,
+    LECTURES_PER_DAY,
+    OccupancyGrid,
+    describe_clashes,
+    get_timetable_grid,
+)
+from backend.services.timetable_views import refresh_timetable_views
+from backend.utils.database import get_repository
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# CSV header and JSON keys of an imported timetable row
+TIMETABLE_FIELDS = ('branchId', 'year', 'division', 'day', 'lectureNumber', 'courseCode', 'teacherId', 'roomNumber')
+BREAK_FIELDS = ('branchId', 'year', 'division', 'day', 'lectureNumber', 'courseCode')
+
+# Imports are checked against the grid and then written; running two at once
+# in this process could let their rows clash with each other
+_import_lock = threading.Lock()
+
+
+def _truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def parse_timetable_csv(content):
+    """Rows of a CSV upload as dicts keyed by TIMETABLE_FIELDS"""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    rows = []
+    for row in csv.DictReader(io.StringIO(content)):
+        row = {(key or '').strip(): (value or '').strip() for key, value in row.items()}
+        if any(row.values()):
+            rows.append(row)
+    return rows
+
+
+def read_timetable_upload(req):
+    """Return (rows, atomic) from a Flask request.
+
+    Accepts a multipart CSV file in 'file' (with an optional 'atomic' form
+    field), a raw text/csv body, or JSON {"entries": [...], "atomic": true}.
+    An 'atomic' query parameter works for every form.
+    """
+    upload = req.files.get('file')
+    if upload is not None:
+        return parse_timetable_csv(upload.read()), _truthy(req.form.get('atomic', req.args.get('atomic')))
+
+    if req.mimetype == 'text/csv':
+        return parse_timetable_csv(req.get_data(cache=False)), _truthy(req.args.get('atomic'))
+
+    data = req.get_json(silent=True) or {}
+    return data.get('entries') or [], _truthy(data.get('atomic', req.args.get('atomic')))
+
+
+def timetable_entry_from_row(row):
+    """Validated timetable document for one imported row; raises ValueError"""
+    is_break = row.get('courseCode') == 'BREAK'
+    for field in BREAK_FIELDS if is_break else TIMETABLE_FIELDS:
+        if not row.get(field):
+            raise ValueError(f"Missing required field: {field}")
+
+    if row['day'] not in DAYS:
+        raise ValueError(f"Unknown day: {row['day']}")
+    try:
+        year = int(row['year'])
+        lecture_number = int(row['lectureNumber'])
+    except (TypeError, ValueError):
+        raise ValueError("Year and lecture number must be whole numbers")
+    if not 1 <= lecture_number <= LECTURES_PER_DAY:
+        raise ValueError(f"Lecture number must be between 1 and {LECTURES_PER_DAY}")
+
+    return {
+        'branchId': row['branchId'],
+        'year': year,
+        'division': row['division'],
+        'day': row['day'],
+        'lectureNumber': lecture_number,
+        'courseCode': row['courseCode'],
+        'teacherId': row.get('teacherId') or 'N/A',
+        'roomNumber': row.get('roomNumber') or 'N/A',
+        'createdAt': firestore.SERVER_TIMESTAMP,
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }
+
+
+def plan_timetable_import(rows):
+    """Validate rows and check clashes against the schedule and each other.
+
+    Returns ([(row_number, entry)], errors) with 1-based row numbers. Rows
+    are accepted in order, so of two clashing rows the first one wins.
+    """
+    grid = get_timetable_grid()
+    pending = OccupancyGrid()
+    accepted = []
+    errors = []
+    for row_number, row in enumerate(rows, 1):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("Entry must be an object")
+            entry = timetable_entry_from_row(row)
+            if entry['courseCode'] != 'BREAK':
+                slot = (entry['day'], entry['lectureNumber'], entry['roomNumber'], entry['teacherId'],
+                        entry['branchId'], entry['year'], entry['division'])
+                existing = grid.clashes(*slot)
+                in_batch = pending.clashes(*slot)
+                details = describe_clashes({kind: existing[kind] or in_batch[kind] for kind in existing})
+                if details:
+                    raise ValueError(f"Timetable clash: {', '.join(details)}")
+            pending.add(row_number, entry)
+            accepted.append((row_number, entry))
+        except ValueError as e:
+            errors.append({'row': row_number, 'entry': row, 'error': str(e)})
+    return accepted, errors
+
+
+def import_timetable(rows, atomic=False):
+    """Create every valid, clash-free row in batched writes.
+
+    With atomic=True nothing is written unless every row is valid. Returns
+    the results dict served by POST /timetable/bulk.
+    """
+    with _import_lock:
+        accepted, errors = plan_timetable_import(rows)
+        if atomic and errors:
+            return {'successful': 0, 'failed': len(errors), 'errors': errors, 'committed': False}
+
+        entries = [entry for _, entry in accepted]
+        entry_ids = get_repository().create_timetable_entries(entries, atomic=atomic) if entries else []
+
+    successful = 0
+    for (row_number, entry), entry_id in zip(accepted, entry_ids):
+        if entry_id is None:
+            errors.append({'row': row_number, 'entry': rows[row_number - 1], 'error': "Failed to write entry"})
+        else:
+            successful += 1
+    refresh_timetable_views([entry for entry, entry_id in zip(entries, entry_ids) if entry_id])
+    errors.sort(key=lambda error: error['row'])
+    logger.info(f"Imported {successful} timetable entries, {len(errors)} rejected")
+    return {'successful': successful, 'failed': len(errors), 'errors': errors, 'committed': True}
@@ -0,0 +1,111 @@
+import logging
+from urllib.parse import quote
+
+from firebase_admin import firestore
+
+from backend.services.timetable_grid import DAYS, UNASSIGNED
+from backend.utils.cache import make_etag
+from backend.utils.database import get_repository
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Fields copied into a view cell; timestamps are left out so views hash stably
+VIEW_FIELDS = ('branchId', 'year', 'division', 'day', 'lectureNumber', 'courseCode', 'teacherId', 'roomNumber')
+
+
+def timetable_view_id(kind, key):
+    """Document id of the 'branch' or 'teacher' weekly view for key"""
+    return f"{kind}:{quote(str(key), safe='-_')}"
+
+
+def build_week(entries):
+    """{day: {lectureNumber: entry}} grid as served by GET /timetable"""
+    week = {day: {} for day in DAYS}
+    for entry in entries:
+        day = entry.get('day')
+        if day in week:
+            cell = {field: entry.get(field) for field in VIEW_FIELDS}
+            cell['id'] = entry['id']
+            week[day][str(entry.get('lectureNumber'))] = cell
+    return week
+
+
+def _view(kind, key, entries):
+    week = build_week(entries)
+    return {
+        'kind': kind,
+        'key': key,
+        'timetable': week,
+        'etag': make_etag(week),
+        'updatedAt': firestore.SERVER_TIMESTAMP
+    }
+
+
+def _load_entries(kind, key):
+    if kind == 'branch':
+        return get_repository().list_timetable(branch_id=key)
+    return get_repository().list_timetable(teacher_id=key)
+
+
+def refresh_timetable_views(entries):
+    """Rebuild the class and teacher views touched by the given entries"""
+    keys = set()
+    for entry in entries:
+        if entry.get('branchId'):
+            keys.add(('branch', entry['branchId']))
+        if entry.get('teacherId') and entry['teacherId'] != UNASSIGNED:
+            keys.add(('teacher', entry['teacherId']))
+    try:
+        views = {}
+        emptied = []
+        for kind, key in keys:
+            entries = _load_entries(kind, key)
+            if entries:
+                views[timetable_view_id(kind, key)] = _view(kind, key, entries)
+            else:
+                emptied.append(timetable_view_id(kind, key))
+        if views:
+            get_repository().save_timetable_views(views)
+        if emptied:
+            get_repository().delete_timetable_views(emptied)
+        return len(views) + len(emptied)
+    except Exception as e:
+        # The timetable write itself succeeded; POST /timetable/views/rebuild repairs the views
+        logger.error(f"Error refreshing timetable views: {str(e)}")
+        return 0
+
+
+def rebuild_timetable_views():
+    """Rebuild every view from one scan of the timetable and drop views with no entries"""
+    by_key = {}
+    for entry in get_repository().list_timetable():
+        by_key.setdefault(('branch', entry.get('branchId')), []).append(entry)
+        if entry.get('teacherId') and entry['teacherId'] != UNASSIGNED:
+            by_key.setdefault(('teacher', entry['teacherId']), []).append(entry)
+    views = {
+        timetable_view_id(kind, key): _view(kind, key, entries)
+        for (kind, key), entries in by_key.items() if key
+    }
+    get_repository().save_timetable_views(views)
+    # Views whose entries were all removed outside the API
+    stale = [view_id for view_id in get_repository().list_timetable_view_ids() if view_id not in views]
+    if stale:
+        get_repository().delete_timetable_views(stale)
+    logger.info(f"Rebuilt {len(views)} timetable views, removed {len(stale)} stale views")
+    return len(views)
+
+
+def get_timetable_view(kind, key):
+    """The stored view, built on first request if missing.
+
+    Only views with entries are saved, so a GET for an unknown class or
+    teacher returns an empty week without creating a document.
+    """
+    view = get_repository().get_timetable_view(timetable_view_id(kind, key))
+    if view is None:
+        entries = _load_entries(kind, key)
+        view = _view(kind, key, entries)
+        if entries:
+            get_repository().save_timetable_views({timetable_view_id(kind, key): view})
+    return view
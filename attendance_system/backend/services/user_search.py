@@ -0,0 +1,221 @@
+import bisect
+import logging
+import threading
+
+from backend.utils.database import add_user_listener, get_repository
+from backend.utils.watch import add_watch_handler
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Fields matched against a search query
+SEARCH_FIELDS = ('name', 'email', 'studentId', 'teacherId')
+
+# Fields kept per user so results can be shown without another read
+INDEXED_FIELDS = SEARCH_FIELDS + ('role', 'adminId', 'branchId', 'year', 'division')
+
+# Exact matches on these identify one user
+KEY_FIELDS = ('email', 'studentId', 'teacherId')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class UserSearchIndex:
+    """In-memory prefix and substring index over users.
+
+    Prefixes are answered from a sorted token list with bisect, so every
+    token starting with the query is one contiguous slice. Substrings of
+    three or more characters intersect trigram posting sets and are then
+    verified against the field values.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._users = {}      # userId -> indexed fields
+        self._tokens = {}     # userId -> {field: [normalised tokens]}
+        self._sorted = []     # sorted distinct tokens
+        self._postings = {}   # token -> set of userIds
+        self._trigrams = {}   # trigram -> set of userIds
+
+    def __len__(self):
+        return len(self._users)
+
+    def load(self, users):
+        """Replace the index with the given user dicts (with 'id')"""
+        with self._lock:
+            self._clear()
+            for user in users:
+                self._insert(user['id'], {field: user[field] for field in INDEXED_FIELDS if field in user})
+            self._sorted = sorted(self._postings)
+
+    def upsert(self, user_id, data):
+        """Index a new user or merge changed fields into an existing one"""
+        with self._lock:
+            fields = dict(self._users.get(user_id, {}))
+            fields.update({field: data[field] for field in INDEXED_FIELDS if field in data})
+            self._delete(user_id)
+            for token in self._insert(user_id, fields):
+                index = bisect.bisect_left(self._sorted, token)
+                if index == len(self._sorted) or self._sorted[index] != token:
+                    self._sorted.insert(index, token)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._delete(user_id)
+
+    def _insert(self, user_id, fields):
+        """Add postings for a user; returns tokens that had no postings before"""
+        self._users[user_id] = fields
+        tokens = {}
+        new_tokens = []
+        for field in SEARCH_FIELDS:
+            value = str(fields.get(field) or '').strip().lower()
+            if not value:
+                continue
+            # Whole value plus each word, so "smith" finds "John Smith"
+            field_tokens = {value, *value.split()} if field == 'name' else {value}
+            tokens[field] = sorted(field_tokens)
+            for token in field_tokens:
+                postings = self._postings.setdefault(token, set())
+                if not postings:
+                    new_tokens.append(token)
+                postings.add(user_id)
+            for trigram in _trigrams(value):
+                self._trigrams.setdefault(trigram, set()).add(user_id)
+        self._tokens[user_id] = tokens
+        return new_tokens
+
+    def _delete(self, user_id):
+        tokens = self._tokens.pop(user_id, None)
+        if tokens is None:
+            return
+        self._users.pop(user_id, None)
+        for field_tokens in tokens.values():
+            for token in field_tokens:
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.discard(user_id)
+                if not postings:
+                    del self._postings[token]
+                    index = bisect.bisect_left(self._sorted, token)
+                    if index < len(self._sorted) and self._sorted[index] == token:
+                        del self._sorted[index]
+            # Each field's whole value is one of its tokens and the other
+            # tokens are substrings of it, so this covers every trigram added
+            for token in field_tokens:
+                for trigram in _trigrams(token):
+                    postings = self._trigrams.get(trigram)
+                    if postings is not None:
+                        postings.discard(user_id)
+                        if not postings:
+                            del self._trigrams[trigram]
+
+    def _prefix_matches(self, query):
+        start = bisect.bisect_left(self._sorted, query)
+        matches = set()
+        for token in self._sorted[start:]:
+            if not token.startswith(query):
+                break
+            matches |= self._postings[token]
+        return matches
+
+    def _substring_matches(self, query):
+        trigrams = _trigrams(query)
+        if not trigrams:
+            return set()
+        postings = sorted((self._trigrams.get(trigram, set()) for trigram in trigrams), key=len)
+        return set.intersection(*postings) if postings[0] else set()
+
+    def search(self, query, role=None, limit=10, fields=SEARCH_FIELDS):
+        """Ranked matches: exact key, then exact name, then prefix, then substring"""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        with self._lock:
+            candidates = self._prefix_matches(query) | self._substring_matches(query)
+            ranked = []
+            for user_id in candidates:
+                user = self._users[user_id]
+                if role and user.get('role') != role:
+                    continue
+                score = self._score(user_id, query, fields)
+                if score:
+                    ranked.append((-score, str(user.get('name', '')).lower(), user_id))
+            ranked.sort()
+            return [dict(self._users[user_id], id=user_id) for _, _, user_id in ranked[:limit]]
+
+    def _score(self, user_id, query, fields):
+        best = 0
+        for field, tokens in self._tokens[user_id].items():
+            if field not in fields:
+                continue
+            value = str(self._users[user_id].get(field, '')).strip().lower()
+            if value == query:
+                best = max(best, 4 if field in KEY_FIELDS else 3)
+            elif any(token.startswith(query) for token in tokens):
+                best = max(best, 2)
+            elif query in value:
+                best = max(best, 1)
+        return best
+
+    def find_exact(self, query, role=None):
+        """The user whose email (case-insensitive), studentId or teacherId equals query"""
+        query = query.strip()
+        with self._lock:
+            candidates = self._postings.get(query.lower(), set())
+            for user_id in sorted(candidates):
+                user = self._users[user_id]
+                if role and user.get('role') != role:
+                    continue
+                if (str(user.get('email', '')).lower() == query.lower() or
+                        user.get('studentId') == query or user.get('teacherId') == query):
+                    return dict(user, id=user_id)
+        return None
+
+
+def get_user_search_index():
+    """Return the process-wide index, loading every user on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = UserSearchIndex()
+            index.load(get_repository().list_users(fields=list(INDEXED_FIELDS)))
+            _index = index
+            logger.info(f"Loaded {len(index)} users into the search index")
+        return _index
+
+
+def _on_user_write(user_id, data):
+    """Repository write hook; data is None when the user was deleted"""
+    if _index is None:
+        return
+    if data is None:
+        _index.remove(user_id)
+    else:
+        _index.upsert(user_id, data)
+
+
+add_user_listener(_on_user_write)
+
+
+# --- Live updates from other processes ---
+def _load_from_watch(users):
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = UserSearchIndex()
+        _index.load(users)
+    logger.info(f"Loaded {len(users)} users into the search index")
+
+
+add_watch_handler('users', _load_from_watch, _on_user_write)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Reference collections (branches, courses, rooms, teachers) change about once
+# a term; the TTL only bounds staleness for writes made by other processes
+REFERENCE_CACHE_TTL_SECONDS = int(os.environ.get('REFERENCE_CACHE_TTL_SECONDS', 600))
+REFERENCE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+
+def approx_size(value):
+    """Rough in-memory size of a cached value in bytes"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, (bytes, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(approx_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by total size, with a per-entry TTL"""
+
+    def __init__(self, max_bytes, ttl_seconds, sizeof=approx_size):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it recently used, or default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl_seconds=None):
+        """Store a value, evicting least recently used entries to stay under max_bytes"""
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove one key; returns False if it was not cached"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._drop(key)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current memory use"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+    def _drop(self, key):
+        expires_at, size, value = self._entries.pop(key)
+        self._bytes -= size
+
+
+def make_etag(value):
+    """Strong ETag for a JSON-serialisable value"""
+    payload = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()
+
+
+class ReadThroughCache:
+    """Values loaded on a miss and kept until their TTL or an explicit invalidation.
+
+    Each value is stored with its ETag so HTTP handlers can answer
+    If-None-Match requests with 304 without touching the database.
+    """
+
+    def __init__(self, ttl_seconds, max_bytes=REFERENCE_CACHE_MAX_BYTES):
+        self._cache = LRUCache(max_bytes, ttl_seconds)
+        self._lock = threading.Lock()
+        self._generations = {}
+
+    def get(self, key, loader):
+        """Return (value, etag), calling loader() on a miss"""
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            generation = self._generations.get(key, 0)
+        value = loader()
+        entry = (value, make_etag(value))
+        with self._lock:
+            # A write that invalidated the key while loading wins over this result
+            if self._generations.get(key, 0) == generation:
+                self._cache.set(key, entry)
+        return entry
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._cache.invalidate(key)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+reference_cache = ReadThroughCache(REFERENCE_CACHE_TTL_SECONDS)
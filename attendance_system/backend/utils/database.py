@@ -1 +1,881 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
 
+from firebase_admin import firestore
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches and transactions with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 'firestore' (default) or 'sqlite' for single-campus deployments
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'firestore')
+SQLITE_DB_PATH = os.environ.get('SQLITE_DB_PATH', os.path.join(BASE_DIR, 'data', 'db', 'attendance_system.db'))
+
+# /stats totals are kept in sharded counter documents so concurrent writes do
+# not contend on a single document
+COUNTER_SHARDS = int(os.environ.get('STATS_COUNTER_SHARDS', 4))
+STATS_COUNTERS = ('totalUsers', 'studentsCount', 'teachersCount', 'coursesCount', 'timetableEntries')
+
+# Fields that identify exactly one user; Firestore reserves each value in a
+# user_keys/<field>:<value> document created in the same transaction as the user
+USER_KEY_FIELDS = ('email', 'studentId', 'teacherId')
+USER_KEY_LABELS = {'email': 'Email', 'studentId': 'Student ID', 'teacherId': 'Teacher ID'}
+
+_repository = None
+_user_listeners = []
+_timetable_listeners = []
+
+
+class DuplicateUserKeyError(ValueError):
+    """Raised when an email, studentId or teacherId already belongs to another user"""
+
+    def __init__(self, field):
+        self.field = field
+        super().__init__(f"{USER_KEY_LABELS[field]} already exists")
+
+
+def user_key(field, value):
+    """Document id reserving one unique user field value"""
+    value = str(value).strip()
+    if field == 'email':
+        value = value.lower()
+    return f"{field}:{quote(value, safe='@.+-_')}"
+
+
+def init_repository(firestore_db=None, backend=None):
+    """Create the process-wide repository for the configured backend"""
+    global _repository
+    backend = backend or DATABASE_BACKEND
+    if backend == 'sqlite':
+        _repository = SQLiteRepository(SQLITE_DB_PATH)
+    elif backend == 'firestore':
+        _repository = FirestoreRepository(firestore_db)
+    else:
+        raise ValueError(f"Unknown database backend: {backend}")
+    logger.info(f"Using {backend} repository")
+    return _repository
+
+
+def get_repository():
+    """Return the repository created by init_repository"""
+    return _repository
+
+
+def add_user_listener(listener):
+    """Call listener(user_id, data) after every user write; data is None for deletes"""
+    _user_listeners.append(listener)
+
+
+def _notify_user_change(user_id, data):
+    for listener in _user_listeners:
+        try:
+            listener(user_id, data)
+        except Exception as e:
+            logger.error(f"Error in user change listener: {str(e)}")
+
+
+def add_timetable_listener(listener):
+    """Call listener(entry_id, data) after every timetable write; data is None for deletes"""
+    _timetable_listeners.append(listener)
+
+
+def _notify_timetable_change(entry_id, data):
+    for listener in _timetable_listeners:
+        try:
+            listener(entry_id, data)
+        except Exception as e:
+            logger.error(f"Error in timetable change listener: {str(e)}")
+
+
+def user_counter_deltas(role, sign):
+    """Counter changes for adding (sign=1) or removing (sign=-1) a user"""
+    deltas = {'totalUsers': sign}
+    if role == 'Student':
+        deltas['studentsCount'] = sign
+    elif role == 'Teacher':
+        deltas['teachersCount'] = sign
+    return deltas
+
+
+# --- Firestore ---
+class FirestoreRepository:
+    """Users, timetable and reference data stored in Firestore collections.
+
+    Every method returns plain dicts with the document id under 'id'.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._backfilled = False
+        self._backfill_checked_at = 0.0
+
+    @staticmethod
+    def _to_dict(doc):
+        data = doc.to_dict()
+        data['id'] = doc.id
+        return data
+
+    # Users
+    def get_user(self, user_id):
+        doc = self.db.collection('users').document(user_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def find_user(self, field, value, role=None):
+        """First user whose field equals value, optionally restricted to a role"""
+        if field in USER_KEY_FIELDS:
+            key = self._key_ref(field, value).get()
+            if key.exists:
+                user = self.get_user(key.get('userId'))
+                return user if user and (not role or user.get('role') == role) else None
+            if self._keys_backfilled():
+                return None
+
+        # Users created before user_keys existed can only be found by a query
+        query = self.db.collection('users').where(field, '==', value)
+        if role:
+            query = query.where('role', '==', role)
+        docs = query.limit(1).get()
+        return self._to_dict(docs[0]) if docs else None
+
+    def _users_query(self, role=None, name_prefix=None):
+        query = self.db.collection('users')
+        if role:
+            query = query.where('role', '==', role)
+        if name_prefix:
+            query = query.where('name', '>=', name_prefix).where('name', '<=', name_prefix + '\uf8ff')
+        return query
+
+    def list_users(self, role=None, name_prefix=None, fields=None):
+        """Users matching the filters; fields limits the returned keys where the backend can project"""
+        query = self._users_query(role, name_prefix)
+        if fields:
+            query = query.select(fields)
+        return [self._to_dict(doc) for doc in query.stream()]
+
+    def list_users_page(self, name_prefix=None, limit=10, after=None):
+        """One page of users ordered by (name, id), starting after an (name, id) pair.
+
+        Returns (users, next_after); next_after is None on the last page.
+        """
+        query = self._users_query(name_prefix=name_prefix).order_by('name').order_by('__name__')
+        if after:
+            query = query.start_after({'name': after[0], '__name__': after[1]})
+        # One extra document tells whether another page exists
+        users = [self._to_dict(doc) for doc in query.limit(limit + 1).stream()]
+        if len(users) <= limit:
+            return users, None
+        last = users[limit - 1]
+        return users[:limit], (last['name'], last['id'])
+
+    def count_users(self, role=None, name_prefix=None):
+        return self._aggregate_count(self._users_query(role, name_prefix))
+
+    def list_students(self, branch_id=None, year=None, division=None):
+        query = self.db.collection('users').where('role', '==', 'Student')
+        if branch_id:
+            query = query.where('branchId', '==', branch_id)
+        if year is not None:
+            query = query.where('year', '==', int(year))
+        if division:
+            query = query.where('division', '==', division)
+        return [self._to_dict(doc) for doc in query.stream()]
+
+    def create_user(self, data, user_id=None):
+        """Create a user and reserve its unique keys in one transaction.
+
+        Raises DuplicateUserKeyError if any key already belongs to someone else.
+        """
+        ref = self.db.collection('users').document(user_id)
+        keys = {field: self._key_ref(field, data[field]) for field in USER_KEY_FIELDS if data.get(field)}
+        if not self._keys_backfilled():
+            for field in keys:
+                if self._legacy_user_id(field, data[field]) is not None:
+                    raise DuplicateUserKeyError(field)
+        shard = self._counter_shard()
+
+        @firestore.transactional
+        def create(transaction):
+            for field, key_ref in keys.items():
+                if key_ref.get(transaction=transaction).exists:
+                    raise DuplicateUserKeyError(field)
+            for key_ref in keys.values():
+                transaction.create(key_ref, {'userId': ref.id})
+            transaction.set(ref, data)
+            self._increment(transaction, user_counter_deltas(data.get('role'), 1), shard)
+
+        create(self.db.transaction())
+        _notify_user_change(ref.id, data)
+        return ref.id
+
+    def update_user(self, user_id, data):
+        """Update a user, moving key reservations for a changed email, studentId or teacherId"""
+        ref = self.db.collection('users').document(user_id)
+        changed = [field for field in USER_KEY_FIELDS if data.get(field)]
+        if not changed:
+            ref.update(data)
+            _notify_user_change(user_id, data)
+            return
+
+        @firestore.transactional
+        def update(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise KeyError(f"No user {user_id}")
+            current = snapshot.to_dict() or {}
+            moves = []
+            for field in changed:
+                old, new = current.get(field), data[field]
+                key_ref = self._key_ref(field, new)
+                key = key_ref.get(transaction=transaction)
+                if key.exists:
+                    if key.get('userId') != user_id:
+                        raise DuplicateUserKeyError(field)
+                    continue
+                # A missing key for an unchanged value (a user written without
+                # the repository) is reserved in place
+                old_ref = None
+                if old and user_key(field, old) != user_key(field, new):
+                    old_ref = self._key_ref(field, old)
+                    # Only release the old value if it is reserved for this user
+                    if (old_ref.get(transaction=transaction).to_dict() or {}).get('userId') != user_id:
+                        old_ref = None
+                moves.append((old_ref, key_ref))
+            for old_ref, new_ref in moves:
+                if old_ref is not None:
+                    transaction.delete(old_ref)
+                transaction.set(new_ref, {'userId': user_id})
+            transaction.update(ref, data)
+
+        update(self.db.transaction())
+        _notify_user_change(user_id, data)
+
+    def delete_user(self, user_id):
+        """Delete a user, its key reservations and decrement the counters atomically.
+
+        Returns False if the user did not exist.
+        """
+        ref = self.db.collection('users').document(user_id)
+        shard = self._counter_shard()
+
+        @firestore.transactional
+        def delete(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            data = snapshot.to_dict() or {}
+            key_refs = [self._key_ref(field, data[field]) for field in USER_KEY_FIELDS if data.get(field)]
+            # Only drop reservations that point at this user
+            owned = [key_ref for key_ref in key_refs
+                     if (key_ref.get(transaction=transaction).to_dict() or {}).get('userId') == user_id]
+            transaction.delete(ref)
+            for key_ref in owned:
+                transaction.delete(key_ref)
+            self._increment(transaction, user_counter_deltas(data.get('role'), -1), shard)
+            return True
+
+        deleted = delete(self.db.transaction())
+        if deleted:
+            _notify_user_change(user_id, None)
+        return deleted
+
+    # Unique key reservations
+    def _key_ref(self, field, value):
+        return self.db.collection('user_keys').document(user_key(field, value))
+
+    def _keys_backfilled(self):
+        """Whether backfill_user_keys has run, so a missing key means no such user"""
+        # Until the backfill has run, recheck the marker at most once a minute
+        if not self._backfilled and time.monotonic() - self._backfill_checked_at > 60:
+            meta = self.db.collection('user_keys').document('_meta').get()
+            self._backfilled = bool(meta.exists and meta.get('backfilled'))
+            self._backfill_checked_at = time.monotonic()
+        return self._backfilled
+
+    def _legacy_user_id(self, field, value):
+        docs = self.db.collection('users').where(field, '==', value).limit(1).get()
+        return docs[0].id if docs else None
+
+    def backfill_user_keys(self, dry_run=False):
+        """Reserve keys for users created before user_keys existed.
+
+        Returns (reserved, conflicts); conflicts lists values held by two users.
+        """
+        reserved = 0
+        conflicts = []
+        owners = {}
+        for doc in self.db.collection('user_keys').stream():
+            if doc.id != '_meta':
+                owners[doc.id] = doc.get('userId')
+
+        batch = self.db.batch()
+        pending = 0
+        for user in self.db.collection('users').select(list(USER_KEY_FIELDS)).stream():
+            data = user.to_dict() or {}
+            for field in USER_KEY_FIELDS:
+                if not data.get(field):
+                    continue
+                key = user_key(field, data[field])
+                owner = owners.get(key)
+                if owner == user.id:
+                    continue
+                if owner is not None:
+                    conflicts.append({'field': field, 'value': data[field], 'userIds': [owner, user.id]})
+                    continue
+                owners[key] = user.id
+                reserved += 1
+                if dry_run:
+                    continue
+                batch.set(self.db.collection('user_keys').document(key), {'userId': user.id})
+                pending += 1
+                if pending == MAX_BATCH_WRITES:
+                    batch.commit()
+                    batch = self.db.batch()
+                    pending = 0
+
+        if not dry_run:
+            batch.set(self.db.collection('user_keys').document('_meta'), {'backfilled': True})
+            batch.commit()
+            self._backfilled = True
+        return reserved, conflicts
+
+    # Timetable
+    def get_timetable_entry(self, entry_id):
+        doc = self.db.collection('timetable').document(entry_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def list_timetable(self, branch_id=None, teacher_id=None):
+        query = self.db.collection('timetable')
+        if branch_id:
+            query = query.where('branchId', '==', branch_id)
+        if teacher_id:
+            query = query.where('teacherId', '==', teacher_id)
+        return [self._to_dict(doc) for doc in query.stream()]
+
+    def create_timetable_entry(self, data):
+        ref = self.db.collection('timetable').document()
+        batch = self.db.batch()
+        batch.set(ref, data)
+        self._increment(batch, {'timetableEntries': 1})
+        batch.commit()
+        _notify_timetable_change(ref.id, data)
+        return ref.id
+
+    def create_timetable_entries(self, entries, atomic=False):
+        """Create many entries in batched writes; returns their ids in order.
+
+        Each batch carries up to MAX_BATCH_WRITES - 1 entries plus one counter
+        write. When a batch fails, atomic imports delete the batches already
+        committed and re-raise; otherwise that batch's ids are None.
+        """
+        collection = self.db.collection('timetable')
+        per_batch = MAX_BATCH_WRITES - 1
+        ids = []
+        created = []
+        for start in range(0, len(entries), per_batch):
+            chunk = entries[start:start + per_batch]
+            refs = [collection.document() for _ in chunk]
+            batch = self.db.batch()
+            for ref, data in zip(refs, chunk):
+                batch.set(ref, data)
+            self._increment(batch, {'timetableEntries': len(chunk)})
+            try:
+                batch.commit()
+            except Exception as e:
+                if atomic:
+                    self._delete_created_timetable([ref for ref, _ in created])
+                    raise
+                logger.error(f"Error committing timetable batch at row {start}: {str(e)}")
+                ids.extend([None] * len(chunk))
+                continue
+            created.extend(zip(refs, chunk))
+            ids.extend(ref.id for ref in refs)
+        for ref, data in created:
+            _notify_timetable_change(ref.id, data)
+        return ids
+
+    def _delete_created_timetable(self, refs):
+        per_batch = MAX_BATCH_WRITES - 1
+        for start in range(0, len(refs), per_batch):
+            chunk = refs[start:start + per_batch]
+            batch = self.db.batch()
+            for ref in chunk:
+                batch.delete(ref)
+            self._increment(batch, {'timetableEntries': -len(chunk)})
+            batch.commit()
+
+    def delete_timetable_entry(self, entry_id):
+        deleted = self._delete_counted(
+            self.db.collection('timetable').document(entry_id),
+            lambda data: {'timetableEntries': -1}
+        )
+        if deleted:
+            _notify_timetable_change(entry_id, None)
+        return deleted
+
+    def find_timetable_clashes(self, day, lecture_number, room_number, teacher_id, branch_id, year, division):
+        """Which of room, teacher and class are already booked in a slot"""
+        timetable_ref = self.db.collection('timetable')
+        slot = timetable_ref.where('day', '==', day).where('lectureNumber', '==', int(lecture_number))
+        return {
+            'room': len(slot.where('roomNumber', '==', room_number).limit(1).get()) > 0,
+            'teacher': len(slot.where('teacherId', '==', teacher_id).limit(1).get()) > 0,
+            'class': len(
+                slot.where('branchId', '==', branch_id)
+                .where('year', '==', int(year))
+                .where('division', '==', division)
+                .limit(1).get()
+            ) > 0
+        }
+
+    def count_timetable(self):
+        return self.count_documents('timetable')
+
+    # Aggregate counters
+    def _counter_shard(self):
+        shard = str(random.randrange(COUNTER_SHARDS))
+        return self.db.collection('counters').document('stats').collection('shards').document(shard)
+
+    def _increment(self, writer, deltas, shard=None):
+        """Add counter deltas to a random shard as part of a batch or transaction"""
+        shard = shard or self._counter_shard()
+        writer.set(shard, {name: firestore.Increment(delta) for name, delta in deltas.items()}, merge=True)
+
+    def _delete_counted(self, ref, deltas_for):
+        shard = self._counter_shard()
+
+        @firestore.transactional
+        def delete(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            transaction.delete(ref)
+            self._increment(transaction, deltas_for(snapshot.to_dict() or {}), shard)
+            return True
+
+        return delete(self.db.transaction())
+
+    def read_counters(self):
+        """Sum the counter shards in one batched read"""
+        shards = self.db.collection('counters').document('stats').collection('shards')
+        refs = [shards.document(str(shard)) for shard in range(COUNTER_SHARDS)]
+        totals = dict.fromkeys(STATS_COUNTERS, 0)
+        for snapshot in self.db.get_all(refs):
+            for name, value in (snapshot.to_dict() or {}).items():
+                if name in totals:
+                    totals[name] += value
+        return totals
+
+    def reconcile_counters(self):
+        """Recount with aggregation queries and add the difference to one shard.
+
+        Writing a correction delta instead of overwriting the shards keeps
+        every increment committed while the recount ran.
+        """
+        users = self.db.collection('users')
+        totals = {
+            'totalUsers': self._aggregate_count(users),
+            'studentsCount': self._aggregate_count(users.where('role', '==', 'Student')),
+            'teachersCount': self._aggregate_count(users.where('role', '==', 'Teacher')),
+            'coursesCount': self._aggregate_count(self.db.collection('courses')),
+            'timetableEntries': self._aggregate_count(self.db.collection('timetable'))
+        }
+        current = self.read_counters()
+        deltas = {name: totals[name] - current[name] for name in STATS_COUNTERS if totals[name] != current[name]}
+        if deltas:
+            batch = self.db.batch()
+            self._increment(batch, deltas)
+            batch.commit()
+            logger.info(f"Corrected stats counters by {deltas}")
+        return totals
+
+    @staticmethod
+    def _aggregate_count(query):
+        """Server-side count; billed per 1000 index entries instead of per document"""
+        return int(query.count().get()[0][0].value)
+
+    # Reference collections and logs
+    def list_documents(self, collection):
+        return [self._to_dict(doc) for doc in self.db.collection(collection).stream()]
+
+    def count_documents(self, collection):
+        return self._aggregate_count(self.db.collection(collection))
+
+    def add_document(self, collection, data, doc_id=None):
+        collection = self.db.collection(collection)
+        ref = collection.document(doc_id) if doc_id else collection.document()
+        ref.set(data)
+        return ref.id
+
+    # Materialized timetable views
+    def get_timetable_view(self, view_id):
+        doc = self.db.collection('timetable_views').document(view_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def save_timetable_views(self, views):
+        """Write {viewId: data} in batched writes"""
+        collection = self.db.collection('timetable_views')
+        items = list(views.items())
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for view_id, data in items[start:start + MAX_BATCH_WRITES]:
+                batch.set(collection.document(view_id), data)
+            batch.commit()
+
+    def list_timetable_view_ids(self):
+        return [doc.id for doc in self.db.collection('timetable_views').select([]).stream()]
+
+    def delete_timetable_views(self, view_ids):
+        collection = self.db.collection('timetable_views')
+        view_ids = list(view_ids)
+        for start in range(0, len(view_ids), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for view_id in view_ids[start:start + MAX_BATCH_WRITES]:
+                batch.delete(collection.document(view_id))
+            batch.commit()
+
+
+# --- SQLite ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    role TEXT,
+    name TEXT,
+    email TEXT,
+    studentId TEXT,
+    teacherId TEXT,
+    branchId TEXT,
+    year INTEGER,
+    division TEXT,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_student_id ON users(studentId);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_teacher_id ON users(teacherId);
+CREATE INDEX IF NOT EXISTS idx_users_branch ON users(branchId, year, division);
+CREATE INDEX IF NOT EXISTS idx_users_role_name ON users(role, name);
+CREATE INDEX IF NOT EXISTS idx_users_name ON users(name, id);
+
+CREATE TABLE IF NOT EXISTS timetable (
+    id TEXT PRIMARY KEY,
+    branchId TEXT,
+    year INTEGER,
+    division TEXT,
+    day TEXT,
+    lectureNumber INTEGER,
+    courseCode TEXT,
+    teacherId TEXT,
+    roomNumber TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_timetable_slot ON timetable(day, lectureNumber);
+CREATE INDEX IF NOT EXISTS idx_timetable_branch ON timetable(branchId);
+CREATE INDEX IF NOT EXISTS idx_timetable_teacher ON timetable(teacherId);
+
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+);
+"""
+
+USER_COLUMNS = ('role', 'name', 'email', 'studentId', 'teacherId', 'branchId', 'year', 'division')
+TIMETABLE_COLUMNS = ('branchId', 'year', 'division', 'day', 'lectureNumber', 'courseCode', 'teacherId', 'roomNumber')
+
+
+def _new_id():
+    return uuid.uuid4().hex[:20]
+
+
+def _resolve_timestamps(data):
+    """Replace firestore.SERVER_TIMESTAMP with the current time"""
+    now = datetime.now(timezone.utc)
+    return {key: now if value is firestore.SERVER_TIMESTAMP else value for key, value in data.items()}
+
+
+def _dumps(data):
+    return json.dumps(data, default=lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value))
+
+
+def _column_value(column, value):
+    """Indexed column value; emails are matched case-insensitively as in user_keys"""
+    if column == 'email' and isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+class SQLiteRepository:
+    """Same interface as FirestoreRepository on a local indexed SQLite file.
+
+    Indexed columns are kept alongside the full document JSON, so lookups by
+    email, studentId, teacherId, branchId and (day, lectureNumber) are index
+    seeks with no network round-trip.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # data/db/attendance_system.db ships as an empty placeholder
+        if os.path.exists(path) and os.path.getsize(path) < 100:
+            with open(path, 'rb') as f:
+                placeholder = f.read().strip() == b''
+            if placeholder:
+                open(path, 'wb').close()
+        with self._conn() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+        self._normalize_emails()
+
+    def _normalize_emails(self):
+        """Lowercase email columns written before lookups ignored case"""
+        try:
+            with self._conn() as conn:
+                conn.execute("UPDATE users SET email = lower(trim(email)) WHERE email != lower(trim(email))")
+        except sqlite3.IntegrityError:
+            logger.warning("Users share an email differing only in case; their logins stay case-sensitive")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        data = json.loads(row['data'])
+        data['id'] = row['id']
+        return data
+
+    def _query(self, sql, params=()):
+        return [self._to_dict(row) for row in self._conn().execute(sql, params)]
+
+    def _insert(self, table, columns, data, doc_id=None):
+        return self._insert_many(table, columns, [data], [doc_id])[0]
+
+    def _insert_many(self, table, columns, rows, doc_ids=None):
+        """Upsert rows in one transaction; returns their ids"""
+        doc_ids = [doc_id or _new_id() for doc_id in (doc_ids or [None] * len(rows))]
+        params = []
+        for doc_id, data in zip(doc_ids, rows):
+            data = _resolve_timestamps(data)
+            params.append([doc_id] + [_column_value(column, data.get(column)) for column in columns] + [_dumps(data)])
+        # An upsert on id only; unlike INSERT OR REPLACE it never deletes
+        # another row that holds the same unique email or id
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns + ('data',))
+        with self._conn() as conn:
+            conn.executemany(
+                f"INSERT INTO {table} (id, {', '.join(columns)}, data) "
+                f"VALUES (?, {', '.join('?' * len(columns))}, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                params
+            )
+        return doc_ids
+
+    # Users
+    def get_user(self, user_id):
+        rows = self._query("SELECT id, data FROM users WHERE id = ?", (user_id,))
+        return rows[0] if rows else None
+
+    def find_user(self, field, value, role=None):
+        if field not in USER_COLUMNS:
+            raise ValueError(f"Cannot look users up by {field}")
+        sql = f"SELECT id, data FROM users WHERE {field} = ?"
+        params = [_column_value(field, value)]
+        if role:
+            sql += " AND role = ?"
+            params.append(role)
+        rows = self._query(sql + " LIMIT 1", params)
+        return rows[0] if rows else None
+
+    def _users_where(self, role=None, name_prefix=None):
+        clauses = []
+        params = []
+        if role:
+            clauses.append("role = ?")
+            params.append(role)
+        if name_prefix:
+            clauses.append("name >= ? AND name <= ?")
+            params.extend([name_prefix, name_prefix + '\uf8ff'])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def list_users(self, role=None, name_prefix=None, fields=None):
+        where, params = self._users_where(role, name_prefix)
+        return self._query("SELECT id, data FROM users" + where, params)
+
+    def list_users_page(self, name_prefix=None, limit=10, after=None):
+        where, params = self._users_where(name_prefix=name_prefix)
+        sql = "SELECT id, data FROM users" + (where + " AND" if where else " WHERE") + " name IS NOT NULL"
+        if after:
+            # Seeks along idx_users_name instead of skipping rows
+            sql += " AND (name > ? OR (name = ? AND id > ?))"
+            params.extend([after[0], after[0], after[1]])
+        users = self._query(sql + " ORDER BY name, id LIMIT ?", params + [limit + 1])
+        if len(users) <= limit:
+            return users, None
+        last = users[limit - 1]
+        return users[:limit], (last['name'], last['id'])
+
+    def count_users(self, role=None, name_prefix=None):
+        where, params = self._users_where(role, name_prefix)
+        return self._conn().execute("SELECT COUNT(*) FROM users" + where, params).fetchone()[0]
+
+    def list_students(self, branch_id=None, year=None, division=None):
+        sql = "SELECT id, data FROM users WHERE role = 'Student'"
+        params = []
+        for column, value in (('branchId', branch_id), ('year', year), ('division', division)):
+            if value is not None and value != '':
+                sql += f" AND {column} = ?"
+                params.append(int(value) if column == 'year' else value)
+        return self._query(sql, params)
+
+    def _insert_user(self, data, user_id):
+        try:
+            return self._insert('users', USER_COLUMNS, data, user_id)
+        except sqlite3.IntegrityError as e:
+            # "UNIQUE constraint failed: users.email" and the like
+            for field in USER_KEY_FIELDS:
+                if str(e).endswith(f"users.{field}"):
+                    raise DuplicateUserKeyError(field)
+            raise
+
+    def create_user(self, data, user_id=None):
+        user_id = self._insert_user(data, user_id)
+        _notify_user_change(user_id, data)
+        return user_id
+
+    def update_user(self, user_id, data):
+        user = self.get_user(user_id)
+        if user is None:
+            raise KeyError(f"No user {user_id}")
+        user.pop('id')
+        user.update(data)
+        self._insert_user(user, user_id)
+        _notify_user_change(user_id, data)
+
+    def delete_user(self, user_id):
+        with self._conn() as conn:
+            deleted = conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount > 0
+        if deleted:
+            _notify_user_change(user_id, None)
+        return deleted
+
+    # Timetable
+    def get_timetable_entry(self, entry_id):
+        rows = self._query("SELECT id, data FROM timetable WHERE id = ?", (entry_id,))
+        return rows[0] if rows else None
+
+    def list_timetable(self, branch_id=None, teacher_id=None):
+        sql = "SELECT id, data FROM timetable WHERE 1 = 1"
+        params = []
+        if branch_id:
+            sql += " AND branchId = ?"
+            params.append(branch_id)
+        if teacher_id:
+            sql += " AND teacherId = ?"
+            params.append(teacher_id)
+        return self._query(sql, params)
+
+    def create_timetable_entry(self, data):
+        entry_id = self._insert('timetable', TIMETABLE_COLUMNS, data)
+        _notify_timetable_change(entry_id, data)
+        return entry_id
+
+    def create_timetable_entries(self, entries, atomic=False):
+        # A single SQLite transaction is all-or-nothing either way
+        entry_ids = self._insert_many('timetable', TIMETABLE_COLUMNS, entries)
+        for entry_id, data in zip(entry_ids, entries):
+            _notify_timetable_change(entry_id, data)
+        return entry_ids
+
+    def delete_timetable_entry(self, entry_id):
+        with self._conn() as conn:
+            deleted = conn.execute("DELETE FROM timetable WHERE id = ?", (entry_id,)).rowcount > 0
+        if deleted:
+            _notify_timetable_change(entry_id, None)
+        return deleted
+
+    def find_timetable_clashes(self, day, lecture_number, room_number, teacher_id, branch_id, year, division):
+        """Which of room, teacher and class are already booked in a slot"""
+        row = self._conn().execute(
+            "SELECT "
+            "  COALESCE(MAX(roomNumber = ?), 0), "
+            "  COALESCE(MAX(teacherId = ?), 0), "
+            "  COALESCE(MAX(branchId = ? AND year = ? AND division = ?), 0) "
+            "FROM timetable WHERE day = ? AND lectureNumber = ?",
+            (room_number, teacher_id, branch_id, int(year), division, day, int(lecture_number))
+        ).fetchone()
+        return {'room': bool(row[0]), 'teacher': bool(row[1]), 'class': bool(row[2])}
+
+    def count_timetable(self):
+        return self._conn().execute("SELECT COUNT(*) FROM timetable").fetchone()[0]
+
+    # Aggregate counters; COUNT(*) over the role and table indexes is already cheap here
+    def read_counters(self):
+        return {
+            'totalUsers': self.count_users(),
+            'studentsCount': self.count_users(role='Student'),
+            'teachersCount': self.count_users(role='Teacher'),
+            'coursesCount': self.count_documents('courses'),
+            'timetableEntries': self.count_timetable()
+        }
+
+    def reconcile_counters(self):
+        return self.read_counters()
+
+    # Reference collections and logs
+    def list_documents(self, collection):
+        rows = self._conn().execute("SELECT id, data FROM documents WHERE collection = ?", (collection,))
+        return [self._to_dict(row) for row in rows]
+
+    def count_documents(self, collection):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM documents WHERE collection = ?", (collection,)
+        ).fetchone()[0]
+
+    def add_document(self, collection, data, doc_id=None):
+        doc_id = doc_id or _new_id()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)",
+                (collection, doc_id, _dumps(_resolve_timestamps(data)))
+            )
+        return doc_id
+
+    # Materialized timetable views
+    def get_timetable_view(self, view_id):
+        row = self._conn().execute(
+            "SELECT data FROM documents WHERE collection = 'timetable_views' AND id = ?", (view_id,)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def save_timetable_views(self, views):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (collection, id, data) VALUES ('timetable_views', ?, ?)",
+                [(view_id, _dumps(_resolve_timestamps(data))) for view_id, data in views.items()]
+            )
+
+    def list_timetable_view_ids(self):
+        rows = self._conn().execute("SELECT id FROM documents WHERE collection = 'timetable_views'")
+        return [row['id'] for row in rows]
+
+    def delete_timetable_views(self, view_ids):
+        with self._conn() as conn:
+            conn.executemany(
+                "DELETE FROM documents WHERE collection = 'timetable_views' AND id = ?",
+                [(view_id,) for view_id in view_ids]
+            )
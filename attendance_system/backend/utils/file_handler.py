@@ -1 +1,73 @@
+import base64
+import io
+import os
 
+import numpy as np
+from PIL import Image
+
+# Decoded images are capped to this many pixels on the longest side; phone
+# cameras produce 12 MP selfies and nothing downstream needs that resolution
+MAX_IMAGE_SIDE = int(os.environ.get('FACE_MAX_IMAGE_SIDE', 1600))
+
+
+def image_bytes_from_data_url(image_data_url):
+    """Return the raw bytes of a base64 data URL sent from the frontend"""
+    header, encoded = image_data_url.split(",", 1)
+    return base64.b64decode(encoded)
+
+
+def read_image_upload(req):
+    """Return the uploaded image bytes from a Flask request, or None.
+
+    Accepts a multipart form field named 'image', a raw image/* or
+    application/octet-stream body, or the original JSON body with a base64
+    data URL in 'image'. The binary paths avoid holding the JSON text, the
+    base64 string and the decoded bytes in memory at the same time.
+    """
+    upload = req.files.get('image')
+    if upload is not None:
+        return upload.read() or None
+
+    if req.mimetype.startswith('image/') or req.mimetype == 'application/octet-stream':
+        return req.get_data(cache=False) or None
+
+    data = req.get_json(silent=True)
+    if not data or not data.get('image'):
+        return None
+    return image_bytes_from_data_url(data['image'])
+
+
+def decode_image_bytes(image_bytes, max_side=MAX_IMAGE_SIDE):
+    """Load encoded image bytes as an RGB numpy array no larger than max_side"""
+    image = Image.open(io.BytesIO(image_bytes))
+
+    if max_side and max(image.size) > max_side:
+        # For JPEGs, draft mode decodes straight at 1/2, 1/4 or 1/8 scale
+        scale = max_side / max(image.size)
+        image.draft('RGB', (int(image.width * scale), int(image.height * scale)))
+
+    # Convert once here so face_recognition always gets 8-bit RGB
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    return np.array(image)
+
+
+def decode_image_data_url(image_data_url):
+    """Decode a base64 data URL sent from the frontend into a numpy image"""
+    return decode_image_bytes(image_bytes_from_data_url(image_data_url))
+
+
+def downscale_image(image_np, max_side):
+    """Return (copy no larger than max_side, scale factor applied)"""
+    height, width = image_np.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image_np, 1.0
+
+    scale = max_side / max(height, width)
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    small = Image.fromarray(image_np).resize(size, Image.BILINEAR)
+    return np.array(small), scale
@@ -1 +1,225 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
 
+from backend.services.timetable_grid import DAYS, LECTURES_PER_DAY, UNASSIGNED
+from backend.utils.database import add_timetable_listener, get_repository
+from backend.utils.watch import add_watch_handler
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+# Lecture start and end times, comma separated in lecture order; matches the
+# admin dashboard's default headers with a lunch break after lecture 4
+BELL_SCHEDULE = os.environ.get(
+    'BELL_SCHEDULE',
+    '09:00-10:00,10:00-11:00,11:00-12:00,12:00-13:00,14:00-15:00,15:00-16:00,16:00-17:00,17:00-18:00'
+)
+
+# Fields kept per indexed entry; write hooks may carry timestamp sentinels
+ENTRY_FIELDS = ('branchId', 'year', 'division', 'day', 'lectureNumber', 'courseCode', 'teacherId', 'roomNumber')
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def _minutes(text):
+    hours, minutes = text.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_bell_schedule(text):
+    """[(start minute, end minute)] per lecture from '09:00-10:00,10:00-11:00,...'"""
+    periods = []
+    for period in text.split(','):
+        start, end = period.split('-')
+        periods.append((_minutes(start), _minutes(end)))
+    if len(periods) > LECTURES_PER_DAY:
+        raise ValueError(f"Bell schedule has more than {LECTURES_PER_DAY} lectures")
+    for index, (start, end) in enumerate(periods):
+        if not start < end <= MINUTES_PER_DAY:
+            raise ValueError(f"Lecture {index + 1} must end after it starts on the same day")
+        if index and start < periods[index - 1][1]:
+            raise ValueError(f"Lecture {index + 1} starts before lecture {index} ends")
+    return periods
+
+
+class LectureResolver:
+    """Active or next lecture for a class or teacher at any time, in O(1).
+
+    Two tables over the 10,080 minutes of a week map each minute to the slot
+    being taught then and to the first slot starting after it. Slots are
+    numbered day * 8 + (lecture - 1), which is also time order, so each class
+    and teacher only needs a bitmask of its slots: the next session is the
+    lowest set bit at or above the next slot.
+    """
+
+    def __init__(self, bell_schedule=BELL_SCHEDULE):
+        self._lock = threading.RLock()
+        self.periods = parse_bell_schedule(bell_schedule) if isinstance(bell_schedule, str) else list(bell_schedule)
+        self._build_tables()
+        self._clear()
+
+    def _build_tables(self):
+        self._slot_times = {}
+        self._active = [-1] * MINUTES_PER_WEEK
+        self._next = [-1] * MINUTES_PER_WEEK
+        starts = []
+        for day in range(len(DAYS)):
+            for lecture, (start, end) in enumerate(self.periods):
+                slot = day * LECTURES_PER_DAY + lecture
+                offset = day * MINUTES_PER_DAY
+                self._slot_times[slot] = (offset + start, offset + end)
+                self._active[offset + start:offset + end] = [slot] * (end - start)
+                starts.append((offset + start, slot))
+        # Walk backwards so each minute sees the earliest start after it;
+        # minutes after the week's last start keep -1
+        upcoming = -1
+        pending = sorted(starts)
+        for minute in range(MINUTES_PER_WEEK - 1, -1, -1):
+            while pending and pending[-1][0] > minute:
+                upcoming = pending.pop()[1]
+            self._next[minute] = upcoming
+
+    def _clear(self):
+        self._entries = {}   # entryId -> (slot, branchId, teacherId)
+        self._slots = {}     # (kind, key) -> {slot: {entryId: entry}}
+        self._masks = {}     # (kind, key) -> bitmask of slots
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries):
+        """Replace the index with the given timetable dicts (with 'id')"""
+        with self._lock:
+            self._clear()
+            for entry in entries:
+                self._add(entry['id'], entry)
+
+    def add(self, entry_id, data):
+        with self._lock:
+            self._remove(entry_id)
+            self._add(entry_id, data)
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    @staticmethod
+    def _keys(branch_id, teacher_id):
+        keys = [('branch', branch_id)]
+        if teacher_id and teacher_id != UNASSIGNED:
+            keys.append(('teacher', teacher_id))
+        return keys
+
+    def _add(self, entry_id, data):
+        if data.get('courseCode') == 'BREAK' or data.get('day') not in DAYS:
+            return
+        try:
+            lecture_number = int(data.get('lectureNumber'))
+        except (TypeError, ValueError):
+            return
+        if not 1 <= lecture_number <= len(self.periods):
+            return
+        slot = DAYS.index(data['day']) * LECTURES_PER_DAY + lecture_number - 1
+        entry = {field: data.get(field) for field in ENTRY_FIELDS}
+        entry['id'] = entry_id
+        self._entries[entry_id] = (slot, data.get('branchId'), data.get('teacherId'))
+        for key in self._keys(data.get('branchId'), data.get('teacherId')):
+            self._slots.setdefault(key, {}).setdefault(slot, {})[entry_id] = entry
+            self._masks[key] = self._masks.get(key, 0) | 1 << slot
+
+    def _remove(self, entry_id):
+        indexed = self._entries.pop(entry_id, None)
+        if indexed is None:
+            return
+        slot, branch_id, teacher_id = indexed
+        for key in self._keys(branch_id, teacher_id):
+            slots = self._slots[key]
+            del slots[slot][entry_id]
+            # Overlapping entries (e.g. seeded before clash checks) keep the slot
+            if slots[slot]:
+                continue
+            del slots[slot]
+            self._masks[key] &= ~(1 << slot)
+            if not slots:
+                del self._slots[key]
+                del self._masks[key]
+
+    def _session(self, status, entries, slot, week_start):
+        start, end = self._slot_times[slot]
+        return {
+            'status': status,
+            # The earliest indexed of any overlapping entries
+            'entry': next(iter(entries.values())),
+            'start': week_start + timedelta(minutes=start),
+            'end': week_start + timedelta(minutes=end)
+        }
+
+    def resolve(self, kind, key, when=None):
+        """The 'active' or 'next' session of a 'branch' or 'teacher', or None"""
+        when = when or datetime.now()
+        week_start = datetime.combine(when.date() - timedelta(days=when.weekday()), datetime.min.time(),
+                                      tzinfo=when.tzinfo)
+        minute = when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+        with self._lock:
+            mask = self._masks.get((kind, key), 0)
+            if not mask:
+                return None
+            slots = self._slots[(kind, key)]
+
+            slot = self._active[minute]
+            if slot >= 0 and mask >> slot & 1:
+                return self._session('active', slots[slot], slot, week_start)
+
+            upcoming = self._next[minute]
+            later = mask >> upcoming << upcoming if upcoming >= 0 else 0
+            if later:
+                slot = (later & -later).bit_length() - 1
+            else:
+                # Nothing left this week; the first session of next week
+                slot = (mask & -mask).bit_length() - 1
+                week_start += timedelta(days=7)
+            return self._session('next', slots[slot], slot, week_start)
+
+
+def get_lecture_resolver():
+    """Return the process-wide resolver, loading the whole timetable on first use"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            resolver = LectureResolver()
+            resolver.load(get_repository().list_timetable())
+            _resolver = resolver
+            logger.info(f"Loaded {len(resolver)} timetable entries into the lecture resolver")
+        return _resolver
+
+
+def _on_timetable_write(entry_id, data):
+    """Repository write hook; data is None when the entry was deleted"""
+    if _resolver is None:
+        return
+    if data is None:
+        _resolver.remove(entry_id)
+    else:
+        _resolver.add(entry_id, data)
+
+
+add_timetable_listener(_on_timetable_write)
+
+
+# --- Live updates from other processes ---
+def _load_from_watch(entries):
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = LectureResolver()
+        _resolver.load(entries)
+    logger.info(f"Loaded {len(_resolver)} timetable entries into the lecture resolver")
+
+
+add_watch_handler('timetable', _load_from_watch, _on_timetable_write)
@@ -0,0 +1,64 @@
+import logging
+import threading
+
+# Initialize logger
+logger = logging.getLogger(__name__)
+
+_handlers = {}   # collection -> [(on_load, on_write)]
+_watches = {}    # collection -> Firestore watch
+_watch_lock = threading.Lock()
+
+
+def add_watch_handler(collection, on_load, on_write):
+    """Feed a collection's changes from other app processes to an in-process index.
+
+    on_load(docs) receives the first snapshot as dicts with 'id';
+    on_write(doc_id, data) receives every later change, with data None
+    when the document was removed.
+    """
+    _handlers.setdefault(collection, []).append((on_load, on_write))
+
+
+def start_collection_watches(firestore_db):
+    """One on_snapshot listener per watched collection, shared by its handlers"""
+    with _watch_lock:
+        for collection in _handlers:
+            if collection not in _watches:
+                _watches[collection] = firestore_db.collection(collection).on_snapshot(_dispatcher(collection))
+                logger.info(f"Watching {collection} for changes from other processes")
+        return dict(_watches)
+
+
+def stop_collection_watches():
+    with _watch_lock:
+        for watch in _watches.values():
+            watch.unsubscribe()
+        _watches.clear()
+
+
+def _call(handler, *args):
+    try:
+        handler(*args)
+    except Exception as e:
+        logger.error(f"Error in watch handler: {str(e)}")
+
+
+def _dispatcher(collection):
+    loaded = threading.Event()
+
+    def on_snapshot(docs, changes, read_time):
+        handlers = list(_handlers.get(collection, ()))
+        if not loaded.is_set():
+            # The first snapshot carries every document, so it doubles as the load
+            loaded.set()
+            docs = [dict(doc.to_dict() or {}, id=doc.id) for doc in docs]
+            for on_load, _ in handlers:
+                _call(on_load, docs)
+            return
+        for change in changes:
+            doc = change.document
+            data = None if change.type.name == 'REMOVED' else doc.to_dict() or {}
+            for _, on_write in handlers:
+                _call(on_write, doc.id, data)
+
+    return on_snapshot
@@ -0,0 +1,74 @@
+"""
+Recall-vs-latency benchmark for the face matching indexes.
+
+Compares the IVF index against exact brute-force search on synthetic
+128-d encodings. Usage:
+
+    python benchmark_face_index.py --size 100000 --probes 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend.services.face_index import IVFFaceIndex
+from backend.services.face_recognition_service import ENCODING_SIZE, FaceMatcher
+
+
+def synthetic_encodings(size, rng):
+    """Unit-scale encodings clustered the way dlib embeddings group by appearance"""
+    n_groups = max(size // 200, 1)
+    groups = rng.normal(0, 0.12, (n_groups, ENCODING_SIZE)).astype(np.float32)
+    members = groups[rng.integers(0, n_groups, size)]
+    return members + rng.normal(0, 0.05, (size, ENCODING_SIZE)).astype(np.float32)
+
+
+def time_queries(index, probes, **kwargs):
+    """Match probes one at a time, as the attendance path does; returns (ids, ms/probe)"""
+    start = time.perf_counter()
+    found = []
+    for probe in probes:
+        matches = index.match(probe, k=1, tolerance=None, **kwargs)
+        found.append(matches[0]['userId'] if matches else None)
+    elapsed = (time.perf_counter() - start) * 1000 / len(probes)
+    return found, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='number of enrolled encodings')
+    parser.add_argument('--probes', type=int, default=500, help='number of probe captures')
+    parser.add_argument('--noise', type=float, default=0.08, help='capture noise added to each probe')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    encodings = synthetic_encodings(args.size, rng)
+    user_ids = [f"user{i}" for i in range(args.size)]
+    targets = rng.choice(args.size, args.probes, replace=False)
+    probes = encodings[targets] + rng.normal(0, args.noise, (args.probes, ENCODING_SIZE)).astype(np.float32)
+
+    exact = FaceMatcher()
+    exact.load(zip(user_ids, encodings))
+    truth, exact_ms = time_queries(exact, probes)
+
+    start = time.perf_counter()
+    ivf = IVFFaceIndex()
+    ivf.load(zip(user_ids, encodings))
+    build_s = time.perf_counter() - start
+
+    print(f"{args.size} encodings, {args.probes} probes")
+    print(f"IVF build: {build_s:.2f}s, {len(ivf.lists)} lists")
+    print(f"{'index':<16}{'recall@1':>10}{'ms/probe':>12}{'speedup':>10}")
+    print(f"{'exact':<16}{1.0:>10.3f}{exact_ms:>12.3f}{1.0:>10.1f}")
+
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        if nprobe > len(ivf.lists):
+            break
+        found, ivf_ms = time_queries(ivf, probes, nprobe=nprobe)
+        recall = np.mean([a == b for a, b in zip(found, truth)])
+        print(f"{'ivf nprobe=' + str(nprobe):<16}{recall:>10.3f}{ivf_ms:>12.3f}{exact_ms / ivf_ms:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -34,11 +34,13 @@ def delete_collection(coll_ref, batch_size):
 # I've included all the ones we've discussed.
 collections_to_delete = [
     'users', 
+    'user_keys', # Email/ID reservations and the _meta backfill marker
     'teachers', # To remove the old, obsolete collection
     'courses', 
     'rooms', 
     'branches',
-    'timetable' # Clearing timetable entries as well
+    'timetable', # Clearing timetable entries as well
+    'timetable_views' # Precomputed weekly grids built from the timetable
 ]
 
 print("🧹 Starting to clean the pantry (deleting collections)...")
@@ -53,4 +55,12 @@ for coll_name in collections_to_delete:
         # This can happen if a collection doesn't exist, which is fine.
         print(f"Could not process collection '{coll_name}'. It might not exist. Error: {e}")
 
+# The /stats counter shards live in a subcollection
+try:
+    print("\nAttempting to delete the stats counter shards...")
+    delete_collection(db.collection('counters').document('stats').collection('shards'), 100)
+    print("✅ Successfully cleared the stats counters.")
+except Exception as e:
+    print(f"Could not clear the stats counters. Error: {e}")
+
 print("\n✨ Pantry cleaning complete! Your Firestore is ready for fresh data.")
\ No newline at end of file
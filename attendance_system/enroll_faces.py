@@ -0,0 +1,61 @@
+"""
+Bulk face enrollment from a ZIP archive of images named by studentId.
+
+    python enroll_faces.py students.zip --report data/reports/enrollment.csv
+"""
+import argparse
+import csv
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from backend.services.face_enrollment import enroll_faces_from_zip
+from backend.services.face_workers import FACE_WORKERS, FaceWorkerPool
+from backend.utils.database import init_repository
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archive', help='ZIP file of <studentId>.jpg images')
+    parser.add_argument('--workers', type=int, default=FACE_WORKERS, help='encoding processes to run')
+    parser.add_argument('--report', help='write the per-file results to this CSV file')
+    args = parser.parse_args()
+
+    # Start the workers before Firestore opens any connections
+    pool = FaceWorkerPool(workers=args.workers)
+
+    # --- Initialize Firestore ---
+    try:
+        cred = credentials.Certificate("serviceAccountKey.json")
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+    except Exception as e:
+        print(f"Error initializing Firebase: {e}\nPlease ensure 'serviceAccountKey.json' is present.")
+        exit()
+
+    db = firestore.client()
+    init_repository(db)
+
+    print(f"🚀 Enrolling faces from {args.archive} with {pool.workers} workers...")
+    try:
+        with open(args.archive, 'rb') as archive:
+            report = enroll_faces_from_zip(db, archive, pool)
+    finally:
+        pool.shutdown()
+
+    for result in report['results']:
+        if result.get('status') != 'enrolled':
+            print(f"❌ {result['file']}: {result.get('error')}")
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['file', 'studentId', 'userId', 'status', 'error'])
+            writer.writeheader()
+            writer.writerows(report['results'])
+        print(f"📄 Report written to {args.report}")
+
+    print(f"\n🎉 Enrollment complete: {report['enrolled']} enrolled, {report['failed']} failed ✅")
+
+
+if __name__ == '__main__':
+    main()
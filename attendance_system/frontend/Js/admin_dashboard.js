@@ -12,6 +12,8 @@ let currentLectureDay = null;
 let currentLectureNumber = null;
 let currentPage = 1;
 const usersPerPage = 10;
+let totalUsers = 0;
+let pageCursors = [null]; // pageCursors[i] is the cursor that loads page i + 1
 
 // --- INITIALIZATION ---
 document.addEventListener('DOMContentLoaded', function() {
@@ -150,8 +152,10 @@ function updateStatsUI(stats) {
 }
 
 // --- User Management ---
-async function loadUsers() {
+async function loadUsers(page = 1) {
     console.log("Calling /api/admin/users ..."); 
+    // Reloading from the first page forgets cursors that may have shifted
+    if (page === 1) pageCursors = [null];
     const usersLoading = document.getElementById('usersLoading');
     const userTable = document.getElementById('userTable');
     const noUsersMessage = document.getElementById('noUsersMessage');
@@ -161,14 +165,19 @@ async function loadUsers() {
     if (noUsersMessage) noUsersMessage.style.display = 'none';
 
     try {
-        const response = await fetch(`${API_BASE}/users`);
+        const params = new URLSearchParams({ limit: usersPerPage });
+        const cursor = pageCursors[page - 1];
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE}/users?${params}`);
         console.log('Users response:', response.status, response.statusText);
         
         if (response.ok) {
             const data = await response.json();
             console.log('Users data:', data);
             allUsers = data.users || []; 
-            displayUsersPage(1); 
+            totalUsers = data.total || 0;
+            if (data.nextCursor) pageCursors[page] = data.nextCursor;
+            displayUsersPage(page); 
         } else {
             const errorText = await response.text();
             console.error('Users API error:', errorText);
@@ -181,6 +190,7 @@ async function loadUsers() {
     }
 }
 
+// allUsers holds only the page fetched from the server
 function displayUsersPage(page, filteredUsers = null) {
     const usersToDisplay = filteredUsers !== null ? filteredUsers : allUsers;
     
@@ -204,9 +214,7 @@ function displayUsersPage(page, filteredUsers = null) {
     if (userTable) userTable.style.display = 'table';
     
     tbody.innerHTML = '';
-    const start = (page - 1) * usersPerPage;
-    const end = start + usersPerPage;
-    const paginatedUsers = usersToDisplay.slice(start, end);
+    const paginatedUsers = usersToDisplay.slice(0, usersPerPage);
 
     paginatedUsers.forEach(user => {
         const row = document.createElement('tr');
@@ -231,7 +239,7 @@ function displayUsersPage(page, filteredUsers = null) {
     });
 
     currentPage = page;
-    updatePagination(usersToDisplay.length, page);
+    updatePagination(filteredUsers !== null ? filteredUsers.length : totalUsers, page);
 }
 
 // --- Timetable ---
@@ -905,7 +913,6 @@ async function captureFace() {
     canvas.height = video.videoHeight;
     context.drawImage(video, 0, 0, canvas.width, canvas.height);
     
-    const imageDataUrl = canvas.toDataURL('image/jpeg');
     const userId = document.body.dataset.currentStudentId;
     
     if (!userId) {
@@ -916,10 +923,14 @@ async function captureFace() {
     showLoading(true);
     
     try {
+        // Upload the JPEG as binary multipart instead of a base64 JSON string
+        const imageBlob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg'));
+        const formData = new FormData();
+        formData.append('image', imageBlob, 'face.jpg');
+        
         const response = await fetch(`${API_BASE}/users/${userId}/register-face`, {
             method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({ image: imageDataUrl }),
+            body: formData,
         });
         
         const result = await response.json();
@@ -927,7 +938,7 @@ async function captureFace() {
         if (response.ok) {
             showNotification('Face registered successfully!', 'success');
             const capturedImage = document.getElementById('capturedImage');
-            if (capturedImage) capturedImage.src = imageDataUrl;
+            if (capturedImage) capturedImage.src = URL.createObjectURL(imageBlob);
             const captureResult = document.getElementById('captureResult');
             if (captureResult) captureResult.style.display = 'block';
             
@@ -946,18 +957,24 @@ async function captureFace() {
     }
 }
 
-function filterUsers() {
-    const searchTerm = document.getElementById('userSearch').value.toLowerCase();
+async function filterUsers() {
+    const searchInput = document.getElementById('userSearch');
+    const searchTerm = searchInput.value.trim();
     if (!searchTerm) {
-        displayUsersPage(1, allUsers);
+        displayUsersPage(currentPage);
         return;
     }
-    const filtered = allUsers.filter(user => 
-        user.name.toLowerCase().includes(searchTerm) ||
-        user.email?.toLowerCase().includes(searchTerm) ||
-        getUserDetails(user).toLowerCase().includes(searchTerm)
-    );
-    displayUsersPage(1, filtered);
+    try {
+        // Ranked matches across all users from the server's search index
+        const response = await fetch(`${API_BASE}/users/search?q=${encodeURIComponent(searchTerm)}&limit=${usersPerPage}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        // Ignore responses that arrive after the user kept typing
+        if (searchInput.value.trim() !== searchTerm) return;
+        displayUsersPage(currentPage, data.users || []);
+    } catch (error) {
+        console.error('Error searching users:', error);
+    }
 }
 
 // =================================================================================
@@ -996,26 +1013,28 @@ function updatePagination(totalItems, currentPage) {
         const prevButton = document.createElement('button');
         prevButton.innerHTML = '&laquo;';
         prevButton.onclick = () => {
-            displayUsersPage(currentPage - 1);
+            loadUsers(currentPage - 1);
         };
         paginationContainer.appendChild(prevButton);
     }
 
-    for (let i = 1; i <= totalPages; i++) {
+    // Only pages whose cursor is known can be jumped to
+    const reachablePages = Math.min(totalPages, pageCursors.length);
+    for (let i = 1; i <= reachablePages; i++) {
         const pageButton = document.createElement('button');
         pageButton.textContent = i;
         pageButton.className = (i === currentPage) ? 'active' : '';
         pageButton.onclick = () => {
-            displayUsersPage(i);
+            loadUsers(i);
         };
         paginationContainer.appendChild(pageButton);
     }
 
-    if (currentPage < totalPages) {
+    if (currentPage < totalPages && pageCursors[currentPage]) {
         const nextButton = document.createElement('button');
         nextButton.innerHTML = '&raquo;';
         nextButton.onclick = () => {
-            displayUsersPage(currentPage + 1);
+            loadUsers(currentPage + 1);
         };
         paginationContainer.appendChild(nextButton);
     }
@@ -376,9 +376,14 @@ function displayStudents(students) {
     }
     
     container.innerHTML = students.map(student => {
-        const attendancePercentage = student.totalAttendance || 0;
+        const attendancePercentage = student.totalAttendance;
         let attendanceClass = 'attendance-good';
-        if (attendancePercentage < 60) attendanceClass = 'attendance-danger';
+        let attendanceLabel = `${attendancePercentage}%`;
+        if (attendancePercentage === null || attendancePercentage === undefined) {
+            // No lectures held for this student yet
+            attendanceClass = 'attendance-none';
+            attendanceLabel = 'N/A';
+        } else if (attendancePercentage < 60) attendanceClass = 'attendance-danger';
         else if (attendancePercentage < 75) attendanceClass = 'attendance-warning';
         
         return `
@@ -388,7 +393,7 @@ function displayStudents(students) {
                     <p>${student.email} | ${student.studentId}</p>
                 </div>
                 <div>
-                    <span class="attendance-badge ${attendanceClass}">${attendancePercentage}%</span>
+                    <span class="attendance-badge ${attendanceClass}">${attendanceLabel}</span>
                 </div>
             </div>
         `;
@@ -0,0 +1,70 @@
+"""
+Convert face_encodings documents from lists of doubles to the compact
+versioned byte format read by the face recognition service.
+
+    python migrate_face_encodings.py [--dtype float16] [--dry-run]
+"""
+import argparse
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from backend.services.face_recognition_service import (
+    ENCODING_DTYPE_CODES,
+    ENCODING_STORAGE_DTYPE,
+    pack_encoding,
+    unpack_encoding,
+)
+from backend.utils.database import MAX_BATCH_WRITES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dtype', choices=sorted(ENCODING_DTYPE_CODES), default=ENCODING_STORAGE_DTYPE,
+                        help='storage dtype for the packed encodings')
+    parser.add_argument('--dry-run', action='store_true', help='count documents without writing')
+    args = parser.parse_args()
+
+    # --- Initialize Firestore ---
+    try:
+        cred = credentials.Certificate("serviceAccountKey.json")
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+    except Exception as e:
+        print(f"Error initializing Firebase: {e}\nPlease ensure 'serviceAccountKey.json' is present.")
+        exit()
+
+    db = firestore.client()
+
+    print(f"🚀 Migrating face encodings to packed {args.dtype}...")
+
+    batch = db.batch()
+    pending = 0
+    migrated = 0
+    skipped = 0
+    for doc in db.collection('face_encodings').stream():
+        encoding = doc.to_dict().get('encoding')
+        # Only legacy list documents need converting
+        if not isinstance(encoding, list) or not encoding:
+            skipped += 1
+            continue
+
+        migrated += 1
+        if args.dry_run:
+            continue
+        batch.update(doc.reference, {'encoding': pack_encoding(unpack_encoding(encoding), dtype=args.dtype)})
+        pending += 1
+        if pending == MAX_BATCH_WRITES:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+
+    action = "would be migrated" if args.dry_run else "migrated"
+    print(f"\n🎉 {migrated} documents {action}, {skipped} already packed or empty ✅")
+
+
+if __name__ == '__main__':
+    main()
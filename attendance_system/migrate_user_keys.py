@@ -0,0 +1,43 @@
+"""
+Reserve user_keys documents for users created before unique-key
+reservations existed. Until this has run, email, studentId and teacherId
+lookups fall back to queries on the users collection.
+
+    python migrate_user_keys.py [--dry-run]
+"""
+import argparse
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from backend.utils.database import FirestoreRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='count keys without writing')
+    args = parser.parse_args()
+
+    # --- Initialize Firestore ---
+    try:
+        cred = credentials.Certificate("serviceAccountKey.json")
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+    except Exception as e:
+        print(f"Error initializing Firebase: {e}\nPlease ensure 'serviceAccountKey.json' is present.")
+        exit()
+
+    db = firestore.client()
+
+    print("🚀 Reserving user keys...")
+    reserved, conflicts = FirestoreRepository(db).backfill_user_keys(dry_run=args.dry_run)
+
+    for conflict in conflicts:
+        print(f"❌ {conflict['field']} {conflict['value']} is shared by users {', '.join(conflict['userIds'])}")
+
+    action = "would be reserved" if args.dry_run else "reserved"
+    print(f"\n🎉 {reserved} keys {action}, {len(conflicts)} conflicts ✅")
+
+
+if __name__ == '__main__':
+    main()
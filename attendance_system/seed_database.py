@@ -2,16 +2,31 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import random
 
-# --- Initialize Firestore ---
-try:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app(cred)
-except Exception as e:
-    print(f"Error initializing Firebase: {e}\nPlease ensure 'serviceAccountKey.json' is present.")
-    exit()
-
-db = firestore.client()
+from backend.utils.database import DATABASE_BACKEND, init_repository
+
+# --- Initialize the configured backend ---
+db = None
+if DATABASE_BACKEND == 'firestore':
+    try:
+        cred = credentials.Certificate("serviceAccountKey.json")
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+    except Exception as e:
+        print(f"Error initializing Firebase: {e}\nPlease ensure 'serviceAccountKey.json' is present.")
+        exit()
+    db = firestore.client()
+
+# Everything goes through the repository so DATABASE_BACKEND=sqlite gets the
+# same reference data, and users get their email and ID reservations
+repository = init_repository(db)
+
+
+def upsert_user(user_id, data):
+    """Create the user, or overwrite its fields if it was seeded before"""
+    if repository.get_user(user_id):
+        repository.update_user(user_id, data)
+    else:
+        repository.create_user(data, user_id=user_id)
 
 # ==============================================================================
 # --- DATA DEFINITIONS ---
@@ -101,18 +116,18 @@ for branch in branches:
             })
 
 # ==============================================================================
-# --- UPLOAD TO FIRESTORE ---
+# --- UPLOAD ---
 # ==============================================================================
 
-print("🚀 Starting Firestore seeding...")
+print(f"🚀 Starting {DATABASE_BACKEND} seeding...")
 
 # Admin
-db.collection("users").document(admin_data["adminId"]).set(admin_data)
+upsert_user(admin_data["adminId"], admin_data)
 print("✅ Admin user added")
 
 # Teachers
 for t in teachers_data:
-    db.collection("users").document(t["teacherId"]).set(t)
+    upsert_user(t["teacherId"], t)
 print(f"✅ {len(teachers_data)} teachers added")
 
 # --- STUDENT DATA REMOVED AS REQUESTED ---
@@ -120,17 +135,21 @@ print("ℹ️ Student seeding skipped.")
 
 # Courses
 for c in courses_data:
-    db.collection("courses").document(c["courseCode"]).set(c)
+    repository.add_document("courses", c, doc_id=c["courseCode"])
 print(f"✅ {len(courses_data)} courses added")
 
 # Rooms
 for r in rooms_data:
-    db.collection("rooms").document(r["roomNumber"]).set(r)
+    repository.add_document("rooms", r, doc_id=r["roomNumber"])
 print(f"✅ {len(rooms_data)} rooms added")
 
 # Branches
 for b in branches_data:
-    db.collection("branches").document(b["branchId"]).set(b)
+    repository.add_document("branches", b, doc_id=b["branchId"])
 print(f"✅ {len(branches_data)} branches added")
 
-print("\n🎉 Seeding complete: Admin + Teachers + Courses + Rooms + Branches ✅")
\ No newline at end of file
+# Courses were written without touching the /stats counters
+repository.reconcile_counters()
+print("✅ Statistics counters reconciled")
+
+print("\n🎉 Seeding complete: Admin + Teachers + Courses + Rooms + Branches ✅")
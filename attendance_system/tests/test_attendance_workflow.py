@@ -1 +1,232 @@
+import itertools
+import threading
 
+import pytest
+from firebase_admin import firestore
+from flask import Flask
+from google.api_core.exceptions import AlreadyExists
+
+import backend.routes.admin_system_routes as admin_system_routes
+import backend.services.attendance_service as attendance_service
+import backend.utils.database as database
+from backend.routes.admin_system_routes import init_admin_system_routes
+from backend.services.attendance_service import (
+    SUMMARY_COLLECTION,
+    AttendanceBacklogError,
+    AttendanceWriter,
+    attendance_doc_id,
+    mark_attendance_bulk,
+)
+from backend.utils.cache import ReadThroughCache
+from backend.utils.database import SQLiteRepository
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.key = (collection, doc_id)
+        self.id = doc_id
+
+    def get(self):
+        return FakeSnapshot(self.id, self.db.docs.get(self.key))
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, self.name, doc_id)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def create(self, ref, data):
+        self.writes.append(('create', ref, data))
+
+    def set(self, ref, data, merge=False):
+        self.writes.append(('set', ref, data))
+
+    def commit(self):
+        # All or nothing, like a Firestore batch
+        with self.db.lock:
+            if any(kind == 'create' and ref.key in self.db.docs for kind, ref, _ in self.writes):
+                raise AlreadyExists('Document already exists')
+            self.db.commits.append(len(self.writes))
+            for _, ref, data in self.writes:
+                doc = self.db.docs.setdefault(ref.key, {})
+                for field, value in data.items():
+                    if isinstance(value, firestore.Increment):
+                        doc[field] = doc.get(field, 0) + value.value
+                    elif value is firestore.SERVER_TIMESTAMP:
+                        doc[field] = next(self.db.clock)
+                    else:
+                        doc[field] = value
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.commits = []
+        self.clock = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+    def record(self, session_id, user_id):
+        return self.docs.get(('attendance', attendance_doc_id(session_id, user_id)))
+
+    def attended(self, user_id):
+        return self.docs.get((SUMMARY_COLLECTION, user_id), {}).get('attended', 0)
+
+
+SESSION = {
+    'sessionId': 'tt1_2026-10-12',
+    'timetableId': 'tt1',
+    'timetableEntry': {'branchId': 'CSE_Y2_A', 'courseCode': 'C001', 'day': 'Monday', 'lectureNumber': 1},
+    'roster': {f"user{i}": {'studentId': f"S{i:03d}"} for i in range(10)}
+}
+
+
+def matches(*user_ids):
+    return [{'userId': user_id, 'distance': 0.3} for user_id in user_ids]
+
+
+@pytest.fixture
+def db():
+    return FakeFirestore()
+
+
+@pytest.fixture
+def writer(db):
+    writer = AttendanceWriter(db, flush_interval_ms=50)
+    yield writer
+    writer.stop(timeout=5)
+
+
+def results(futures):
+    return [future.result(timeout=5) for future in futures]
+
+
+def test_concurrent_submits_share_one_commit(db, writer):
+    futures = writer.submit_many(SESSION, matches('user0', 'user1'), 'group_photo')
+    futures.append(writer.submit(SESSION, matches('user2')[0], 'manual'))
+
+    assert results(futures) == [True, True, True]
+    # Three records and three summary increments in a single batch
+    assert db.commits == [6]
+    assert db.record(SESSION['sessionId'], 'user2')['method'] == 'manual'
+    assert writer.stats()['marksCommitted'] == 3
+
+
+def test_duplicates_in_a_batch_are_written_once(db, writer):
+    assert results(writer.submit_many(SESSION, matches('user0', 'user0', 'user1'), 'group_photo')) == [True, False, True]
+    assert db.commits == [4]
+    assert db.attended('user0') == 1
+
+
+def test_re_mark_keeps_the_original_record_without_writing(db, writer):
+    assert writer.submit(SESSION, matches('user0')[0], 'face').result(timeout=5)
+    original = db.record(SESSION['sessionId'], 'user0')
+
+    assert not writer.submit(SESSION, matches('user0')[0], 'manual').result(timeout=5)
+    assert len(db.commits) == 1
+    assert db.record(SESSION['sessionId'], 'user0') == original
+    assert db.attended('user0') == 1
+
+
+def test_marks_already_written_by_another_process_are_not_recounted(db, writer):
+    other = AttendanceWriter(db, flush_interval_ms=1)
+    assert other.submit(SESSION, matches('user0')[0], 'face').result(timeout=5)
+    other.stop(timeout=5)
+    original = db.record(SESSION['sessionId'], 'user0')
+
+    assert results(writer.submit_many(SESSION, matches('user0', 'user1'), 'group_photo')) == [False, True]
+    assert db.record(SESSION['sessionId'], 'user0') == original
+    assert db.attended('user0') == 1 and db.attended('user1') == 1
+
+
+def test_resubmitted_photo_marks_nobody_new(db, writer, monkeypatch):
+    monkeypatch.setattr(attendance_service, '_writer', writer)
+    assert mark_attendance_bulk(db, SESSION, matches('user0', 'user1'), 'group_photo') == 2
+    assert mark_attendance_bulk(db, SESSION, matches('user0', 'user1'), 'group_photo') == 0
+    assert mark_attendance_bulk(db, SESSION, matches('user1', 'user2'), 'group_photo') == 1
+
+
+def test_backlog_limit_rejects_marks(db):
+    writer = AttendanceWriter(db, flush_interval_ms=10000, max_marks=100, max_backlog=3)
+    writer.submit_many(SESSION, matches('user0', 'user1'), 'face')
+    with pytest.raises(AttendanceBacklogError):
+        writer.submit_many(SESSION, matches('user2', 'user3'), 'face')
+    writer.stop(timeout=5)
+
+
+def test_stop_flushes_queued_marks(db):
+    writer = AttendanceWriter(db, flush_interval_ms=10000)
+    futures = writer.submit_many(SESSION, matches('user0', 'user1'), 'face')
+    writer.stop(timeout=5)
+
+    assert results(futures) == [True, True]
+    with pytest.raises(RuntimeError):
+        writer.submit(SESSION, matches('user2')[0], 'face')
+
+
+# --- Student roster ---
+@pytest.fixture
+def roster_client(db, tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'attendance_system.db'))
+    monkeypatch.setattr(database, '_repository', repository)
+    monkeypatch.setattr(admin_system_routes, 'reference_cache', ReadThroughCache(60))
+    flask_app = Flask(__name__)
+    init_admin_system_routes(flask_app, db)
+    return flask_app.test_client(), repository
+
+
+def test_roster_carries_each_students_attendance_percentage(db, roster_client):
+    client, repository = roster_client
+    repository.add_document('branches', {'branchId': 'CSE_Y2_A', 'branchName': 'Computer Science'})
+    user_ids = [repository.create_user({'role': 'Student', 'name': name, 'studentId': student_id,
+                                        'email': f"{student_id}@college.edu", 'branchId': branch_id,
+                                        'year': year, 'division': division})
+                for name, student_id, branch_id, year, division in (
+                    ('Aarav', 'S1', 'CSE_Y2_A', 2, 'A'),
+                    ('Diya', 'S2', 'CSE_Y2_A', 2, 'A'),
+                    ('Kabir', 'S3', 'CSE_Y2_B', 2, 'B'))]
+    db.docs[(SUMMARY_COLLECTION, user_ids[0])] = {'attended': 3, 'held': 4}
+
+    # Branch display names resolve to the code in the composed class id
+    response = client.get('/api/admin/system/student/fetch?branch=Computer Science&year=2&division=A')
+    assert response.status_code == 200
+    students = {student['name']: student for student in response.get_json()['students']}
+    assert sorted(students) == ['Aarav', 'Diya']
+    assert (students['Aarav']['attendedLectures'], students['Aarav']['heldLectures'],
+            students['Aarav']['totalAttendance']) == (3, 4, 75.0)
+    # No lecture held yet is no percentage rather than 0%
+    assert (students['Diya']['heldLectures'], students['Diya']['totalAttendance']) == (0, None)
+
+
+def test_roster_requires_the_whole_class(roster_client):
+    client, _ = roster_client
+    response = client.get('/api/admin/system/student/fetch?branch=CSE&year=2')
+    assert response.status_code == 400
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+import backend.routes.admin_routes as admin_routes
+import backend.utils.database as database
+from backend.routes.admin_routes import init_admin_routes
+from backend.utils import cache as cache_module
+from backend.utils.cache import LRUCache, ReadThroughCache, approx_size
+from backend.utils.database import SQLiteRepository
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def sized_cache(max_bytes, ttl_seconds=60):
+    # Values are their own size so the byte accounting is easy to follow
+    return LRUCache(max_bytes, ttl_seconds, sizeof=lambda value: value)
+
+
+def test_evicts_least_recently_used_to_stay_under_max_bytes(clock):
+    cache = sized_cache(100)
+    cache.set('a', 40)
+    cache.set('b', 40)
+    assert cache.get('a') == 40    # 'b' is now the least recently used
+    cache.set('c', 40)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 40 and cache.get('c') == 40
+    stats = cache.stats()
+    assert stats['bytes'] == 80 and stats['evictions'] == 1
+
+
+def test_replacing_a_key_releases_its_old_size(clock):
+    cache = sized_cache(100)
+    cache.set('a', 90)
+    cache.set('a', 10)
+    cache.set('b', 90)
+    assert cache.stats()['bytes'] == 100
+    assert len(cache) == 2
+
+
+def test_value_larger_than_the_cache_is_not_stored(clock):
+    cache = sized_cache(100)
+    cache.set('a', 50)
+    cache.set('huge', 101)
+    assert cache.get('huge') is None
+    assert cache.get('a') == 50
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = sized_cache(100, ttl_seconds=10)
+    cache.set('a', 1)
+    cache.set('b', 1, ttl_seconds=30)
+
+    clock[0] += 10
+    assert cache.get('a') == 1
+    clock[0] += 0.5
+    assert cache.get('a') is None
+    assert cache.get('b') == 1
+    assert cache.stats()['bytes'] == 1
+
+
+def test_hit_rate_and_invalidate(clock):
+    cache = sized_cache(100)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('missing')
+    assert cache.stats()['hitRate'] == 0.5
+    assert cache.invalidate('a') and not cache.invalidate('a')
+    assert cache.stats()['bytes'] == 0
+
+
+def test_approx_size_counts_array_buffers():
+    small = approx_size((np.zeros(2), np.zeros(2)))
+    large = approx_size((np.zeros(2000), np.zeros(2)))
+    assert large - small >= 1998 * 8
+
+
+# --- Read-through cache ---
+def test_loader_runs_only_on_a_miss(clock):
+    cache = ReadThroughCache(60)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return ['Room-101']
+
+    first = cache.get('rooms', loader)
+    assert cache.get('rooms', loader) == first
+    assert len(loads) == 1
+
+    cache.invalidate('rooms')
+    assert cache.get('rooms', loader) == first
+    assert len(loads) == 2
+
+
+def test_invalidate_during_a_load_discards_the_stale_value(clock):
+    cache = ReadThroughCache(60)
+    rooms = ['Room-101']
+
+    def stale_loader():
+        value = list(rooms)
+        # A write lands and invalidates after this load read the old rows
+        rooms.append('Room-102')
+        cache.invalidate('rooms')
+        return value
+
+    value, _ = cache.get('rooms', stale_loader)
+    assert value == ['Room-101']
+    # The stale result was served to its caller but not stored
+    assert cache.get('rooms', lambda: list(rooms))[0] == ['Room-101', 'Room-102']
+
+
+def test_etag_follows_the_value(clock):
+    cache = ReadThroughCache(60)
+    _, etag = cache.get('a', lambda: {'x': 1})
+    _, same = ReadThroughCache(60).get('a', lambda: {'x': 1})
+    _, other = ReadThroughCache(60).get('a', lambda: {'x': 2})
+    assert etag == same and etag != other
+
+
+@pytest.fixture
+def reference_client(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'attendance_system.db'))
+    monkeypatch.setattr(database, '_repository', repository)
+    monkeypatch.setattr(admin_routes, 'reference_cache', ReadThroughCache(60))
+    flask_app = Flask(__name__)
+    init_admin_routes(flask_app, None)
+    return flask_app.test_client(), repository
+
+
+def test_unchanged_reference_data_revalidates_with_304(reference_client):
+    client, repository = reference_client
+    repository.add_document('rooms', {'roomNumber': 'Room-101'}, doc_id='Room-101')
+
+    response = client.get('/api/admin/rooms')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    cached = client.get('/api/admin/rooms', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+
+    repository.add_document('rooms', {'roomNumber': 'Room-102'}, doc_id='Room-102')
+    assert client.post('/api/admin/reference-cache/invalidate').status_code == 200
+    changed = client.get('/api/admin/rooms', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert len(changed.get_json()) == 2
@@ -0,0 +1,361 @@
+import itertools
+
+import pytest
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+import backend.utils.database as database
+from backend.routes.admin_routes import decode_cursor, encode_cursor
+from backend.utils.database import DuplicateUserKeyError, FirestoreRepository, SQLiteRepository
+
+
+@pytest.fixture
+def repository(tmp_path):
+    return SQLiteRepository(str(tmp_path / 'attendance_system.db'))
+
+
+@pytest.fixture
+def user_changes(monkeypatch):
+    changes = []
+    monkeypatch.setattr(database, '_user_listeners', [lambda user_id, data: changes.append((user_id, data))])
+    return changes
+
+
+def add_users(repository, names):
+    return [repository.create_user({'role': 'Student', 'name': name, 'email': f"s{i}@college.edu"})
+            for i, name in enumerate(names)]
+
+
+# --- Keyset pagination ---
+def all_pages(repository, limit, name_prefix=None):
+    pages = []
+    after = None
+    while True:
+        users, after = repository.list_users_page(name_prefix=name_prefix, limit=limit, after=after)
+        pages.append([user['name'] for user in users])
+        if after is None:
+            return pages
+        # Round-trip the position the way GET /users hands it to the client
+        after = decode_cursor(encode_cursor(after))
+
+
+def test_pages_cover_every_user_once_in_name_order(repository):
+    # Repeated names are ordered by id so no page boundary drops or repeats one
+    names = ['Diya', 'Aarav', 'Ira', 'Aarav', 'Myra', 'Aarav', 'Navya']
+    user_ids = add_users(repository, names)
+
+    pages = all_pages(repository, limit=2)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert sum(pages, []) == sorted(names)
+
+    seen = []
+    after = None
+    while True:
+        users, after = repository.list_users_page(limit=2, after=after)
+        seen.extend(user['id'] for user in users)
+        if after is None:
+            break
+    assert sorted(seen) == sorted(user_ids) and len(set(seen)) == len(seen)
+
+
+def test_exact_multiple_of_the_page_size_has_no_empty_last_page(repository):
+    add_users(repository, ['A', 'B', 'C', 'D'])
+    assert all_pages(repository, limit=2) == [['A', 'B'], ['C', 'D']]
+
+
+def test_pages_respect_the_name_prefix(repository):
+    add_users(repository, ['Aarav', 'Ananya', 'Anika', 'Diya', 'Aadhya'])
+    assert sum(all_pages(repository, limit=2, name_prefix='An'), []) == ['Ananya', 'Anika']
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor')
+
+
+# --- Change notifications ---
+def test_deleting_a_missing_user_notifies_nobody(repository, user_changes):
+    user_id, = add_users(repository, ['Aarav'])
+    user_changes.clear()
+
+    assert not repository.delete_user('missing')
+    assert user_changes == []
+    assert repository.delete_user(user_id)
+    assert user_changes == [(user_id, None)]
+
+
+# --- SQLite user keys ---
+def test_email_lookup_ignores_case_and_spacing(repository):
+    user_id = repository.create_user({'role': 'Teacher', 'name': 'Ira', 'email': 'Ira.Menon@College.edu'})
+    assert repository.find_user('email', ' ira.menon@college.EDU ')['id'] == user_id
+    # The document keeps the address as entered
+    assert repository.get_user(user_id)['email'] == 'Ira.Menon@College.edu'
+
+
+def test_emails_differing_only_in_case_are_duplicates(repository):
+    repository.create_user({'role': 'Student', 'name': 'Ira', 'email': 'ira@college.edu'})
+    with pytest.raises(DuplicateUserKeyError) as error:
+        repository.create_user({'role': 'Student', 'name': 'Ira M', 'email': 'IRA@college.edu'})
+    assert error.value.field == 'email'
+
+
+def test_existing_mixed_case_emails_are_normalised_on_open(tmp_path):
+    path = str(tmp_path / 'attendance_system.db')
+    repository = SQLiteRepository(path)
+    with repository._conn() as conn:
+        conn.execute("INSERT INTO users (id, name, email, data) VALUES ('u1', 'Ira', 'Ira@College.edu', '{}')")
+
+    assert SQLiteRepository(path).find_user('email', 'ira@college.edu')['id'] == 'u1'
+
+
+# --- Firestore user keys ---
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self.exists else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self.id, self.db.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        self.db.write(self.path, data, merge)
+
+    def collection(self, name):
+        return FakeQuery(self.db, f"{self.path}/{name}")
+
+
+class FakeQuery:
+    def __init__(self, db, path, filters=()):
+        self.db = db
+        self.path = path
+        self.filters = filters
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.db, f"{self.path}/{doc_id or f'auto{next(self.db.ids)}'}")
+
+    def where(self, field, op, value):
+        assert op == '=='
+        return FakeQuery(self.db, self.path, self.filters + ((field, value),))
+
+    def limit(self, count):
+        return self
+
+    def _matches(self):
+        prefix = self.path + '/'
+        return [FakeSnapshot(path[len(prefix):], data) for path, data in sorted(self.db.docs.items())
+                if path.startswith(prefix) and '/' not in path[len(prefix):]
+                and all(data.get(field) == value for field, value in self.filters)]
+
+    def stream(self):
+        docs = self._matches()
+        self.db.streamed += len(docs)
+        return iter(docs)
+
+    def get(self):
+        return list(self.stream())
+
+    def count(self):
+        total = type('Aggregate', (), {'value': len(self._matches())})()
+        return type('AggregateQuery', (), {'get': lambda self: [[total]]})()
+
+
+class FakeWriter:
+    """Batch or transaction; writes apply together on commit"""
+
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def create(self, ref, data):
+        self.writes.append(('create', ref, data))
+
+    def set(self, ref, data, merge=False):
+        self.writes.append(('merge' if merge else 'set', ref, data))
+
+    def update(self, ref, data):
+        self.writes.append(('merge', ref, data))
+
+    def delete(self, ref):
+        self.writes.append(('delete', ref, None))
+
+    def commit(self):
+        if any(op == 'create' and ref.path in self.db.docs for op, ref, _ in self.writes):
+            raise AlreadyExists('Document already exists')
+        for op, ref, data in self.writes:
+            if op == 'delete':
+                self.db.docs.pop(ref.path, None)
+            else:
+                self.db.write(ref.path, data, merge=op == 'merge')
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.ids = itertools.count()
+        self.streamed = 0
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def batch(self):
+        return FakeWriter(self)
+
+    def transaction(self):
+        return FakeWriter(self)
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+    def write(self, path, data, merge=False):
+        current = dict(self.docs.get(path) or {}) if merge else {}
+        for field, value in data.items():
+            if isinstance(value, firestore.Increment):
+                value = current.get(field, 0) + value.value
+            current[field] = value
+        self.docs[path] = current
+
+    def keys(self):
+        return {path.split('/')[1]: data['userId'] for path, data in self.docs.items()
+                if path.startswith('user_keys/') and 'userId' in data}
+
+
+def fake_transactional(fn):
+    """Run the function once and commit its writes, or none if it raises"""
+    def run(transaction):
+        result = fn(transaction)
+        transaction.commit()
+        return result
+    return run
+
+
+@pytest.fixture
+def firestore_repository(monkeypatch, user_changes):
+    monkeypatch.setattr(database.firestore, 'transactional', fake_transactional)
+    db = FakeFirestore()
+    db.docs['user_keys/_meta'] = {'backfilled': True}
+    return FirestoreRepository(db)
+
+
+def test_create_reserves_every_key(firestore_repository):
+    user_id = firestore_repository.create_user(
+        {'role': 'Student', 'name': 'Aarav', 'email': 'Aarav@College.edu', 'studentId': 'S1'})
+
+    assert firestore_repository.db.keys() == {'email:aarav@college.edu': user_id, 'studentId:S1': user_id}
+    assert firestore_repository.find_user('email', 'aarav@college.edu')['id'] == user_id
+    assert firestore_repository.read_counters()['studentsCount'] == 1
+
+
+def test_duplicate_key_rejects_the_whole_create(firestore_repository, user_changes):
+    firestore_repository.create_user({'role': 'Student', 'name': 'Aarav', 'email': 'a@college.edu', 'studentId': 'S1'})
+    before = dict(firestore_repository.db.docs)
+    user_changes.clear()
+
+    with pytest.raises(DuplicateUserKeyError) as error:
+        firestore_repository.create_user({'role': 'Student', 'name': 'Ira', 'email': 'i@college.edu', 'studentId': 'S1'})
+    assert error.value.field == 'studentId'
+    assert firestore_repository.db.docs == before and user_changes == []
+
+
+def test_update_moves_the_key_to_the_new_value(firestore_repository):
+    user_id = firestore_repository.create_user({'role': 'Teacher', 'name': 'Ira', 'email': 'ira@college.edu'})
+    firestore_repository.update_user(user_id, {'email': 'ira.menon@college.edu'})
+
+    assert firestore_repository.db.keys() == {'email:ira.menon@college.edu': user_id}
+    assert firestore_repository.get_user(user_id)['email'] == 'ira.menon@college.edu'
+
+
+def test_update_to_a_taken_value_changes_nothing(firestore_repository):
+    ira = firestore_repository.create_user({'role': 'Teacher', 'name': 'Ira', 'email': 'ira@college.edu'})
+    firestore_repository.create_user({'role': 'Teacher', 'name': 'Diya', 'email': 'diya@college.edu'})
+    before = dict(firestore_repository.db.docs)
+
+    with pytest.raises(DuplicateUserKeyError):
+        firestore_repository.update_user(ira, {'email': 'DIYA@college.edu'})
+    assert firestore_repository.db.docs == before
+
+
+def test_update_keeps_an_old_key_reserved_for_someone_else(firestore_repository):
+    # Two users written outside the repository ended up sharing an email;
+    # the reservation belongs to Diya
+    ira = firestore_repository.create_user({'role': 'Teacher', 'name': 'Ira', 'email': 'ira@college.edu'})
+    diya = firestore_repository.create_user({'role': 'Teacher', 'name': 'Diya', 'email': 'diya@college.edu'})
+    firestore_repository.db.docs[f"users/{ira}"]['email'] = 'diya@college.edu'
+
+    firestore_repository.update_user(ira, {'email': 'ira.menon@college.edu'})
+
+    assert firestore_repository.db.keys() == {
+        'email:ira@college.edu': ira, 'email:diya@college.edu': diya, 'email:ira.menon@college.edu': ira}
+
+
+def test_delete_releases_only_owned_keys(firestore_repository, user_changes):
+    ira = firestore_repository.create_user({'role': 'Teacher', 'name': 'Ira', 'email': 'ira@college.edu',
+                                            'teacherId': 'T1'})
+    diya = firestore_repository.create_user({'role': 'Teacher', 'name': 'Diya', 'email': 'diya@college.edu'})
+    firestore_repository.db.docs[f"users/{ira}"]['email'] = 'diya@college.edu'
+    user_changes.clear()
+
+    assert firestore_repository.delete_user(ira)
+    assert firestore_repository.db.keys() == {'email:ira@college.edu': ira, 'email:diya@college.edu': diya}
+    assert firestore_repository.read_counters()['teachersCount'] == 1
+    assert user_changes == [(ira, None)]
+    assert not firestore_repository.delete_user(ira)
+
+
+# --- Firestore counters ---
+def shards(repository):
+    return {path.rsplit('/', 1)[-1]: data for path, data in repository.db.docs.items()
+            if path.startswith('counters/stats/shards/')}
+
+
+def test_user_writes_spread_over_shards_and_sum_back(firestore_repository, monkeypatch):
+    picks = itertools.cycle(range(database.COUNTER_SHARDS))
+    monkeypatch.setattr(database.random, 'randrange', lambda stop: next(picks) % stop)
+    for i in range(6):
+        firestore_repository.create_user({'role': 'Student' if i % 3 else 'Teacher', 'name': f"U{i}",
+                                          'email': f"u{i}@college.edu"})
+    firestore_repository.delete_user(firestore_repository.find_user('email', 'u1@college.edu')['id'])
+
+    assert len(shards(firestore_repository)) == min(database.COUNTER_SHARDS, 7)
+    assert firestore_repository.read_counters() == {
+        'totalUsers': 5, 'studentsCount': 3, 'teachersCount': 2, 'coursesCount': 0, 'timetableEntries': 0}
+
+
+def test_reconcile_adds_the_drift_without_overwriting_shards(firestore_repository, monkeypatch):
+    monkeypatch.setattr(database.random, 'randrange', lambda stop: 0)
+    firestore_repository.create_user({'role': 'Student', 'name': 'Aarav', 'email': 'a@college.edu'})
+    # A teacher counted on another shard by another process, and a course
+    # written without the repository, so no counter moved for it
+    firestore_repository.db.docs['users/other'] = {'role': 'Teacher', 'name': 'Ira'}
+    firestore_repository.db.docs['counters/stats/shards/1'] = {'totalUsers': 1, 'teachersCount': 1}
+    firestore_repository.db.docs['courses/C001'] = {'courseName': 'Maths'}
+
+    totals = firestore_repository.reconcile_counters()
+
+    assert totals == {'totalUsers': 2, 'studentsCount': 1, 'teachersCount': 1, 'coursesCount': 1,
+                      'timetableEntries': 0}
+    assert firestore_repository.read_counters() == totals
+    # Only the missing course was added, as an increment on one shard
+    assert shards(firestore_repository) == {'0': {'totalUsers': 1, 'studentsCount': 1, 'coursesCount': 1},
+                                            '1': {'totalUsers': 1, 'teachersCount': 1}}
+
+
+def test_counts_use_aggregation_queries(firestore_repository):
+    for number in range(3):
+        firestore_repository.add_document('courses', {'courseName': f"Course {number}"})
+    assert firestore_repository.count_documents('courses') == 3
+    assert firestore_repository.count_timetable() == 0
+    assert firestore_repository.db.streamed == 0
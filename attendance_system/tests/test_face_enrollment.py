@@ -0,0 +1,182 @@
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import backend.routes.admin_routes as admin_routes
+import backend.services.face_enrollment as face_enrollment
+import backend.services.face_recognition_service as face_service
+import backend.utils.database as database
+from backend.routes.admin_routes import init_admin_routes
+from backend.services.face_enrollment import enroll_faces_from_zip
+from backend.services.face_recognition_service import ENCODING_SIZE, FaceMatcher
+from backend.services.face_workers import FaceDetectionError, FaceWorkerPool
+from backend.utils.database import SQLiteRepository
+
+# Image bytes name the face they contain; random faces are far apart
+FACES = {f"face{i}".encode(): encoding
+         for i, encoding in enumerate(np.random.default_rng(0).normal(0, 0.1, (6, ENCODING_SIZE)))}
+
+
+def fake_encode(image_bytes):
+    if image_bytes not in FACES:
+        raise FaceDetectionError("No face was detected in the image. Please try again.")
+    return FACES[image_bytes]
+
+
+class FakePool:
+    """Runs each job when it is waited on"""
+
+    workers = 2
+    max_pending = 4
+
+    def __init__(self):
+        self.jobs = {}
+
+    def submit(self, fn, image_bytes, kind=None):
+        job_id = f"job{len(self.jobs)}"
+        self.jobs[job_id] = image_bytes
+        return job_id
+
+    def wait(self, job_id, timeout=None):
+        return fake_encode(self.jobs[job_id])
+
+
+class FakeRef:
+    def __init__(self, doc_id):
+        self.id = doc_id
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = {}
+
+    def set(self, ref, data):
+        self.writes[ref.id] = data
+
+    def commit(self):
+        self.db.commits.append(len(self.writes))
+        self.db.encodings.update(self.writes)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.encodings = {}
+        self.commits = []
+
+    def collection(self, name):
+        assert name == 'face_encodings'
+        return type('Collection', (), {'document': staticmethod(FakeRef)})()
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def students(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'attendance_system.db'))
+    monkeypatch.setattr(database, '_repository', repository)
+    user_ids = {student_id: repository.create_user({'role': 'Student', 'name': student_id, 'studentId': student_id,
+                                                    'email': f"{student_id}@college.edu"})
+                for student_id in ('S1', 'S2', 'S3', 'S4')}
+
+    # S4 is already enrolled with face5
+    matcher = FaceMatcher()
+    matcher.add(user_ids['S4'], FACES[b'face5'])
+    monkeypatch.setattr(face_service, '_matcher', matcher)
+    added = []
+    monkeypatch.setattr(face_enrollment, 'update_face_matcher', lambda user_id, encoding: added.append(user_id))
+    return user_ids, added
+
+
+def zip_of(files):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    archive.seek(0)
+    return archive
+
+
+def test_every_image_gets_a_result(students):
+    user_ids, added = students
+    db = FakeFirestore()
+    report = enroll_faces_from_zip(db, zip_of({
+        'photos/S1.jpg': b'face1',
+        'photos/S2.png': b'blurry',
+        'S9.jpg': b'face3',
+        'notes.txt': b'skipped',
+        '__MACOSX/._S1.jpg': b'skipped',
+    }), FakePool())
+
+    assert (report['total'], report['enrolled'], report['failed']) == (3, 1, 2)
+    assert [(result['file'], result['status']) for result in report['results']] == [
+        ('photos/S1.jpg', 'enrolled'), ('photos/S2.png', 'failed'), ('S9.jpg', 'failed')]
+    assert report['results'][2]['error'] == 'No student with this studentId'
+    assert list(db.encodings) == [user_ids['S1']] and added == [user_ids['S1']]
+
+
+def test_one_face_under_two_student_ids_is_enrolled_once(students):
+    user_ids, _ = students
+    db = FakeFirestore()
+    report = enroll_faces_from_zip(db, zip_of({'S1.jpg': b'face1', 'S2.jpg': b'face1', 'S3.jpg': b'face3'}),
+                                   FakePool())
+
+    assert [result['status'] for result in report['results']] == ['enrolled', 'failed', 'enrolled']
+    assert report['results'][1]['error'] == "Same face as S1.jpg in this archive"
+    assert sorted(db.encodings) == sorted([user_ids['S1'], user_ids['S3']])
+
+
+def test_face_of_an_enrolled_student_is_rejected(students):
+    user_ids, _ = students
+    report = enroll_faces_from_zip(FakeFirestore(), zip_of({'S1.jpg': b'face5', 'S4.jpg': b'face5'}), FakePool())
+
+    assert report['results'][0]['error'] == f"Face is already registered to user {user_ids['S4']}"
+    # Re-enrolling a student with their own face is allowed
+    assert report['results'][1]['status'] == 'enrolled'
+
+
+def test_encodings_are_committed_in_batches(students, monkeypatch):
+    monkeypatch.setattr(face_enrollment, 'MAX_BATCH_WRITES', 2)
+    db = FakeFirestore()
+    report = enroll_faces_from_zip(db, zip_of({'S1.jpg': b'face1', 'S2.jpg': b'face2', 'S3.jpg': b'face3'}),
+                                   FakePool())
+    assert report['enrolled'] == 3
+    assert db.commits == [2, 1]
+
+
+@pytest.fixture
+def enroll_client(students, monkeypatch):
+    # Threads stand in for the worker processes, which would need dlib
+    pool = FaceWorkerPool(workers=2, max_pending=4)
+    pool._executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(face_enrollment, 'encode_single_face', fake_encode)
+    monkeypatch.setattr(admin_routes, 'get_face_worker_pool', lambda: pool)
+    db = FakeFirestore()
+    flask_app = Flask(__name__)
+    init_admin_routes(flask_app, db)
+    yield flask_app.test_client(), pool, db
+    pool.shutdown()
+
+
+def test_bulk_route_enrolls_the_archive_as_a_job(enroll_client):
+    client, pool, db = enroll_client
+    response = client.post('/api/admin/face-enrollment/bulk', content_type='multipart/form-data',
+                           data={'archive': (zip_of({'S1.jpg': b'face1', 'S2.jpg': b'face2'}), 'faces.zip')})
+
+    assert response.status_code == 202
+    job_id = response.get_json()['jobId']
+    assert pool.wait(job_id, timeout=5)['enrolled'] == 2
+    assert pool.status(job_id)['kind'] == 'bulk-enroll'
+    assert len(db.encodings) == 2
+
+
+def test_bulk_route_rejects_files_that_are_not_zips(enroll_client):
+    client, _, _ = enroll_client
+    response = client.post('/api/admin/face-enrollment/bulk', content_type='multipart/form-data',
+                           data={'archive': (io.BytesIO(b'not a zip'), 'faces.zip')})
+    assert response.status_code == 400
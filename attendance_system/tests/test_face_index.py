@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.services.face_index import IVFFaceIndex
+from backend.services.face_recognition_service import ENCODING_SIZE, FaceMatcher
+
+
+def clustered_encodings(size, seed=0):
+    """Encodings grouped the way dlib embeddings cluster by appearance"""
+    rng = np.random.default_rng(seed)
+    groups = rng.normal(0, 0.12, (max(size // 200, 1), ENCODING_SIZE)).astype(np.float32)
+    members = groups[rng.integers(0, len(groups), size)]
+    return members + rng.normal(0, 0.05, (size, ENCODING_SIZE)).astype(np.float32)
+
+
+@pytest.fixture(scope='module')
+def gallery():
+    encodings = clustered_encodings(4000)
+    user_ids = [f"user{i}" for i in range(len(encodings))]
+    rng = np.random.default_rng(1)
+    targets = rng.choice(len(encodings), 200, replace=False)
+    probes = encodings[targets] + rng.normal(0, 0.03, (len(targets), ENCODING_SIZE)).astype(np.float32)
+    return user_ids, encodings, probes
+
+
+@pytest.fixture(scope='module')
+def ivf(gallery):
+    user_ids, encodings, _ = gallery
+    index = IVFFaceIndex()
+    index.load(zip(user_ids, encodings))
+    return index
+
+
+def test_recall_against_exact_search(gallery, ivf):
+    user_ids, encodings, probes = gallery
+    exact = FaceMatcher()
+    exact.load(zip(user_ids, encodings))
+    truth = [matches[0]['userId'] for matches in exact.match(probes, tolerance=None)]
+    found = [matches[0]['userId'] for matches in ivf.match(probes, tolerance=None)]
+
+    assert len(ivf.lists) > 1
+    assert np.mean([a == b for a, b in zip(found, truth)]) >= 0.95
+
+
+def test_probing_every_list_is_exact(gallery, ivf):
+    user_ids, encodings, probes = gallery
+    exact = FaceMatcher()
+    exact.load(zip(user_ids, encodings))
+    truth = exact.match(probes[:20], k=3, tolerance=None)
+    found = ivf.match(probes[:20], k=3, tolerance=None, nprobe=len(ivf.lists))
+    assert [[m['userId'] for m in row] for row in found] == [[m['userId'] for m in row] for row in truth]
+
+
+def test_small_gallery_stays_one_exact_list():
+    encodings = clustered_encodings(20)
+    index = IVFFaceIndex()
+    index.load((f"user{i}", encoding) for i, encoding in enumerate(encodings))
+    assert len(index.lists) == 1
+    assert index.match(encodings[7], tolerance=None)[0]['userId'] == 'user7'
+
+
+def test_add_and_remove_after_training(gallery):
+    user_ids, encodings, _ = gallery
+    index = IVFFaceIndex()
+    index.load(zip(user_ids[:1000], encodings[:1000]))
+
+    index.add('late', encodings[1500])
+    assert index.match(encodings[1500], tolerance=None, nprobe=len(index.lists))[0]['userId'] == 'late'
+    assert index.remove('late')
+    assert 'late' not in index and not index.remove('late')
+
+
+def test_save_and_load_skip_retraining(gallery, ivf, tmp_path):
+    _, encodings, probes = gallery
+    path = str(tmp_path / 'face_index_ivf.npz')
+    ivf.save(path)
+    assert os.listdir(tmp_path) == ['face_index_ivf.npz']
+
+    reloaded = IVFFaceIndex()
+    reloaded.load_file(path)
+    np.testing.assert_array_equal(reloaded.centroids, ivf.centroids)
+    assert len(reloaded) == len(ivf)
+    assert reloaded.match(probes[:20], tolerance=None) == ivf.match(probes[:20], tolerance=None)
@@ -1 +1,339 @@
+from datetime import datetime, timedelta, timezone
 
+import numpy as np
+import pytest
+
+import backend.services.face_recognition_service as face_service
+from backend.services.face_recognition_service import (
+    ENCODING_SIZE,
+    DuplicateFaceError,
+    FaceMatcher,
+    catch_up_face_index,
+    check_duplicate_face,
+    encoding_from_doc,
+    face_encoding_tombstone,
+    pack_encoding,
+    top_k_matches,
+    unpack_encoding,
+)
+
+
+def random_encodings(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.1, (count, ENCODING_SIZE)).astype(np.float32)
+
+
+def brute_force(gallery, user_ids, probe, k, tolerance):
+    distances = [float(np.linalg.norm(probe - row)) for row in gallery]
+    order = sorted(range(len(user_ids)), key=lambda i: distances[i])[:k]
+    return [(user_ids[i], distances[i]) for i in order if tolerance is None or distances[i] <= tolerance]
+
+
+# --- FaceMatcher ---
+@pytest.mark.parametrize('k', [1, 3, 50])
+def test_match_agrees_with_brute_force(k):
+    gallery = random_encodings(50)
+    user_ids = [f"user{i}" for i in range(50)]
+    probes = gallery[:10] + random_encodings(10, seed=1) * 0.3
+    matcher = FaceMatcher(capacity=4)
+    matcher.load(zip(user_ids, gallery))
+
+    for probe, matches in zip(probes, matcher.match(probes, k=k, tolerance=None)):
+        expected = brute_force(gallery, user_ids, probe, k, None)
+        assert [match['userId'] for match in matches] == [user_id for user_id, _ in expected]
+        np.testing.assert_allclose([match['distance'] for match in matches],
+                                   [distance for _, distance in expected], rtol=1e-4, atol=1e-4)
+
+
+def test_match_drops_faces_beyond_tolerance():
+    gallery = random_encodings(20)
+    user_ids = [f"user{i}" for i in range(20)]
+    matcher = FaceMatcher()
+    matcher.load(zip(user_ids, gallery))
+    probe = gallery[3] + 0.01
+
+    tolerance = float(np.linalg.norm(probe - gallery[3])) + 1e-3
+    matches = matcher.match(probe, k=5, tolerance=tolerance)
+    assert [match['userId'] for match in matches] == ['user3']
+
+
+def test_add_replace_and_remove_keep_rows_consistent():
+    gallery = random_encodings(10)
+    matcher = FaceMatcher(capacity=2)
+    for i, encoding in enumerate(gallery):
+        matcher.add(f"user{i}", encoding)
+    assert len(matcher) == 10
+
+    matcher.add('user4', gallery[7])
+    assert matcher.remove('user7')
+    assert not matcher.remove('user7')
+    assert 'user7' not in matcher and len(matcher) == 9
+
+    # user9 was moved into user7's row; both must still be found exactly
+    assert matcher.match(gallery[9], tolerance=None)[0]['userId'] == 'user9'
+    assert matcher.match(gallery[7], tolerance=None)[0]['userId'] == 'user4'
+
+
+def test_empty_gallery_matches_nothing():
+    assert FaceMatcher().match(random_encodings(1)[0]) == []
+    assert FaceMatcher().match(random_encodings(3)) == [[], [], []]
+
+
+def test_top_k_skips_removed_rows():
+    dist = np.array([[0.2, np.inf, 0.1]], dtype=np.float32)
+    matches = top_k_matches(dist, ['a', 'b', 'c'], 3, None)
+    assert [match['userId'] for match in matches[0]] == ['c', 'a']
+
+
+# --- Duplicate registration ---
+@pytest.fixture
+def enrolled(monkeypatch):
+    matcher = FaceMatcher()
+    gallery = random_encodings(5)
+    matcher.load((f"user{i}", encoding) for i, encoding in enumerate(gallery))
+    monkeypatch.setattr(face_service, '_matcher', matcher)
+    return gallery
+
+
+def test_face_of_another_user_is_a_duplicate(enrolled):
+    with pytest.raises(DuplicateFaceError):
+        check_duplicate_face('new-user', enrolled[2] + 0.001)
+
+
+def test_re_registering_own_face_is_not_a_duplicate(enrolled):
+    check_duplicate_face('user2', enrolled[2] + 0.001)
+    check_duplicate_face('new-user', random_encodings(1, seed=9)[0] + 1.0)
+
+
+# --- Encoding storage ---
+def test_float32_pack_round_trips_exactly():
+    encoding = random_encodings(1)[0]
+    packed = pack_encoding(encoding, dtype='float32')
+    assert len(packed) == 4 + ENCODING_SIZE * 4
+    unpacked = unpack_encoding(packed)
+    assert unpacked.dtype == np.float32
+    np.testing.assert_array_equal(unpacked, encoding)
+
+
+def test_float16_pack_is_within_match_precision():
+    encoding = random_encodings(1)[0]
+    packed = pack_encoding(encoding, dtype='float16')
+    assert len(packed) == 4 + ENCODING_SIZE * 2
+    np.testing.assert_allclose(unpack_encoding(packed), encoding, atol=1e-3)
+
+
+def test_legacy_list_encodings_still_load():
+    encoding = random_encodings(1)[0]
+    np.testing.assert_allclose(unpack_encoding([float(value) for value in encoding]), encoding)
+    np.testing.assert_allclose(encoding_from_doc({'encoding': memoryview(pack_encoding(encoding))}), encoding)
+
+
+def test_tombstones_and_foreign_bytes():
+    assert encoding_from_doc({'encoding': None, 'deleted': True}) is None
+    with pytest.raises(ValueError):
+        unpack_encoding(b'XX' + bytes(10))
+    with pytest.raises(ValueError):
+        unpack_encoding(b'FE' + bytes([9, 1]) + bytes(512))
+
+
+# --- Incremental updates ---
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = True
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeChange:
+    def __init__(self, kind, doc):
+        self.type = type('ChangeType', (), {'name': kind})()
+        self.document = doc
+
+
+class FakeQuery:
+    def __init__(self, docs):
+        self.docs = docs
+        self.filters = []
+
+    def where(self, field, op, value):
+        self.filters.append((field, op, value))
+        return self
+
+    def stream(self):
+        (field, _, since), = self.filters
+        return [doc for doc in self.docs if doc.to_dict()[field] > since]
+
+
+class FakeDB:
+    def __init__(self, docs):
+        self.query = FakeQuery(docs)
+
+    def collection(self, name):
+        assert name == 'face_encodings'
+        return self.query
+
+
+def encoding_doc(user_id, encoding, updated_at):
+    return FakeDoc(user_id, {'userId': user_id, 'encoding': pack_encoding(encoding), 'updatedAt': updated_at})
+
+
+def test_catch_up_applies_changes_and_tombstones():
+    gallery = random_encodings(5)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    index = FaceMatcher()
+    index.load((f"user{i}", encoding) for i, encoding in enumerate(gallery))
+    index.high_water_mark = start
+
+    replacement, new = random_encodings(2, seed=3)
+    tombstone = dict(face_encoding_tombstone('user2'), updatedAt=start + timedelta(minutes=2))
+    docs = [
+        encoding_doc('user0', gallery[0], start - timedelta(days=1)),
+        encoding_doc('user1', replacement, start + timedelta(minutes=1)),
+        FakeDoc('user2', tombstone),
+        encoding_doc('user9', new, start + timedelta(minutes=3)),
+    ]
+
+    assert catch_up_face_index(index, FakeDB(docs)) == 3
+    assert 'user2' not in index and 'user9' in index
+    assert index.match(replacement, tolerance=None)[0]['userId'] == 'user1'
+    assert index.high_water_mark == start + timedelta(minutes=3)
+
+
+def test_listener_updates_matcher_and_running_sessions(monkeypatch):
+    gallery = random_encodings(3)
+    matcher = FaceMatcher()
+    matcher.load((f"user{i}", encoding) for i, encoding in enumerate(gallery))
+    matcher.high_water_mark = None
+    session_gallery = FaceMatcher()
+    session_gallery.load([('user1', gallery[1])])
+    monkeypatch.setattr(face_service, '_matcher', matcher)
+    monkeypatch.setattr(face_service, '_schedule_save', lambda: None)
+    monkeypatch.setitem(face_service._session_galleries, 'S1',
+                        (float('inf'), {'roster': {'user1': {}}, 'gallery': session_gallery}))
+
+    updated = random_encodings(1, seed=4)[0]
+    now = datetime.now(timezone.utc)
+    face_service._on_face_encodings_snapshot([], [FakeChange('MODIFIED', encoding_doc('user1', updated, now))], now)
+    assert session_gallery.match(updated, tolerance=0.01)[0]['userId'] == 'user1'
+    assert matcher.high_water_mark == now
+
+    face_service._on_face_encodings_snapshot([], [FakeChange('REMOVED', encoding_doc('user1', updated, now))], now)
+    assert 'user1' not in matcher and 'user1' not in session_gallery
+
+
+# --- Session galleries ---
+class FakeRepository:
+    def get_timetable_entry(self, entry_id):
+        return {'id': entry_id, 'branchId': 'CSE_Y2_A', 'year': 2, 'division': 'A'} if entry_id != 'missing' else None
+
+    def list_students(self, branch_id, year, division):
+        return [{'id': 'user0', 'studentId': 'S000', 'name': 'Aarav'}]
+
+
+class FakeStoredDoc:
+    """Document reference and snapshot in one, enough for get() and get_all()"""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def get(self):
+        return self
+
+    def to_dict(self):
+        return dict(self._data) if self.exists else None
+
+
+class FakeCollectionOf:
+    def __init__(self, store):
+        self.store = store
+
+    def document(self, doc_id):
+        return FakeStoredDoc(doc_id, self.store.get(doc_id))
+
+
+class FakeSessionDB:
+    def __init__(self, sessions):
+        self.stores = {
+            'attendance_sessions': sessions,
+            'face_encodings': {'user0': {'userId': 'user0', 'encoding': pack_encoding(random_encodings(1)[0])}}
+        }
+
+    def collection(self, name):
+        return FakeCollectionOf(self.stores[name])
+
+    def get_all(self, refs):
+        return list(refs)
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    records = {}
+    monkeypatch.setattr(face_service, '_session_galleries', type(face_service._session_galleries)())
+    monkeypatch.setattr(face_service, 'get_repository', lambda: FakeRepository())
+    monkeypatch.setattr(face_service, 'db', FakeSessionDB(records))
+    return records
+
+
+def test_session_gallery_loads_the_class_roster(sessions):
+    session = face_service.load_session_gallery('tt1_2026-10-12', 'tt1')
+    assert list(session['roster']) == ['user0'] and len(session['gallery']) == 1
+    assert face_service.load_session_gallery('tt1_2026-10-12', 'tt1') is session
+    assert face_service.load_session_gallery('x', 'missing') is None
+
+
+def test_least_recently_used_galleries_are_evicted(sessions, monkeypatch):
+    monkeypatch.setattr(face_service, 'MAX_SESSION_GALLERIES', 2)
+    for session_id in ('a', 'b'):
+        face_service.load_session_gallery(session_id, 'tt1')
+    face_service.get_session_gallery('a')
+    face_service.load_session_gallery('c', 'tt1')
+    assert list(face_service._session_galleries) == ['a', 'c']
+
+
+def test_idle_galleries_expire(sessions, monkeypatch):
+    face_service.load_session_gallery('a', 'tt1')
+    monkeypatch.setattr(face_service, 'SESSION_GALLERY_TTL_SECONDS', -1)
+    assert face_service.get_session_gallery('a') is None
+
+
+def test_session_started_on_another_worker_is_reloaded(sessions):
+    sessions['tt1_2026-10-12'] = {'sessionId': 'tt1_2026-10-12', 'timetableId': 'tt1'}
+    session = face_service.get_session_gallery('tt1_2026-10-12')
+    assert session['timetableId'] == 'tt1' and len(session['gallery']) == 1
+
+    sessions['tt2_2026-10-12'] = {'sessionId': 'tt2_2026-10-12', 'timetableId': 'tt2', 'endedAt': 1}
+    assert face_service.get_session_gallery('tt2_2026-10-12') is None
+    assert face_service.get_session_gallery('never-started') is None
+
+
+def test_without_firestore_the_roster_comes_from_the_local_index(sessions, monkeypatch):
+    gallery = random_encodings(2)
+    matcher = FaceMatcher()
+    matcher.load([('user0', gallery[0]), ('user1', gallery[1])])
+    monkeypatch.setattr(face_service, '_matcher', matcher)
+    monkeypatch.setattr(face_service, 'db', None)
+
+    session = face_service.load_session_gallery('tt1_2026-10-12', 'tt1')
+    assert session['gallery'].user_ids == ['user0']
+    np.testing.assert_array_equal(session['gallery'].encodings[0], gallery[0])
+
+
+@pytest.mark.parametrize('kind', ['matrix', 'exact', 'ivf'])
+def test_rows_for_returns_only_enrolled_users(kind):
+    gallery = random_encodings(4)
+    index = FaceMatcher() if kind == 'matrix' else face_service.create_face_index(kind)
+    index.load([('user0', gallery[0]), ('user1', gallery[1]), ('user3', gallery[3])])
+    # Replaced and removed after the load, the overlay case for snapshots
+    index.add('user1', gallery[2])
+    index.remove('user0')
+    index.add('user2', gallery[0])
+
+    rows = index.rows_for(['user0', 'user1', 'user2', 'user3', 'missing'])
+    assert [user_id for user_id, _ in rows] == ['user1', 'user2', 'user3']
+    for (_, encoding), expected in zip(rows, [gallery[2], gallery[0], gallery[3]]):
+        np.testing.assert_array_equal(encoding, expected)
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+
+from backend.services.face_recognition_service import ENCODING_SIZE
+from backend.services.face_snapshot import SnapshotFaceMatcher, open_snapshot, write_snapshot
+
+
+def random_encodings(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.1, (count, ENCODING_SIZE)).astype(np.float32)
+
+
+def snapshot(tmp_path, count=20):
+    encodings = random_encodings(count)
+    path = str(tmp_path / 'face_gallery.snapshot')
+    write_snapshot(path, [f"user{i}" for i in range(count)], encodings)
+    matcher = SnapshotFaceMatcher()
+    matcher.load_file(path)
+    return matcher, encodings, path
+
+
+def best(matcher, probe):
+    matches = matcher.match(probe, tolerance=None)
+    return matches[0]['userId'] if matches else None
+
+
+def test_snapshot_is_memory_mapped_and_matches(tmp_path):
+    matcher, encodings, path = snapshot(tmp_path)
+    user_ids, matrix, _, _ = open_snapshot(path)
+    assert isinstance(matrix, np.memmap)
+    np.testing.assert_array_equal(matrix, encodings)
+    assert len(matcher) == 20
+    assert [best(matcher, encodings[i]) for i in range(20)] == user_ids
+
+
+def test_overlay_replaces_snapshot_rows(tmp_path):
+    matcher, encodings, _ = snapshot(tmp_path)
+    replacement = random_encodings(1, seed=5)[0]
+    matcher.add('user3', replacement)
+
+    assert len(matcher) == 20
+    assert best(matcher, replacement) == 'user3'
+    # The old snapshot row is masked, not matched
+    assert all(match['userId'] != 'user3' for match in matcher.match(encodings[3], k=20, tolerance=0.01))
+
+
+def test_removed_rows_are_tombstoned(tmp_path):
+    matcher, encodings, _ = snapshot(tmp_path)
+    matcher.add('new', random_encodings(1, seed=6)[0])
+
+    assert matcher.remove('user5') and matcher.remove('new')
+    assert not matcher.remove('user5')
+    assert 'user5' not in matcher and 'new' not in matcher
+    assert len(matcher) == 19
+    assert 'user5' not in [match['userId'] for match in matcher.match(encodings[5], k=20, tolerance=None)]
+
+
+def test_save_folds_overlay_into_a_new_snapshot(tmp_path):
+    matcher, encodings, path = snapshot(tmp_path)
+    extra = random_encodings(2, seed=7)
+    matcher.add('user1', extra[0])
+    matcher.add('new', extra[1])
+    matcher.remove('user2')
+    matcher.save(path)
+
+    assert os.listdir(tmp_path) == ['face_gallery.snapshot']
+    reloaded = SnapshotFaceMatcher()
+    reloaded.load_file(path)
+    assert len(reloaded) == 20 and len(reloaded.overlay) == 0
+    assert best(reloaded, extra[0]) == 'user1'
+    assert best(reloaded, extra[1]) == 'new'
+    assert 'user2' not in reloaded
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / 'empty.snapshot')
+    write_snapshot(path, [], np.empty((0, ENCODING_SIZE), dtype=np.float32))
+    matcher = SnapshotFaceMatcher()
+    matcher.load_file(path)
+    assert len(matcher) == 0
+    assert matcher.match(random_encodings(1)[0]) == []
@@ -0,0 +1,157 @@
+import sys
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.services.face_workers import FaceDetectionError, FaceWorkerPool, PoolBusyError, locate_faces
+
+
+class Gate:
+    """Job function that blocks until opened and counts its calls"""
+
+    def __init__(self):
+        self.opened = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.calls = 0
+        self.__name__ = 'gate'
+
+    def __call__(self, value):
+        self.calls += 1
+        self.started.release()
+        assert self.opened.wait(5)
+        if value == 'no face':
+            raise FaceDetectionError("No face was detected in the image. Please try again.")
+        return value * 2
+
+    def wait_started(self, count=1):
+        for _ in range(count):
+            assert self.started.acquire(timeout=5)
+
+
+@pytest.fixture
+def pool():
+    # Threads stand in for the worker processes, which would need dlib
+    pool = FaceWorkerPool(workers=2, max_pending=3)
+    pool._executor = ThreadPoolExecutor(max_workers=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_submit_wait_and_status(pool):
+    gate = Gate()
+    job_id = pool.submit(gate, 21, kind='encode')
+    gate.wait_started()
+    assert pool.status(job_id)['status'] == 'running'
+
+    gate.opened.set()
+    assert pool.wait(job_id, timeout=5) == 42
+    assert pool.status(job_id) == {'jobId': job_id, 'kind': 'encode', 'cached': False,
+                                   'status': 'done', 'result': 42}
+    assert pool.stats()['completed'] == 1
+
+
+def test_unknown_jobs(pool):
+    assert pool.status('missing') is None
+    with pytest.raises(KeyError):
+        pool.wait('missing')
+
+
+def test_on_result_runs_on_a_callback_thread(pool):
+    gate = Gate()
+    gate.opened.set()
+    threads = []
+
+    def on_result(result):
+        threads.append(threading.current_thread().name)
+        return {'saved': result}
+
+    job_id = pool.submit(gate, 1, on_result=on_result)
+    assert pool.wait(job_id, timeout=5) == {'saved': 2}
+    assert threads[0].startswith('face-results')
+
+
+def test_same_capture_joins_the_running_job(pool):
+    gate = Gate()
+    first = pool.submit(gate, 5, cache_key='capture')
+    gate.wait_started()
+
+    # A retry without a callback is the same job; one with a callback shares the worker
+    assert pool.submit(gate, 5, cache_key='capture') == first
+    shared = pool.submit(gate, 5, on_result=lambda result: result + 1, cache_key='capture')
+    assert shared != first
+
+    stats = pool.stats()
+    assert stats['running'] == 1 and stats['queued'] == 0
+
+    gate.opened.set()
+    assert pool.wait(first, timeout=5) == 10
+    assert pool.wait(shared, timeout=5) == 11
+    assert gate.calls == 1
+
+    # Finished results are reused without a worker
+    cached = pool.submit(gate, 5, cache_key='capture')
+    assert pool.wait(cached, timeout=5) == 10
+    assert pool.status(cached)['cached'] and gate.calls == 1
+
+
+def test_no_face_errors_are_cached(pool):
+    gate = Gate()
+    gate.opened.set()
+    job_id = pool.submit(gate, 'no face', cache_key='blank')
+    with pytest.raises(FaceDetectionError):
+        pool.wait(job_id, timeout=5)
+    assert pool.status(job_id)['status'] == 'failed'
+
+    retry = pool.submit(gate, 'no face', cache_key='blank')
+    with pytest.raises(FaceDetectionError):
+        pool.wait(retry, timeout=5)
+    assert gate.calls == 1
+
+
+def test_full_queue_rejects_new_work_but_not_joins(pool):
+    gate = Gate()
+    job_ids = [pool.submit(gate, number, cache_key=f"capture{number}") for number in range(3)]
+    gate.wait_started(2)
+
+    stats = pool.stats()
+    assert stats['running'] == 2 and stats['queued'] == 1
+    with pytest.raises(PoolBusyError):
+        pool.submit(gate, 3)
+    # Joining work that is already running adds nothing to the queue
+    joined = pool.submit(gate, 0, on_result=lambda result: result, cache_key='capture0')
+
+    gate.opened.set()
+    assert [pool.wait(job_id, timeout=5) for job_id in job_ids + [joined]] == [0, 2, 4, 0]
+    assert pool.stats()['running'] == 0 and pool.stats()['queued'] == 0
+
+
+# --- Downscaled detection ---
+@pytest.fixture
+def detector(monkeypatch):
+    """face_recognition stand-in that reports fixed boxes on whatever it is given"""
+    calls = []
+
+    def face_locations(image, number_of_times_to_upsample=1):
+        calls.append((image.shape, number_of_times_to_upsample))
+        return [(64, 400, 320, 128), (0, 640, 480, 600)]
+
+    monkeypatch.setitem(sys.modules, 'face_recognition', types.SimpleNamespace(face_locations=face_locations))
+    return calls
+
+
+def test_boxes_found_on_the_small_copy_are_mapped_back(detector):
+    image = np.zeros((1200, 1600, 3), dtype=np.uint8)
+    boxes = locate_faces(image, detect_side=640, upsample=2)
+
+    assert detector == [((480, 640, 3), 2)]
+    # Scale 0.4; the second box ends exactly on the right and bottom edges
+    assert boxes == [(160, 1000, 800, 320), (0, 1600, 1200, 1500)]
+
+
+def test_small_images_are_searched_as_they_are(detector):
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    assert locate_faces(image, detect_side=640) == [(64, 400, 320, 128), (0, 640, 480, 600)]
+    assert detector == [((480, 640, 3), 1)]
@@ -0,0 +1,58 @@
+import io
+
+import numpy as np
+from PIL import Image, JpegImagePlugin
+
+from backend.utils.file_handler import MAX_IMAGE_SIDE, decode_image_bytes, downscale_image
+
+
+def encoded(mode, size, fmt):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color=200 if mode == 'L' else (200, 100, 50, 255)[:len(mode)]).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+# --- Decoding ---
+def test_large_jpeg_is_capped_at_the_max_side():
+    image = decode_image_bytes(encoded('RGB', (4000, 3000), 'JPEG'))
+    assert image.shape == (MAX_IMAGE_SIDE * 3 // 4, MAX_IMAGE_SIDE, 3)
+    assert image.dtype == np.uint8
+
+
+def test_jpeg_draft_decodes_at_a_reduced_scale(monkeypatch):
+    requests = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+
+    def recording_draft(self, mode, size):
+        result = draft(self, mode, size)
+        requests.append((size, self.size))
+        return result
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, 'draft', recording_draft)
+    image = decode_image_bytes(encoded('RGB', (4000, 2000), 'JPEG'), max_side=1000)
+
+    # Asked for the target size and got the nearest JPEG scale above it
+    assert requests == [((1000, 500), (1000, 500))]
+    assert image.shape == (500, 1000, 3)
+
+
+def test_small_images_keep_their_size():
+    assert decode_image_bytes(encoded('RGB', (640, 480), 'PNG')).shape == (480, 640, 3)
+
+
+def test_rgba_and_greyscale_become_rgb():
+    rgba = decode_image_bytes(encoded('RGBA', (4000, 100), 'PNG'))
+    assert rgba.shape == (40, MAX_IMAGE_SIDE, 3)
+    assert tuple(rgba[0, 0]) == (200, 100, 50)
+
+    grey = decode_image_bytes(encoded('L', (64, 32), 'PNG'))
+    assert grey.shape == (32, 64, 3)
+    assert tuple(grey[0, 0]) == (200, 200, 200)
+
+
+def test_downscale_reports_the_scale_it_applied():
+    image = np.zeros((1200, 1600, 3), dtype=np.uint8)
+    small, scale = downscale_image(image, 640)
+    assert small.shape == (480, 640, 3) and scale == 0.4
+    same, scale = downscale_image(image, 1600)
+    assert same is image and scale == 1.0
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.utils.scheduler import LectureResolver, parse_bell_schedule
+
+# 2026-10-12 is a Monday
+MONDAY = datetime(2026, 10, 12)
+
+
+def at(day, hour, minute=0):
+    return MONDAY + timedelta(days=day, hours=hour, minutes=minute)
+
+
+def lecture(entry_id, day, number, branch='CSE_Y2_A', teacher='T001', course='C001'):
+    return {'id': entry_id, 'branchId': branch, 'year': 2, 'division': 'A', 'day': day,
+            'lectureNumber': number, 'courseCode': course, 'teacherId': teacher, 'roomNumber': 'Room-101'}
+
+
+@pytest.fixture
+def resolver():
+    resolver = LectureResolver()
+    resolver.load([
+        lecture('mon1', 'Monday', 1),
+        lecture('mon5', 'Monday', 5),
+        lecture('wed2', 'Wednesday', 2, teacher='T002'),
+        lecture('sat8', 'Saturday', 8),
+    ])
+    return resolver
+
+
+def test_active_lecture(resolver):
+    session = resolver.resolve('branch', 'CSE_Y2_A', at(0, 9, 30))
+    assert session['status'] == 'active' and session['entry']['id'] == 'mon1'
+    assert session['start'] == at(0, 9) and session['end'] == at(0, 10)
+
+
+def test_next_lecture_after_the_lunch_break(resolver):
+    # Lecture 5 starts at 14:00 after the 13:00-14:00 break
+    session = resolver.resolve('branch', 'CSE_Y2_A', at(0, 13, 15))
+    assert session['status'] == 'next' and session['entry']['id'] == 'mon5'
+    assert session['start'] == at(0, 14)
+
+
+def test_next_lecture_on_a_later_day(resolver):
+    session = resolver.resolve('branch', 'CSE_Y2_A', at(0, 15))
+    assert session['entry']['id'] == 'wed2' and session['start'] == at(2, 10)
+
+
+def test_end_of_week_wraps_to_next_monday(resolver):
+    for when in (at(5, 18), at(5, 23, 59), at(6, 12)):
+        session = resolver.resolve('branch', 'CSE_Y2_A', when)
+        assert session['status'] == 'next' and session['entry']['id'] == 'mon1'
+        assert session['start'] == at(7, 9)
+
+
+def test_lecture_ending_at_the_minute_is_no_longer_active(resolver):
+    session = resolver.resolve('branch', 'CSE_Y2_A', at(0, 10))
+    assert session['status'] == 'next' and session['entry']['id'] == 'mon5'
+
+
+def test_removing_one_of_two_overlapping_entries_keeps_the_slot(resolver):
+    resolver.add('mon1b', lecture('mon1b', 'Monday', 1, course='C002'))
+    resolver.remove('mon1')
+    session = resolver.resolve('branch', 'CSE_Y2_A', at(0, 9, 30))
+    assert session['status'] == 'active' and session['entry']['id'] == 'mon1b'
+    assert resolver.resolve('teacher', 'T001', at(0, 9, 30))['entry']['id'] == 'mon1b'
+
+    resolver.remove('mon1b')
+    assert resolver.resolve('branch', 'CSE_Y2_A', at(0, 9, 30))['entry']['id'] == 'mon5'
+
+
+def test_teachers_only_see_their_own_lectures(resolver):
+    session = resolver.resolve('teacher', 'T002', at(0, 9, 30))
+    assert session['status'] == 'next' and session['entry']['id'] == 'wed2'
+    assert resolver.resolve('teacher', 'T404', at(0, 9)) is None
+
+
+def test_timezone_aware_times_keep_their_zone(resolver):
+    when = at(0, 9, 30).replace(tzinfo=timezone.utc)
+    assert resolver.resolve('branch', 'CSE_Y2_A', when)['start'] == at(0, 9).replace(tzinfo=timezone.utc)
+
+
+def test_updates_and_removals(resolver):
+    resolver.add('mon1', lecture('mon1', 'Tuesday', 1))
+    assert resolver.resolve('branch', 'CSE_Y2_A', at(0, 9, 30))['entry']['id'] == 'mon5'
+    for entry_id in ('mon1', 'mon5', 'wed2', 'sat8'):
+        resolver.remove(entry_id)
+    assert len(resolver) == 0
+    assert resolver.resolve('branch', 'CSE_Y2_A', at(0, 9)) is None
+
+
+def test_breaks_and_off_grid_entries_are_ignored():
+    resolver = LectureResolver()
+    resolver.load([lecture('break', 'Monday', 4, course='BREAK'), lecture('sun', 'Sunday', 1),
+                   lecture('late', 'Monday', 9)])
+    assert len(resolver) == 0
+
+
+def test_bell_schedule_is_validated():
+    assert parse_bell_schedule('08:30-09:20, 09:20-10:10') == [(510, 560), (560, 610)]
+    for schedule in ('10:00-09:00', '09:00-10:00,09:30-10:30', ','.join(['09:00-09:01'] * 9)):
+        with pytest.raises(ValueError):
+            parse_bell_schedule(schedule)
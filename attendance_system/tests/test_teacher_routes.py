@@ -0,0 +1,129 @@
+import base64
+import io
+
+import pytest
+from flask import Flask
+
+import backend.routes.teacher_routes as teacher_routes
+from backend.routes.teacher_routes import init_teacher_routes
+
+
+class FakeGallery:
+    """Returns canned matches, one list per encoding"""
+
+    def __init__(self, matches):
+        self.matches = matches
+
+    def match(self, encodings, k=1):
+        assert len(encodings) == len(self.matches)
+        return self.matches
+
+
+class FakePool:
+    def __init__(self, faces):
+        self.faces = faces
+        self.upsample = None
+        self.image_bytes = None
+
+    def submit(self, fn, image_bytes, upsample, kind=None, cache_key=None):
+        self.image_bytes = image_bytes
+        self.upsample = upsample
+        return 'job1'
+
+    def wait(self, job_id, timeout=None):
+        return [(0, 10, 10, 0)] * self.faces, [[0.0]] * self.faces
+
+
+def match(user_id, distance):
+    return [{'userId': user_id, 'distance': distance}]
+
+
+@pytest.fixture
+def group_photo(monkeypatch):
+    flask_app = Flask(__name__)
+    init_teacher_routes(flask_app, None)
+    state = {'marked': []}
+
+    def use(face_matches):
+        session = {
+            'sessionId': 's1',
+            'gallery': FakeGallery(face_matches),
+            'roster': {'u1': {'studentId': 'S1', 'name': 'Aarav'}, 'u2': {'studentId': 'S2', 'name': 'Diya'}}
+        }
+        state['pool'] = FakePool(len(face_matches))
+        monkeypatch.setattr(teacher_routes, 'get_session_gallery', lambda session_id: session)
+        monkeypatch.setattr(teacher_routes, 'get_face_worker_pool', lambda: state['pool'])
+
+        def mark(db, session, recognized, method):
+            state['marked'] = recognized
+            return len(recognized)
+
+        monkeypatch.setattr(teacher_routes, 'mark_attendance_bulk', mark)
+        return state
+
+    return flask_app.test_client(), use
+
+
+def post_photo(client, query=''):
+    return client.post(f"/api/teacher/sessions/s1/group-photo{query}", data=b'jpeg', content_type='image/jpeg')
+
+
+def test_each_student_keeps_their_closest_face(group_photo):
+    client, use = group_photo
+    state = use([match('u1', 0.45), match('u2', 0.3), [], match('u1', 0.2)])
+
+    response = post_photo(client)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['facesDetected'] == 4
+    assert body['unrecognizedFaces'] == 1
+    assert body['duplicateFaces'] == 1
+    assert [(student['userId'], student['distance']) for student in body['present']] == [('u1', 0.2), ('u2', 0.3)]
+    assert [recognized['distance'] for recognized in state['marked']] == [0.2, 0.3]
+
+
+def test_upsample_is_bounded(group_photo):
+    client, use = group_photo
+    state = use([match('u1', 0.3)])
+
+    assert post_photo(client, '?upsample=2').status_code == 200
+    assert state['pool'].upsample == 2
+    for value in ('4', '-1', 'lots'):
+        response = post_photo(client, f"?upsample={value}")
+        assert response.status_code == 400
+        assert 'upsample' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('upload', [
+    {'data': b'jpeg', 'content_type': 'image/jpeg'},
+    {'data': b'jpeg', 'content_type': 'application/octet-stream'},
+    {'data': {'image': (io.BytesIO(b'jpeg'), 'photo.jpg')}, 'content_type': 'multipart/form-data'},
+    {'json': {'image': 'data:image/jpeg;base64,' + base64.b64encode(b'jpeg').decode()}},
+])
+def test_every_upload_format_reaches_the_pool_as_bytes(group_photo, upload):
+    client, use = group_photo
+    state = use([match('u1', 0.3)])
+
+    assert client.post('/api/teacher/sessions/s1/group-photo', **upload).status_code == 200
+    assert state['pool'].image_bytes == b'jpeg'
+
+
+@pytest.mark.parametrize('upload', [
+    {'data': b'', 'content_type': 'image/jpeg'},
+    {'data': {'image': (io.BytesIO(b''), 'photo.jpg')}, 'content_type': 'multipart/form-data'},
+    {'json': {}},
+])
+def test_missing_image_is_rejected(group_photo, upload):
+    client, use = group_photo
+    use([match('u1', 0.3)])
+    response = client.post('/api/teacher/sessions/s1/group-photo', **upload)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "No image data provided"
+
+
+def test_photo_without_faces_is_rejected(group_photo):
+    client, use = group_photo
+    use([])
+    response = post_photo(client)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "No faces were detected in the image"
@@ -0,0 +1,414 @@
+import io
+
+import pytest
+from flask import Flask
+
+import backend.services.timetable_grid as timetable_grid
+import backend.services.timetable_views as timetable_views
+import backend.utils.scheduler as scheduler
+import backend.utils.database as database
+from backend.routes.admin_routes import init_admin_routes
+from backend.utils import watch
+from backend.utils.database import SQLiteRepository
+from backend.services.timetable_generator import (
+    TimetableSolver,
+    class_from_branch_id,
+    generate_timetable,
+    lectures_from_request,
+)
+from backend.services.timetable_grid import OccupancyGrid, describe_clashes, find_clashes, slot_bit
+from backend.services.timetable_import import TIMETABLE_FIELDS, import_timetable, plan_timetable_import
+
+
+def entry(day='Monday', lecture=1, room='Room-101', teacher='T001', branch='CSE_Y2_A', year=2, division='A',
+          course='C001'):
+    return {'day': day, 'lectureNumber': lecture, 'roomNumber': room, 'teacherId': teacher,
+            'branchId': branch, 'year': year, 'division': division, 'courseCode': course}
+
+
+def slot(data):
+    return (data['day'], data['lectureNumber'], data['roomNumber'], data['teacherId'],
+            data['branchId'], data['year'], data['division'])
+
+
+NO_CLASH = {'room': False, 'teacher': False, 'class': False}
+
+
+# --- Occupancy grid ---
+def test_slot_bits_cover_the_week_without_overlap():
+    bits = {slot_bit(day, lecture) for day in timetable_grid.DAYS
+            for lecture in range(1, timetable_grid.LECTURES_PER_DAY + 1)}
+    assert len(bits) == 48 and sum(bits) == (1 << 48) - 1
+    assert slot_bit('Sunday', 1) is None and slot_bit('Monday', 9) is None
+
+
+def test_each_kind_of_clash_is_reported():
+    grid = OccupancyGrid()
+    grid.load([dict(entry(), id='e1')])
+
+    assert grid.clashes(*slot(entry())) == {'room': True, 'teacher': True, 'class': True}
+    assert grid.clashes(*slot(entry(teacher='T002', branch='IT_Y1_A', year=1))) == {
+        'room': True, 'teacher': False, 'class': False}
+    assert grid.clashes(*slot(entry(room='Lab-1', branch='IT_Y1_A', year=1))) == {
+        'room': False, 'teacher': True, 'class': False}
+    assert grid.clashes(*slot(entry(room='Lab-1', teacher='T002', course='C002'))) == {
+        'room': False, 'teacher': False, 'class': True}
+    assert grid.clashes(*slot(entry(lecture=2))) == NO_CLASH
+    assert grid.clashes(*slot(entry(division='B'))) == {'room': True, 'teacher': True, 'class': False}
+
+
+def test_breaks_book_neither_teacher_nor_room():
+    grid = OccupancyGrid()
+    grid.add('break', entry(room='N/A', teacher='N/A', course='BREAK'))
+    assert grid.clashes(*slot(entry(room='N/A', teacher='N/A', branch='IT_Y1_A', year=1))) == NO_CLASH
+    assert grid.clashes(*slot(entry()))['class']
+
+
+def test_removing_one_of_two_overlapping_entries_keeps_the_slot_booked():
+    grid = OccupancyGrid()
+    grid.add('e1', entry())
+    grid.add('e2', entry(course='C002'))
+    grid.remove('e1')
+    assert grid.clashes(*slot(entry())) == {'room': True, 'teacher': True, 'class': True}
+    grid.remove('e2')
+    assert grid.clashes(*slot(entry())) == NO_CLASH
+    assert grid.masks('room') == {} and len(grid) == 0
+
+
+def test_moving_an_entry_frees_its_old_slot():
+    grid = OccupancyGrid()
+    grid.add('e1', entry())
+    grid.add('e1', entry(day='Tuesday', lecture=3))
+    assert grid.clashes(*slot(entry())) == NO_CLASH
+    assert grid.clashes(*slot(entry(day='Tuesday', lecture=3)))['room']
+
+
+def test_off_grid_entries_are_skipped():
+    grid = OccupancyGrid()
+    grid.load([dict(entry(day='Sunday'), id='e1'), dict(entry(lecture='x'), id='e2')])
+    assert len(grid) == 0
+
+
+# --- find_clashes ---
+class FakeRepository:
+    def __init__(self):
+        self.calls = []
+
+    def find_timetable_clashes(self, *args):
+        self.calls.append(args)
+        return NO_CLASH
+
+
+@pytest.fixture
+def loaded_grid(monkeypatch):
+    grid = OccupancyGrid()
+    grid.load([dict(entry(), id='e1')])
+    repository = FakeRepository()
+    monkeypatch.setattr(timetable_grid, '_grid', grid)
+    monkeypatch.setattr(timetable_grid, 'get_repository', lambda: repository)
+    return grid, repository
+
+
+def test_find_clashes_answers_from_the_grid(loaded_grid):
+    _, repository = loaded_grid
+    clashes = find_clashes(*slot(entry()))
+    assert describe_clashes(clashes) == [
+        "Room already occupied at this time",
+        "Teacher already assigned at this time",
+        "Course already scheduled for this class at this time"
+    ]
+    assert repository.calls == []
+
+
+def test_find_clashes_asks_the_database_for_days_off_the_grid(loaded_grid):
+    _, repository = loaded_grid
+    assert find_clashes(*slot(entry(day='Sunday'))) == NO_CLASH
+    assert len(repository.calls) == 1
+
+
+def test_write_hook_keeps_the_loaded_grid_current(loaded_grid):
+    grid, _ = loaded_grid
+    timetable_grid._on_timetable_write('e2', entry(day='Friday'))
+    assert find_clashes(*slot(entry(day='Friday')))['room']
+    timetable_grid._on_timetable_write('e2', None)
+    assert find_clashes(*slot(entry(day='Friday'))) == NO_CLASH
+
+
+# --- Live updates ---
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeChange:
+    def __init__(self, kind, doc):
+        self.type = type('ChangeType', (), {'name': kind})()
+        self.document = doc
+
+
+class FakeCollection:
+    def __init__(self, name, listeners):
+        self.name = name
+        self.listeners = listeners
+
+    def on_snapshot(self, callback):
+        self.listeners.append((self.name, callback))
+        return type('Watch', (), {'unsubscribe': lambda self: None})()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.listeners = []
+
+    def collection(self, name):
+        return FakeCollection(name, self.listeners)
+
+
+def test_one_timetable_listener_feeds_the_grid_and_the_resolver(monkeypatch):
+    monkeypatch.setattr(timetable_grid, '_grid', None)
+    monkeypatch.setattr(scheduler, '_resolver', None)
+    monkeypatch.setattr(watch, '_watches', {})
+    firestore_db = FakeFirestore()
+    watch.start_collection_watches(firestore_db)
+
+    timetable_listeners = [callback for name, callback in firestore_db.listeners if name == 'timetable']
+    assert len(timetable_listeners) == 1
+    on_snapshot, = timetable_listeners
+
+    first = FakeSnapshot('e1', entry())
+    on_snapshot([first], [FakeChange('ADDED', first)], None)
+    assert len(timetable_grid._grid) == 1 and len(scheduler._resolver) == 1
+
+    second = FakeSnapshot('e2', entry(day='Tuesday'))
+    on_snapshot([first, second], [FakeChange('ADDED', second)], None)
+    assert find_clashes(*slot(entry(day='Tuesday')))['room']
+    assert scheduler._resolver.resolve('branch', 'CSE_Y2_A') is not None
+
+    on_snapshot([second], [FakeChange('REMOVED', first)], None)
+    assert len(timetable_grid._grid) == 1 and len(scheduler._resolver) == 1
+    watch.stop_collection_watches()
+
+
+# --- Generator ---
+def assert_no_clashes(entries, grid=None):
+    grid = grid or OccupancyGrid()
+    for number, generated in enumerate(entries):
+        assert describe_clashes(grid.clashes(*slot(generated))) == []
+        grid.add(f"generated{number}", generated)
+
+
+def college(classes=6, courses=5, lectures=4):
+    """Classes sharing eight teachers, so every teacher has several classes"""
+    branch_ids = [f"CSE_Y{year}_{division}" for year in (1, 2, 3) for division in 'AB'][:classes]
+    return [{
+        'branchId': branch_id,
+        'courses': [{'courseCode': f"C{course:03d}", 'teacherId': f"T{(index + course) % 8:03d}",
+                     'lecturesPerWeek': lectures} for course in range(courses)]
+    } for index, branch_id in enumerate(branch_ids)]
+
+
+def test_generated_week_has_no_clashes_and_places_everything():
+    rooms = [f"Room-{number}" for number in range(101, 105)]
+    entries, unscheduled = generate_timetable(college(), rooms, time_limit=2)
+
+    assert unscheduled == []
+    assert len(entries) == 6 * 5 * 4
+    assert_no_clashes(entries)
+    assert {generated['roomNumber'] for generated in entries} <= set(rooms)
+
+
+def test_generator_works_around_existing_bookings_and_breaks():
+    existing = OccupancyGrid()
+    existing.add('fixed', entry(day='Monday', lecture=1, room='Room-101', teacher='T000', branch='IT_Y1_A', year=1))
+    fixed_masks = {kind: existing.masks(kind) for kind in ('class', 'teacher', 'room')}
+
+    entries, unscheduled = generate_timetable(college(classes=2), ['Room-101', 'Room-102'],
+                                              fixed_masks=fixed_masks, break_lectures=[5], time_limit=2)
+
+    assert unscheduled == []
+    assert all(generated['lectureNumber'] != 5 for generated in entries)
+    assert_no_clashes(entries, existing)
+
+
+def test_overbooked_teacher_reports_what_cannot_be_placed():
+    # 48 open slots a week; one teacher asked for 50 lectures
+    classes = [{'branchId': 'CSE_Y1_A', 'courses': [{'courseCode': 'C001', 'teacherId': 'T001', 'lecturesPerWeek': 25}]},
+               {'branchId': 'CSE_Y1_B', 'courses': [{'courseCode': 'C001', 'teacherId': 'T001', 'lecturesPerWeek': 25}]}]
+    entries, unscheduled = generate_timetable(classes, ['Room-101', 'Room-102'], time_limit=1)
+
+    assert len(entries) == 48 and len(unscheduled) == 2
+    assert_no_clashes(entries)
+
+
+def test_solver_uses_every_room_in_a_full_slot():
+    lectures = [((f"B{number}", 1, 'A'), 'C001', f"T{number}") for number in range(3)]
+    solver = TimetableSolver(['R1', 'R2', 'R3'], blocked_slots=(1 << 48) - 2)
+    placements, unscheduled = solver.solve(lectures, time_limit=1)
+    assert unscheduled == []
+    assert sorted(room for _, _, room in placements) == ['R1', 'R2', 'R3']
+    assert {slot_number for _, slot_number, _ in placements} == {0}
+
+
+def test_requests_are_validated():
+    assert class_from_branch_id('MECH_Y3_B') == (3, 'B')
+    with pytest.raises(ValueError):
+        class_from_branch_id('MECH')
+    with pytest.raises(ValueError):
+        lectures_from_request([{'branchId': 'CSE_Y1_A', 'courses': [{'courseCode': 'C001'}]}])
+    with pytest.raises(ValueError):
+        generate_timetable([], ['Room-101'], break_lectures=[9])
+
+
+# --- Materialized views ---
+@pytest.fixture
+def view_repository(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'attendance_system.db'))
+    monkeypatch.setattr(timetable_views, 'get_repository', lambda: repository)
+    return repository
+
+
+def test_views_follow_writes_and_deletes(view_repository):
+    entry_id, = view_repository.create_timetable_entries([entry()])
+    timetable_views.refresh_timetable_views([entry()])
+    view = timetable_views.get_timetable_view('teacher', 'T001')
+    assert view['timetable']['Monday']['1']['id'] == entry_id
+
+    view_repository.delete_timetable_entry(entry_id)
+    timetable_views.refresh_timetable_views([entry()])
+    assert view_repository.list_timetable_view_ids() == []
+
+
+def test_rebuild_drops_views_with_no_entries(view_repository):
+    view_repository.create_timetable_entries([entry(), entry(branch='IT_Y1_A', year=1, teacher='T002', lecture=2)])
+    assert timetable_views.rebuild_timetable_views() == 4
+
+    with view_repository._conn() as conn:
+        conn.execute("DELETE FROM timetable WHERE branchId = 'IT_Y1_A'")
+    assert timetable_views.rebuild_timetable_views() == 2
+    assert sorted(view_repository.list_timetable_view_ids()) == ['branch:CSE_Y2_A', 'teacher:T001']
+
+
+def test_reading_an_unknown_key_stores_nothing(view_repository):
+    view = timetable_views.get_timetable_view('branch', 'NOPE_Y9_Z')
+    assert all(cells == {} for cells in view['timetable'].values())
+    assert view_repository.list_timetable_view_ids() == []
+
+
+# --- Bulk import ---
+@pytest.fixture
+def import_repository(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'attendance_system.db'))
+    monkeypatch.setattr(database, '_repository', repository)
+    monkeypatch.setattr(timetable_grid, '_grid', None)
+    monkeypatch.setattr(scheduler, '_resolver', None)
+    return repository
+
+
+def csv_rows(*entries):
+    lines = [','.join(TIMETABLE_FIELDS)]
+    lines += [','.join(str(data[field]) for field in TIMETABLE_FIELDS) for data in entries]
+    return '\n'.join(lines) + '\n'
+
+
+def test_plan_rejects_rows_that_clash_with_the_schedule_or_each_other(import_repository):
+    import_repository.create_timetable_entries([entry()])
+    rows = [
+        entry(room='Lab-1', teacher='T002', branch='IT_Y1_A', year=1),
+        entry(room='Lab-1', teacher='T003', branch='ME_Y1_A', year=1),
+        entry(room='Lab-2', teacher='T004', branch='ME_Y1_B', year=1),
+        entry(room='Lab-3', teacher='T005'),
+    ]
+    accepted, errors = plan_timetable_import(rows)
+
+    assert [row_number for row_number, _ in accepted] == [1, 3]
+    # Row 2 lost Lab-1 to row 1 of the same batch; row 4 is the stored class's slot
+    assert errors == [
+        {'row': 2, 'entry': rows[1], 'error': "Timetable clash: Room already occupied at this time"},
+        {'row': 4, 'entry': rows[3],
+         'error': "Timetable clash: Course already scheduled for this class at this time"},
+    ]
+
+
+def test_plan_reports_bad_rows(import_repository):
+    rows = [entry(day='Funday'), entry(lecture=9), entry(year='two'),
+            {'branchId': 'CSE_Y2_A', 'courseCode': 'C001'}, 'row']
+    accepted, errors = plan_timetable_import(rows)
+
+    assert accepted == []
+    assert [error['error'] for error in errors] == [
+        "Unknown day: Funday",
+        "Lecture number must be between 1 and 8",
+        "Year and lecture number must be whole numbers",
+        "Missing required field: year",
+        "Entry must be an object",
+    ]
+
+
+def test_atomic_import_writes_nothing_when_any_row_fails(import_repository):
+    results = import_timetable([entry(), entry(course='C002')], atomic=True)
+
+    assert results['committed'] is False
+    assert results['successful'] == 0 and results['failed'] == 1
+    assert import_repository.list_timetable() == []
+
+
+def test_non_atomic_import_commits_the_valid_rows(import_repository):
+    rows = [entry(), entry(course='C002'), entry(lecture=2)]
+    results = import_timetable(rows)
+
+    assert results['committed'] is True
+    assert results['successful'] == 2
+    assert [error['row'] for error in results['errors']] == [2]
+    assert sorted(stored['lectureNumber'] for stored in import_repository.list_timetable()) == [1, 2]
+    # The imported rows now book the grid for later imports
+    assert import_timetable([entry(lecture=2, course='C003')])['successful'] == 0
+
+
+def test_failed_batches_are_reported_per_row(import_repository, monkeypatch):
+    # A Firestore batch that fails in a non-atomic import comes back as None ids
+    monkeypatch.setattr(import_repository, 'create_timetable_entries',
+                        lambda entries, atomic=False: ['e1'] + [None] * (len(entries) - 1))
+    results = import_timetable([entry(), entry(lecture=2), entry(lecture=3, course='BAD', day='Funday')])
+
+    assert results['successful'] == 1
+    assert results['errors'] == [
+        {'row': 2, 'entry': entry(lecture=2), 'error': "Failed to write entry"},
+        {'row': 3, 'entry': entry(lecture=3, course='BAD', day='Funday'), 'error': "Unknown day: Funday"},
+    ]
+
+
+@pytest.fixture
+def admin_client(import_repository):
+    flask_app = Flask(__name__)
+    init_admin_routes(flask_app, None)
+    return flask_app.test_client()
+
+
+def test_csv_upload_rejects_the_whole_file_in_atomic_mode(admin_client, import_repository):
+    upload = csv_rows(entry(), entry(lecture=2), entry(lecture=3, day='Funday')).encode()
+    response = admin_client.post('/api/admin/timetable/bulk', content_type='multipart/form-data',
+                                 data={'file': (io.BytesIO(upload), 'timetable.csv'), 'atomic': 'true'})
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'][0]['row'] == 3
+    assert import_repository.list_timetable() == []
+
+
+def test_raw_csv_upload_imports_the_valid_rows(admin_client, import_repository):
+    upload = csv_rows(entry(), entry(course='C002'))
+    response = admin_client.post('/api/admin/timetable/bulk', data=upload, content_type='text/csv')
+
+    assert response.status_code == 201
+    results = response.get_json()
+    assert results['successful'] == 1
+    assert results['errors'][0]['entry']['courseCode'] == 'C002'
+    assert len(import_repository.list_timetable()) == 1
+
+
+def test_empty_upload_is_rejected(admin_client):
+    response = admin_client.post('/api/admin/timetable/bulk', data=csv_rows(), content_type='text/csv')
+    assert response.status_code == 400
@@ -0,0 +1,80 @@
+import pytest
+
+import backend.services.user_search as user_search
+from backend.services.user_search import UserSearchIndex
+
+
+USERS = [
+    {'id': 'u1', 'role': 'Student', 'name': 'Aarav Sharma', 'email': 'aarav@college.edu', 'studentId': 'S1001'},
+    {'id': 'u2', 'role': 'Student', 'name': 'Ananya Rao', 'email': 'ananya@college.edu', 'studentId': 'S1002'},
+    {'id': 'u3', 'role': 'Teacher', 'name': 'Ira Sharma', 'email': 'ira@college.edu', 'teacherId': 'T01'},
+    {'id': 'u4', 'role': 'Student', 'name': 'Diya Menon', 'email': 'diya@college.edu', 'studentId': 'S2001'},
+]
+
+
+@pytest.fixture
+def index():
+    index = UserSearchIndex()
+    index.load([dict(user) for user in USERS])
+    return index
+
+
+def ids(results):
+    return [user['id'] for user in results]
+
+
+def test_prefix_matches_any_word_of_the_name(index):
+    assert sorted(ids(index.search('shar'))) == ['u1', 'u3']
+    assert ids(index.search('anan')) == ['u2']
+
+
+def test_substring_matches_inside_a_value(index):
+    # 'enon' starts no word, so only the trigram postings find it
+    assert ids(index.search('enon')) == ['u4']
+    assert sorted(ids(index.search('college'))) == ['u1', 'u2', 'u3', 'u4']
+
+
+def test_exact_key_ranks_before_prefix_matches(index):
+    index.upsert('u5', {'role': 'Student', 'name': 'S1001 Fan', 'email': 'fan@college.edu', 'studentId': 'S9'})
+    assert ids(index.search('s1001')) == ['u1', 'u5']
+
+
+def test_role_filter_and_limit(index):
+    assert ids(index.search('sharma', role='Teacher')) == ['u3']
+    assert len(index.search('college', limit=2)) == 2
+
+
+def test_find_exact_by_email_student_or_teacher_id(index):
+    assert index.find_exact(' ARAV@college.edu ') is None
+    assert index.find_exact(' AARAV@college.edu ')['id'] == 'u1'
+    assert index.find_exact('S2001')['id'] == 'u4'
+    assert index.find_exact('T01', role='Student') is None
+    assert index.find_exact('T01', role='Teacher')['id'] == 'u3'
+
+
+def test_rename_drops_the_old_tokens(index):
+    index.upsert('u1', {'name': 'Kabir Singh'})
+
+    assert ids(index.search('sharma')) == ['u3']
+    assert ids(index.search('kab')) == ['u1']
+    # Fields the update did not carry are kept
+    assert index.find_exact('S1001')['name'] == 'Kabir Singh'
+
+
+def test_delete_removes_every_posting(index):
+    index.remove('u3')
+
+    assert ids(index.search('ira')) == []
+    assert index.find_exact('T01') is None
+    assert len(index) == 3
+    assert 'ira sharma' not in index._sorted and 'ira' not in index._postings
+
+
+def test_repository_writes_reach_the_loaded_index(index, monkeypatch):
+    monkeypatch.setattr(user_search, '_index', index)
+
+    user_search._on_user_write('u2', {'name': 'Ananya Iyer'})
+    user_search._on_user_write('u4', None)
+
+    assert ids(index.search('iyer')) == ['u2']
+    assert ids(index.search('diya')) == []